@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -58,7 +59,9 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'movies.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
 }
 
 MIDDLEWARE = [
@@ -95,14 +98,73 @@ WSGI_APPLICATION = 'moviebackend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite pragmas run on every new connection. With the 'production' profile
+# (the default; DJANGO_SQLITE_PROFILE=default keeps SQLite's own settings):
+# WAL lets readers and a writer work at the same time, busy_timeout (ms) makes
+# a writer wait for the lock instead of failing with "database is locked",
+# NORMAL sync is durable enough in WAL mode (a power cut can lose the latest
+# commits, never corrupt), and mmap_size (bytes), cache_size (KiB when
+# negative) and temp_store keep hot pages and sort scratch space in memory.
+SQLITE_PROFILE = os.environ.get('DJANGO_SQLITE_PROFILE', 'production')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+} if SQLITE_PROFILE == 'production' else {}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Seconds a connection is reused across requests (0 closes it after each one)
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()),
+            # Transactions take the write lock when they begin, so two of them
+            # never deadlock upgrading read locks, which fails at once rather
+            # than waiting out busy_timeout
+            'transaction_mode': 'IMMEDIATE' if SQLITE_PROFILE == 'production' else None,
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory caches are per process; point these at a shared backend
+# (file, memcached, redis) when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Per-user recommendation results, least recently used entries are culled first
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recommendations',
+        'TIMEOUT': 15 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # Anonymous movie list/detail and genre responses (movies.catalog_cache).
+    # Catalog writes invalidate them; the timeout bounds how long list pages
+    # keep showing rating averages and trending order from before new activity.
+    # 'django.core.cache.backends.filebased.FileBasedCache' with a directory
+    # as LOCATION shares them between workers.
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'TIMEOUT': 60,
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -190,3 +252,61 @@ SIMPLE_JWT = {
 
 # TMDB API settings (you'll need to get an API key from TMDB)
 TMDB_API_KEY = ''  # Will be loaded from .env file
+# `seed_movies` ingestion: pages fetched in parallel, retries with exponential
+# backoff, movies written per bulk transaction. BASE_URL can point at a mirror
+# or a local stub server.
+TMDB_INGEST = {
+    'BASE_URL': 'https://api.themoviedb.org/3',
+    'WORKERS': 4,
+    'RETRIES': 3,
+    'BACKOFF': 0.5,
+    'TIMEOUT': 10,
+    'BATCH_SIZE': 500,
+}
+
+# Recommender settings
+# Prebuilt model artifacts (see `manage.py build_content_model`)
+RECOMMENDER_ARTIFACT_DIR = BASE_DIR / 'artifacts'
+# Similar movies kept per movie in the content neighbour index
+RECOMMENDER_CONTENT_NEIGHBORS = 50
+# Neighbours kept per movie for item-based collaborative filtering
+RECOMMENDER_ITEM_NEIGHBORS = 50
+# Most recent raters of a movie used when `build_item_neighbors --pending`
+# updates its neighbours after rating changes
+RECOMMENDER_ITEM_UPDATE_RATERS = 2000
+# Precomputed recommendations older than this are ignored
+RECOMMENDER_PRECOMPUTED_MAX_AGE = timedelta(hours=24)
+# Index used for content similarity: 'neighbors' (exact top-k) or 'ann' (IVF)
+RECOMMENDER_CONTENT_INDEX = 'neighbors'
+# IVF tuning: more probed lists raise recall, fewer make queries faster.
+# LISTS defaults to sqrt(number of movies); check with `manage.py ann_recall_report`
+RECOMMENDER_ANN = {
+    'LISTS': None,
+    'PROBES': 16,
+    'CENTROID_TERMS': 256,
+    'ITERATIONS': 8,
+    'SEED': 0,
+}
+
+# Title autocomplete (/api/movies/autocomplete/): the in-memory index picks up
+# changed movies at most every REFRESH_SECONDS; prefixes matching at least
+# CACHE_MIN_KEYS title keys keep their top results precomputed
+AUTOCOMPLETE = {
+    'REFRESH_SECONDS': 30,
+    'CACHE_MIN_KEYS': 1000,
+    'MAX_RESULTS': 20,
+    'MAX_KEY_WORDS': 4,
+}
+
+# Trending: events decay with this half-life; `manage.py update_trending`
+# refreshes stored scores and prunes movies below MIN_SCORE
+TRENDING = {
+    'HALF_LIFE_HOURS': 72,
+    'WEIGHTS': {'favorite': 3.0, 'watchlist': 2.0, 'rating': 1.0},
+    'MIN_SCORE': 0.01,
+}
+
+# Bulk rating/favorite/watchlist endpoints: items accepted per request
+BULK_WRITES = {
+    'MAX_ITEMS': 1000,
+}
@@ -0,0 +1,226 @@
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+# Rows assigned per block, bounds the dense (rows x lists) score slab
+ASSIGN_CHUNK_ROWS = 8192
+# Pending inserts are merged into the inverted lists past this size
+MERGE_THRESHOLD = 4096
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF) index for cosine similarity over the rows of a
+    sparse, L2-normalised matrix.
+
+    Rows are partitioned by spherical k-means into `n_lists` clusters. A query
+    scores the centroids, scans the rows of the `n_probe` closest clusters and
+    re-ranks those candidates exactly, so it touches roughly
+    n_probe / n_lists of the catalog instead of all of it.
+
+    Raising `n_probe` raises recall at the cost of latency. Centroids are
+    truncated to their `centroid_terms` heaviest terms and kept sparse, so the
+    index stays small for a large vocabulary.
+    """
+
+    def __init__(self, centroids, order, offsets, n_probe=8):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.n_probe = n_probe
+        self.vectors = None
+        self.pending_rows = np.empty(0, dtype=np.int64)
+        self.pending_lists = np.empty(0, dtype=np.int32)
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    def __len__(self):
+        return len(self.order) + len(self.pending_rows)
+
+    @staticmethod
+    def truncate(centroids, terms):
+        """Keep the `terms` largest weights of each centroid row, re-normalised"""
+        centroids = centroids.tocsr()
+        rows, cols, data = [], [], []
+        for i in range(centroids.shape[0]):
+            start, end = centroids.indptr[i], centroids.indptr[i + 1]
+            row_cols = centroids.indices[start:end]
+            row_data = centroids.data[start:end]
+            if len(row_data) > terms:
+                keep = np.argpartition(-row_data, terms - 1)[:terms]
+                row_cols, row_data = row_cols[keep], row_data[keep]
+            rows.append(np.full(len(row_cols), i, dtype=np.int32))
+            cols.append(row_cols)
+            data.append(row_data)
+        truncated = sp.csr_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+            shape=centroids.shape, dtype=np.float32,
+        )
+        return normalize(truncated)
+
+    def assign(self, vectors):
+        """Return the closest centroid of every row"""
+        lists = np.empty(vectors.shape[0], dtype=np.int32)
+        centroids_t = self.centroids.T.tocsc()
+        for start in range(0, vectors.shape[0], ASSIGN_CHUNK_ROWS):
+            end = min(start + ASSIGN_CHUNK_ROWS, vectors.shape[0])
+            scores = (vectors[start:end] @ centroids_t).toarray()
+            lists[start:end] = scores.argmax(axis=1)
+        return lists
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, n_probe=8, centroid_terms=256,
+              iterations=8, seed=0):
+        n_rows = vectors.shape[0]
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_rows))
+        n_lists = max(1, min(n_lists, n_rows))
+        rng = np.random.default_rng(seed)
+
+        # Train on a sample, ~40 rows per centroid is plenty for k-means
+        sample_size = min(n_rows, max(n_lists * 40, 1000))
+        sample = vectors[rng.choice(n_rows, size=sample_size, replace=False)]
+        seeds = rng.choice(sample_size, size=n_lists, replace=False)
+        index = cls(cls.truncate(sample[seeds], centroid_terms), None, None, n_probe)
+
+        for _ in range(iterations):
+            lists = index.assign(sample)
+            membership = sp.csr_matrix(
+                (np.ones(sample_size, dtype=np.float32), (lists, np.arange(sample_size))),
+                shape=(n_lists, sample_size),
+            )
+            centroids = (membership @ sample).tocsr()
+            # Re-seed clusters that lost all their members
+            empty = np.flatnonzero(np.diff(centroids.indptr) == 0)
+            if len(empty):
+                reseeded = sample[rng.choice(sample_size, size=len(empty), replace=False)]
+                centroids = sp.vstack([
+                    centroids[np.setdiff1d(np.arange(n_lists), empty)], reseeded,
+                ], format='csr')
+            index.centroids = cls.truncate(centroids, centroid_terms)
+
+        lists = index.assign(vectors)
+        index.order = np.argsort(lists, kind='stable').astype(np.int64)
+        index.offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=n_lists))])
+        index.vectors = vectors
+        return index
+
+    def add(self, vectors):
+        """
+        Append rows to the index. They are searchable immediately, and are
+        merged into the inverted lists once enough have accumulated.
+        """
+        start = len(self)
+        self.pending_lists = np.concatenate([self.pending_lists, self.assign(vectors)])
+        self.pending_rows = np.concatenate([self.pending_rows, np.arange(start, start + vectors.shape[0])])
+        self.vectors = sp.vstack([self.vectors, vectors], format='csr')
+        if len(self.pending_rows) >= MERGE_THRESHOLD:
+            self.merge()
+
+    def merge(self):
+        if not len(self.pending_rows):
+            return
+        lists = np.repeat(np.arange(self.n_lists, dtype=np.int32), np.diff(self.offsets))
+        lists = np.concatenate([lists, self.pending_lists])
+        rows = np.concatenate([self.order, self.pending_rows])
+        order = np.argsort(lists, kind='stable')
+        self.order = rows[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=self.n_lists))])
+        self.pending_rows = np.empty(0, dtype=np.int64)
+        self.pending_lists = np.empty(0, dtype=np.int32)
+
+    def probed_lists(self, vector, n_probe=None):
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        scores = (vector @ self.centroids.T).toarray().ravel()
+        return np.argpartition(-scores, n_probe - 1)[:n_probe]
+
+    def candidates(self, vector, n_probe=None):
+        """Rows of the inverted lists closest to `vector`"""
+        lists = self.probed_lists(vector, n_probe)
+        found = [self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists]
+        if len(self.pending_rows):
+            found.append(self.pending_rows[np.isin(self.pending_lists, lists)])
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def query(self, vector, k, exclude=(), n_probe=None):
+        """
+        Approximate top-k rows for a single (1 x n_features) query vector.
+
+        Returns (rows, scores), best first. May return fewer than k rows when
+        the probed lists are small.
+        """
+        candidates = self.candidates(vector, n_probe)
+        if len(exclude):
+            candidates = candidates[~np.isin(candidates, np.asarray(exclude, dtype=np.int64))]
+        if not len(candidates):
+            return candidates, np.empty(0, dtype=np.float32)
+        scores = (self.vectors[candidates] @ vector.T).toarray().ravel()
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return candidates[top], scores[top]
+
+    def to_artifact(self):
+        self.merge()
+        return {
+            'centroids': self.centroids,
+            'order': self.order,
+            'offsets': self.offsets,
+            'n_probe': self.n_probe,
+        }
+
+    @classmethod
+    def from_artifact(cls, data, vectors):
+        index = cls(data['centroids'], data['order'], data['offsets'], data['n_probe'])
+        index.vectors = vectors
+        return index
+
+
+def recall_report(index, vectors, k=10, sample_size=200, n_probe=None, seed=0):
+    """
+    Compare the index against exact brute-force search on sampled rows.
+
+    Returns a dict with the mean recall@k, the mean number of candidates
+    re-ranked per query and the mean per-query latency of both methods.
+    """
+    n_rows = vectors.shape[0]
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(n_rows, size=min(sample_size, n_rows), replace=False)
+    vectors_t = vectors.T.tocsc()
+    kk = max(1, min(k, n_rows - 1))
+
+    recalls = []
+    candidate_counts = []
+    exact_time = 0.0
+    ann_time = 0.0
+    for row in sample:
+        query = vectors[row]
+
+        started = time.perf_counter()
+        exact_scores = (query @ vectors_t).toarray().ravel()
+        exact_scores[row] = -np.inf
+        exact = np.argpartition(-exact_scores, kk - 1)[:kk]
+        exact_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        approx, _ = index.query(query, kk, exclude=[row], n_probe=n_probe)
+        ann_time += time.perf_counter() - started
+
+        candidate_counts.append(len(index.candidates(query, n_probe)))
+        recalls.append(len(np.intersect1d(exact, approx)) / kk)
+
+    queries = max(len(sample), 1)
+    mean_candidates = float(np.mean(candidate_counts)) if candidate_counts else 0.0
+    return {
+        'queries': len(sample),
+        'k': kk,
+        'recall': float(np.mean(recalls)) if recalls else 0.0,
+        'mean_candidates': mean_candidates,
+        'candidate_fraction': mean_candidates / max(n_rows, 1),
+        'exact_ms': 1000 * exact_time / queries,
+        'ann_ms': 1000 * ann_time / queries,
+    }
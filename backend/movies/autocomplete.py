@@ -0,0 +1,227 @@
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+
+from .models import Movie
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+# Sorts after every character, so [prefix, prefix + _HIGH) spans all keys starting with prefix
+_HIGH = chr(0x10FFFF)
+
+# Builds the index on first use, and lets one thread at a time refresh it
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_state = {'index': None}
+
+
+def autocomplete_options():
+    options = {
+        'REFRESH_SECONDS': 30,
+        'CACHE_MIN_KEYS': 1000,
+        'MAX_RESULTS': 20,
+        'MAX_KEY_WORDS': 4,
+    }
+    options.update(getattr(settings, 'AUTOCOMPLETE', {}))
+    return options
+
+
+def normalize(text):
+    """Casefolded words without accents or punctuation, joined by single spaces"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(_WORD_RE.findall(text.casefold()))
+
+
+def title_keys(title, max_words):
+    """
+    Keys a title can be found under: the whole title and the remainders
+    starting at each of its next words, so "dark kn" and "knig" both find
+    "The Dark Knight".
+    """
+    words = normalize(title).split()
+    return [' '.join(words[start:]) for start in range(min(len(words), max_words))]
+
+
+class TitleIndex:
+    """
+    Sorted in-memory index of movie title keys for prefix lookups.
+
+    `keys` is sorted with the owning movie ids in the parallel `key_ids`, so
+    the keys starting with a prefix are one `bisect` range. Prefixes whose
+    range holds at least `cache_min_keys` keys (short ones, or common first
+    words) would be slow to rank per keystroke, so their most popular
+    movies are ranked once and kept in `tops`.
+
+    Lookups never touch the database; `refresh()` pulls movies changed
+    since the last watermark and patches the index in place. Patching and
+    lookups (which fill `tops`) both hold the index's lock, so a lookup
+    never sees a half-patched index; the queries run before taking it.
+    """
+
+    def __init__(self, cache_min_keys, top_size, max_key_words):
+        self.cache_min_keys = cache_min_keys
+        self.top_size = top_size
+        self.max_key_words = max_key_words
+        self.keys = []
+        self.key_ids = []
+        self.movies = {}
+        self.tops = {}
+        self.watermark = None
+        self.checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, cache_min_keys=1000, top_size=20, max_key_words=4):
+        index = cls(cache_min_keys, top_size, max_key_words)
+        entries = []
+        rows = Movie.objects.order_by().values_list('id', 'title', 'poster_path', 'popularity', 'updated_at')
+        for movie_id, title, poster_path, popularity, updated_at in rows.iterator(chunk_size=10000):
+            index.movies[movie_id] = (title, poster_path, popularity)
+            entries.extend((key, movie_id) for key in title_keys(title, max_key_words))
+            if index.watermark is None or updated_at > index.watermark:
+                index.watermark = updated_at
+        entries.sort()
+        index.keys = [key for key, _ in entries]
+        index.key_ids = [movie_id for _, movie_id in entries]
+        return index
+
+    def _range(self, prefix):
+        return bisect.bisect_left(self.keys, prefix), bisect.bisect_left(self.keys, prefix + _HIGH)
+
+    def _rank_range(self, lo, hi, limit):
+        return heapq.nlargest(limit, set(self.key_ids[lo:hi]), key=self._rank)
+
+    def _rank(self, movie_id):
+        # Most popular first, ties broken by id for a stable order
+        return self.movies[movie_id][2], -movie_id
+
+    def lookup(self, query, limit):
+        """Up to `limit` (id, title, poster_path) for titles with a word starting with `query`"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        with self._lock:
+            lo, hi = self._range(prefix)
+            if hi - lo < self.cache_min_keys or limit > self.top_size:
+                movie_ids = self._rank_range(lo, hi, limit)
+            else:
+                movie_ids = self.tops.get(prefix)
+                if movie_ids is None:
+                    movie_ids = self.tops[prefix] = self._rank_range(lo, hi, self.top_size)
+                movie_ids = movie_ids[:limit]
+            return [(movie_id, *self.movies[movie_id][:2]) for movie_id in movie_ids]
+
+    def _remove(self, movie_id):
+        title = self.movies.pop(movie_id)[0]
+        keys = title_keys(title, self.max_key_words)
+        for key in keys:
+            lo, hi = bisect.bisect_left(self.keys, key), bisect.bisect_right(self.keys, key)
+            position = lo + self.key_ids[lo:hi].index(movie_id)
+            del self.keys[position]
+            del self.key_ids[position]
+        for prefix in self._cached_prefixes(keys):
+            top = self.tops.get(prefix)
+            if top is not None and movie_id in top:
+                top.remove(movie_id)
+                if len(top) < self.top_size:
+                    # More movies may share the prefix; rank them again on next use
+                    del self.tops[prefix]
+
+    def _add(self, movie_id, title, poster_path, popularity):
+        self.movies[movie_id] = (title, poster_path, popularity)
+        keys = title_keys(title, self.max_key_words)
+        for key in keys:
+            position = bisect.bisect_right(self.keys, key)
+            self.keys.insert(position, key)
+            self.key_ids.insert(position, movie_id)
+        for prefix in self._cached_prefixes(keys):
+            top = self.tops.get(prefix)
+            if top is None or movie_id in top:
+                continue
+            if len(top) < self.top_size or self._rank(movie_id) > self._rank(top[-1]):
+                top.append(movie_id)
+                top.sort(key=self._rank, reverse=True)
+                del top[self.top_size:]
+
+    def _cached_prefixes(self, keys):
+        return {
+            key[:length]
+            for key in keys
+            for length in range(1, len(key) + 1)
+            if key[:length] in self.tops
+        }
+
+    def refresh(self):
+        """
+        Apply movies added or changed since the last refresh. Returns the
+        number of movies patched.
+        """
+        changed = Movie.objects.order_by().values_list('id', 'title', 'poster_path', 'popularity', 'updated_at')
+        if self.watermark is not None:
+            # >= rather than > so rows committed late with the same timestamp are not missed
+            changed = changed.filter(updated_at__gte=self.watermark)
+        changed = list(changed)
+        # Deletions leave no updated_at behind, a count below what the index
+        # will hold reveals them
+        added = sum(1 for row in changed if row[0] not in self.movies)
+        existing = None
+        if Movie.objects.count() < len(self.movies) + added:
+            existing = set(Movie.objects.values_list('id', flat=True))
+
+        patched = 0
+        with self._lock:
+            for movie_id, title, poster_path, popularity, updated_at in changed:
+                if self.watermark is None or updated_at > self.watermark:
+                    self.watermark = updated_at
+                if self.movies.get(movie_id) == (title, poster_path, popularity):
+                    continue
+                if movie_id in self.movies:
+                    self._remove(movie_id)
+                self._add(movie_id, title, poster_path, popularity)
+                patched += 1
+            if existing is not None:
+                for movie_id in set(self.movies) - existing:
+                    self._remove(movie_id)
+                    patched += 1
+        self.checked_at = time.monotonic()
+        return patched
+
+
+def get_title_index():
+    """
+    Return the process-wide title index, building it on first use and
+    refreshing it at most every `AUTOCOMPLETE['REFRESH_SECONDS']`. A due
+    refresh runs in whichever thread gets to it first; the others go on
+    looking up the index as it is rather than waiting for its queries.
+    """
+    options = autocomplete_options()
+    index = _state['index']
+    if index is None:
+        with _lock:
+            index = _state['index']
+            if index is None:
+                index = _state['index'] = TitleIndex.build(
+                    cache_min_keys=options['CACHE_MIN_KEYS'],
+                    top_size=options['MAX_RESULTS'],
+                    max_key_words=options['MAX_KEY_WORDS'],
+                )
+        return index
+    if time.monotonic() - index.checked_at >= options['REFRESH_SECONDS'] and _refresh_lock.acquire(blocking=False):
+        try:
+            index.refresh()
+        finally:
+            _refresh_lock.release()
+    return index
+
+
+def autocomplete(query, limit=10):
+    limit = max(1, min(limit, autocomplete_options()['MAX_RESULTS']))
+    return [
+        {'id': movie_id, 'title': title, 'poster_path': poster_path}
+        for movie_id, title, poster_path in get_title_index().lookup(query, limit)
+    ]
@@ -0,0 +1,180 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from .caching import bump_user_state_version
+from .catalog_cache import invalidate_catalog, movie_scope
+from .item_similarity import queue_neighbor_updates
+from .models import Movie, Rating, UserRecommendation
+from .rating_aggregates import refresh_rating_aggregates
+from .serializers import BulkRatingItemSerializer
+from .trending import EVENT_KINDS, event_weight, record_event
+
+WRITE_BATCH_SIZE = 500
+
+
+def bulk_options():
+    options = {
+        'MAX_ITEMS': 1000,
+    }
+    options.update(getattr(settings, 'BULK_WRITES', {}))
+    return options
+
+
+def _result(movie_id, status, **extra):
+    return {'movie_id': movie_id, 'status': status, **extra}
+
+
+def summarize(results):
+    """Number of items per status"""
+    return dict(Counter(result['status'] for result in results))
+
+
+def _existing_movie_ids(movie_ids):
+    return set(Movie.objects.filter(pk__in=list(movie_ids)).values_list('pk', flat=True))
+
+
+def _user_inputs_changed(user_id):
+    """What the per-row signals do for a user whose inputs changed, which bulk_create bypasses"""
+    bump_user_state_version(user_id)
+    UserRecommendation.objects.filter(user_id=user_id).delete()
+
+
+def bulk_rate(user, items):
+    """
+    Create or update the user's ratings from `items`, dicts with
+    `movie_id`, `rating` and an optional `comment` (an omitted comment
+    keeps the stored one).
+
+    Movies are checked and current ratings read with one query each, and
+    every new or changed rating is written by one upserting bulk_create
+    in a single transaction together with the movies' stored aggregates.
+    Returns one result per item, in order, with a status of created,
+    updated, unchanged, invalid, not_found or duplicate.
+    """
+    results = [None] * len(items)
+    valid = {}
+    for position, item in enumerate(items):
+        serializer = BulkRatingItemSerializer(data=item)
+        movie_id = item.get('movie_id') if isinstance(item, dict) else None
+        if not serializer.is_valid():
+            results[position] = _result(movie_id, 'invalid', errors=serializer.errors)
+        elif serializer.validated_data['movie_id'] in valid:
+            results[position] = _result(movie_id, 'duplicate')
+        else:
+            valid[serializer.validated_data['movie_id']] = (position, serializer.validated_data)
+
+    known = _existing_movie_ids(valid)
+    stored = {
+        movie_id: (rating, comment)
+        for movie_id, rating, comment in Rating.objects.filter(user=user, movie_id__in=list(known))
+        .values_list('movie_id', 'rating', 'comment')
+    }
+
+    writes = []
+    created = []
+    for movie_id, (position, data) in valid.items():
+        if movie_id not in known:
+            results[position] = _result(movie_id, 'not_found')
+            continue
+        old = stored.get(movie_id)
+        comment = data['comment'] if 'comment' in data else (old[1] if old else None)
+        if old == (data['rating'], comment):
+            results[position] = _result(movie_id, 'unchanged')
+            continue
+        writes.append(Rating(user=user, movie_id=movie_id, rating=data['rating'], comment=comment))
+        results[position] = _result(movie_id, 'updated' if old else 'created')
+        if not old:
+            created.append(movie_id)
+
+    if not writes:
+        return results
+
+    touched = [rating.movie_id for rating in writes]
+    with transaction.atomic():
+        Rating.objects.bulk_create(
+            writes,
+            update_conflicts=True,
+            unique_fields=['user', 'movie'],
+            update_fields=['rating', 'comment', 'updated_at'],
+            batch_size=WRITE_BATCH_SIZE,
+        )
+        refresh_rating_aggregates(touched)
+
+    weight = event_weight('rating')
+    for movie_id in created:
+        record_event(movie_id, weight)
+    invalidate_catalog(*(movie_scope(movie_id) for movie_id in touched))
+    _user_inputs_changed(user.id)
+    queue_neighbor_updates(touched)
+    return results
+
+
+def _movie_id(value):
+    try:
+        return serializers.IntegerField().run_validation(value)
+    except serializers.ValidationError:
+        return None
+
+
+def bulk_collect(user, model, add=(), remove=()):
+    """
+    Add the movies in `add` to, and remove those in `remove` from, the
+    user's favorites or watchlist (`model`).
+
+    Movies are checked and current entries read with one query each; new
+    entries are written by one bulk_create that skips rows a concurrent
+    request already added, and removals by one queryset delete, in one
+    transaction. Deletes still send post_delete, so the signals handle
+    the removed rows themselves.
+    Returns one result per id, `add` first, with a status of created,
+    exists, removed, absent, invalid, not_found or duplicate.
+    """
+    kind = EVENT_KINDS[model]
+    requests = [(value, 'add') for value in add] + [(value, 'remove') for value in remove]
+    movie_ids = [_movie_id(value) for value, _ in requests]
+
+    known = _existing_movie_ids(movie_id for movie_id in movie_ids if movie_id is not None)
+    stored = set(model.objects.filter(user=user, movie_id__in=list(known)).values_list('movie_id', flat=True))
+
+    results = []
+    seen = set()
+    additions = []
+    removals = []
+    for (value, operation), movie_id in zip(requests, movie_ids):
+        if movie_id is None:
+            results.append(_result(value, 'invalid'))
+        elif movie_id in seen:
+            results.append(_result(movie_id, 'duplicate'))
+        elif movie_id not in known:
+            results.append(_result(movie_id, 'not_found'))
+        elif operation == 'add':
+            results.append(_result(movie_id, 'exists' if movie_id in stored else 'created'))
+            if movie_id not in stored:
+                additions.append(movie_id)
+        else:
+            results.append(_result(movie_id, 'removed' if movie_id in stored else 'absent'))
+            if movie_id in stored:
+                removals.append(movie_id)
+        if movie_id is not None:
+            seen.add(movie_id)
+
+    if not additions and not removals:
+        return results
+
+    with transaction.atomic():
+        model.objects.bulk_create(
+            [model(user=user, movie_id=movie_id) for movie_id in additions],
+            ignore_conflicts=True,
+            batch_size=WRITE_BATCH_SIZE,
+        )
+        model.objects.filter(user=user, movie_id__in=removals).delete()
+
+    if additions:
+        weight = event_weight(kind)
+        for movie_id in additions:
+            record_event(movie_id, weight)
+        _user_inputs_changed(user.id)
+    return results
@@ -0,0 +1,74 @@
+import threading
+import time
+
+from django.core.cache import caches
+
+RECOMMENDATION_CACHE = 'recommendations'
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def record(cache_name, hit):
+    with _stats_lock:
+        counters = _stats.setdefault(cache_name, {'hits': 0, 'misses': 0})
+        counters['hits' if hit else 'misses'] += 1
+
+
+def cache_stats():
+    """Hit/miss counters of this process, per cache"""
+    with _stats_lock:
+        report = {}
+        for name, counters in _stats.items():
+            lookups = counters['hits'] + counters['misses']
+            report[name] = dict(counters, hit_rate=counters['hits'] / lookups if lookups else 0.0)
+        return report
+
+
+def _user_state_key(user_id):
+    return f"user-state:{user_id}"
+
+
+def user_state_version(user_id):
+    """
+    Opaque token that changes whenever the user's ratings, favorites or
+    watchlist change (see movies.signals).
+
+    A version that was evicted is recreated from the clock rather than
+    restarting at a fixed value, so it can never collide with one that is
+    still part of a cached key.
+    """
+    cache = caches['default']
+    version = cache.get(_user_state_key(user_id))
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(_user_state_key(user_id), version, timeout=None):
+            version = cache.get(_user_state_key(user_id), version)
+    return version
+
+
+def bump_user_state_version(user_id):
+    caches['default'].set(_user_state_key(user_id), time.time_ns(), timeout=None)
+
+
+def cached_recommendations(user_id, recommendation_type, movie_id, top_n, model_version, compute):
+    """
+    Return recommended movie ids from the recommendation cache, or call
+    `compute()` (which must return movie ids) and cache its result.
+
+    Entries are keyed by user, type, movie, size, model version and the
+    user's state version, so any rating/favorite/watchlist change or model
+    rebuild makes old entries unreachable; the backend's TTL and LRU culling
+    then drop them.
+    """
+    cache = caches[RECOMMENDATION_CACHE]
+    key = (
+        f"recs:{user_id}:{user_state_version(user_id)}:{recommendation_type}:"
+        f"{movie_id or ''}:{top_n}:{model_version}"
+    )
+    movie_ids = cache.get(key)
+    record(RECOMMENDATION_CACHE, movie_ids is not None)
+    if movie_ids is None:
+        movie_ids = list(compute())
+        cache.set(key, movie_ids)
+    return movie_ids
@@ -0,0 +1,114 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from .caching import record
+from .conditional import not_modified, with_validators
+
+CATALOG_CACHE = 'catalog'
+
+# Query parameters the anonymous catalog responses depend on; anything else
+# is left out of the cache key so it cannot split entries
+CATALOG_PARAMS = (
+    'genre', 'year', 'search', 'trending', 'ordering', 'page_size', 'cursor',
+    'fields', 'omit', 'compact', 'format',
+)
+
+# Invalidation scopes: every cached response depends on ALL_SCOPE plus its own
+ALL_SCOPE = 'all'
+MOVIES_SCOPE = 'movies'
+GENRES_SCOPE = 'genres'
+
+
+def movie_scope(movie_id):
+    """Scope of one movie's detail response"""
+    try:
+        return f"movie:{int(movie_id)}"
+    except (TypeError, ValueError):
+        return f"movie:{movie_id}"
+
+
+def _scope_key(scope):
+    return f"catalog-scope:{scope}"
+
+
+def scope_versions(scopes):
+    """
+    Current versions of `scopes` and of ALL_SCOPE. Like user state versions
+    (see movies.caching), missing ones are recreated from the clock so they
+    never repeat a version an old entry was stored under.
+    """
+    cache = caches['default']
+    keys = [_scope_key(scope) for scope in (ALL_SCOPE, *scopes)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = time.time_ns()
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def invalidate_catalog(*scopes):
+    """Make cached responses of `scopes` unreachable; with no scopes, all of them"""
+    version = time.time_ns()
+    caches['default'].set_many({_scope_key(scope): version for scope in scopes or (ALL_SCOPE,)}, timeout=None)
+
+
+def _normalized_query(request):
+    params = []
+    for name in CATALOG_PARAMS:
+        value = ' '.join(request.query_params.get(name, '').split())
+        if value:
+            # Cursors are case sensitive tokens, the filters are not
+            params.append((name, value if name == 'cursor' else value.casefold()))
+    return urlencode(params)
+
+
+def _response_key(request, scopes):
+    # Pagination links are absolute, so the host is part of the response
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((
+        request.get_host(), request.path, _normalized_query(request), scope_versions(scopes),
+    )).encode())
+    return f"catalog:{digest.hexdigest()}"
+
+
+def cached_catalog_response(request, scopes, build):
+    """
+    Serve an anonymous read from the catalog cache, or call `build()` and
+    cache its response data and validators when it succeeds.
+
+    Anonymous responses are the same for every client, so one cached copy
+    serves them all; authenticated ones embed per-user state and always go
+    to `build()`. Entries are keyed on the host, path, normalized
+    CATALOG_PARAMS and the versions of `scopes`, so `invalidate_catalog()`
+    drops them without scanning the cache, and the backend's TIMEOUT and
+    MAX_ENTRIES bound their age and number.
+    """
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return build()
+
+    cache = caches[CATALOG_CACHE]
+    # Versions are read before building, so a write racing with the build
+    # leaves the result under versions that are already stale
+    key = _response_key(request, scopes)
+    entry = cache.get(key)
+    record(CATALOG_CACHE, entry is not None)
+    if entry is None:
+        response = build()
+        if response.status_code == 200:
+            cache.set(key, (response.data, response.get('ETag'), response.get('Last-Modified')))
+        return response
+
+    data, etag, last_modified = entry
+    last_modified = parse_http_date_safe(last_modified) if last_modified else None
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    return with_validators(Response(data), etag, last_modified)
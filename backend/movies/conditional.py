@@ -0,0 +1,44 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .caching import user_state_version
+
+
+def response_validators(request, timestamps=(), *parts):
+    """
+    Return (etag, last_modified) for a response built from rows last
+    changed at `timestamps` plus anything else in `parts` (ids, counts,
+    links) that the representation depends on.
+
+    Authenticated responses embed the user's favorite/watchlist/rating
+    state, so their validators also cover the user's state version.
+    `last_modified` is a Unix timestamp, or None when there are no
+    timestamps.
+    """
+    user = request.user
+    version = user_state_version(user.id) if user.is_authenticated else None
+    times = [moment.timestamp() for moment in timestamps if moment is not None]
+    if version is not None:
+        # Versions are set from the clock when they change (see movies.caching)
+        times.append(version / 1e9)
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((user.id, version, times, parts)).encode())
+    return quote_etag(digest.hexdigest()), (int(max(times)) if times else None)
+
+
+def not_modified(request, etag, last_modified=None):
+    """The 304 response when the request's validators still match, else None"""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def with_validators(response, etag, last_modified=None):
+    """Attach validators, and make clients revalidate instead of reusing stale copies"""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
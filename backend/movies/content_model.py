@@ -0,0 +1,274 @@
+import os
+import pickle
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+from django.conf import settings
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from .ann import IVFIndex
+from .models import Movie
+from .neighbors import NeighborIndex
+
+# Bump whenever the pickled layout changes so stale artifacts get rebuilt
+ARTIFACT_FORMAT = 3
+ARTIFACT_NAME = 'content_model.pkl'
+
+# Reentrant, as get_content_model builds through rebuild_content_model while holding it
+_lock = threading.RLock()
+_loaded = {'model': None, 'mtime': None}
+
+
+def artifact_dir():
+    return getattr(settings, 'RECOMMENDER_ARTIFACT_DIR', settings.BASE_DIR / 'artifacts')
+
+
+def default_neighbor_count():
+    return getattr(settings, 'RECOMMENDER_CONTENT_NEIGHBORS', 50)
+
+
+def ann_options():
+    options = {'LISTS': None, 'PROBES': 16, 'CENTROID_TERMS': 256, 'ITERATIONS': 8, 'SEED': 0}
+    options.update(getattr(settings, 'RECOMMENDER_ANN', {}))
+    return options
+
+
+def artifact_path():
+    return os.path.join(artifact_dir(), ARTIFACT_NAME)
+
+
+class ContentModel:
+    """
+    Fitted TF-IDF vectorizer, the L2-normalised movie matrix it produced and
+    the mapping between matrix rows and Movie ids, plus the precomputed
+    top-k neighbour index and the approximate (IVF) index over that matrix.
+
+    `movie_ids` is sorted ascending, so row lookups are a binary search rather
+    than a dict over the whole catalog.
+    """
+
+    def __init__(self, vectorizer, matrix, movie_ids, neighbors, ann, version, built_at):
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.movie_ids = movie_ids
+        self.neighbors = neighbors
+        self.ann = ann
+        self.version = version
+        self.built_at = built_at
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def row_of(self, movie_id):
+        """Return the matrix row of `movie_id`, or None if it was not in the build"""
+        idx = int(np.searchsorted(self.movie_ids, movie_id))
+        if idx < len(self.movie_ids) and self.movie_ids[idx] == movie_id:
+            return idx
+        return None
+
+    def rows_of(self, movie_ids):
+        """Vectorised `row_of` that silently drops unknown ids"""
+        ids = np.asarray(list(movie_ids), dtype=np.int64)
+        if not len(ids) or not len(self.movie_ids):
+            return np.empty(0, dtype=np.int64)
+        idx = np.searchsorted(self.movie_ids, ids)
+        idx = np.clip(idx, 0, len(self.movie_ids) - 1)
+        return np.unique(idx[self.movie_ids[idx] == ids])
+
+    def add_movies(self, movie_ids, documents):
+        """
+        Insert movies that were created after the model was built.
+
+        The documents are vectorised with the already-fitted vocabulary and
+        IDF weights, inserted into the IVF index, and given neighbour lists by
+        querying it. Existing neighbour lists are left as they are until the
+        next full rebuild. Ids must be larger than every id already present.
+        """
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        if not len(movie_ids):
+            return
+        if len(self.movie_ids) and movie_ids.min() <= self.movie_ids[-1]:
+            raise ValueError('Incremental inserts must have ids above the current maximum')
+
+        start = len(self.movie_ids)
+        vectors = self.vectorizer.transform(documents).astype(np.float32).tocsr()
+        self.ann.add(vectors)
+        self.matrix = self.ann.vectors
+        self.movie_ids = np.concatenate([self.movie_ids, movie_ids])
+
+        k = self.neighbors.k
+        neighbors = np.full((len(movie_ids), k), -1, dtype=np.int32)
+        scores = np.zeros((len(movie_ids), k), dtype=np.float32)
+        for offset in range(len(movie_ids)):
+            row = start + offset
+            rows, row_scores = self.ann.query(self.matrix[row], k, exclude=[row])
+            neighbors[offset, :len(rows)] = rows
+            scores[offset, :len(rows)] = row_scores
+        self.neighbors = NeighborIndex(
+            np.vstack([self.neighbors.neighbors, neighbors]),
+            np.vstack([self.neighbors.scores, scores]),
+        )
+
+    def to_artifact(self):
+        return {
+            'format': ARTIFACT_FORMAT,
+            'version': self.version,
+            'built_at': self.built_at,
+            'vectorizer': self.vectorizer,
+            'matrix': self.matrix,
+            'movie_ids': self.movie_ids,
+            'neighbors': self.neighbors.neighbors,
+            'neighbor_scores': self.neighbors.scores,
+            'ann': self.ann.to_artifact(),
+        }
+
+    @classmethod
+    def from_artifact(cls, data):
+        neighbors = NeighborIndex(data['neighbors'], data['neighbor_scores'])
+        ann = IVFIndex.from_artifact(data['ann'], data['matrix'])
+        return cls(
+            data['vectorizer'], data['matrix'], data['movie_ids'], neighbors, ann,
+            data['version'], data['built_at'],
+        )
+
+
+def movie_corpus(after_id=None):
+    """
+    Return (movie_ids, documents) for the catalog ordered by id, optionally
+    only the movies with an id above `after_id`.
+
+    Genre names come from a single query over the M2M through table instead
+    of one `movie.genres.all()` per movie.
+    """
+    movies = Movie.objects.all()
+    through = Movie.genres.through.objects.all()
+    if after_id is not None:
+        movies = movies.filter(id__gt=after_id)
+        through = through.filter(movie_id__gt=after_id)
+
+    genre_names = {}
+    through = through.values_list('movie_id', 'genre__name')
+    for movie_id, name in through.iterator(chunk_size=5000):
+        genre_names.setdefault(movie_id, []).append(name)
+
+    movie_ids = []
+    corpus = []
+    rows = movies.order_by('id').values_list('id', 'title', 'overview')
+    for movie_id, title, overview in rows.iterator(chunk_size=5000):
+        movie_ids.append(movie_id)
+        genres = " ".join(genre_names.get(movie_id, []))
+        corpus.append(f"{title} {overview} {genres}".lower())
+    return np.asarray(movie_ids, dtype=np.int64), corpus
+
+
+def build_content_model(neighbor_count=None):
+    """Fit the vectorizer over the current catalog. Returns None if there is nothing to compare"""
+    if neighbor_count is None:
+        neighbor_count = default_neighbor_count()
+    movie_ids, corpus = movie_corpus()
+    if len(movie_ids) < 2:
+        return None
+
+    vectorizer = TfidfVectorizer(stop_words='english', dtype=np.float32)
+    matrix = vectorizer.fit_transform(corpus).tocsr()
+    neighbors = NeighborIndex.build(matrix, neighbor_count)
+    options = ann_options()
+    ann = IVFIndex.build(
+        matrix, n_lists=options['LISTS'], n_probe=options['PROBES'],
+        centroid_terms=options['CENTROID_TERMS'], iterations=options['ITERATIONS'],
+        seed=options['SEED'],
+    )
+
+    built_at = datetime.now(timezone.utc)
+    version = f"{built_at:%Y%m%d%H%M%S}-{len(movie_ids)}"
+    return ContentModel(vectorizer, matrix, movie_ids, neighbors, ann, version, built_at)
+
+
+def save_content_model(model, path=None):
+    """Write the artifact atomically so readers never see a half-written file"""
+    path = path or artifact_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as fh:
+        pickle.dump(model.to_artifact(), fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_content_model(path=None):
+    path = path or artifact_path()
+    with open(path, 'rb') as fh:
+        data = pickle.load(fh)
+    if data.get('format') != ARTIFACT_FORMAT:
+        return None
+    return ContentModel.from_artifact(data)
+
+
+def rebuild_content_model(neighbor_count=None):
+    """Build, persist and install a fresh model in this process"""
+    model = build_content_model(neighbor_count)
+    if model is None:
+        return None
+    path = save_content_model(model)
+    with _lock:
+        _loaded['model'] = model
+        _loaded['mtime'] = os.path.getmtime(path)
+    return model
+
+
+def update_content_model():
+    """
+    Insert movies created since the last build into the saved model.
+
+    Falls back to a full rebuild when there is no usable artifact. Returns
+    (model, number_of_movies_added).
+    """
+    path = artifact_path()
+    model = load_content_model(path) if os.path.exists(path) else None
+    if model is None:
+        model = rebuild_content_model()
+        return model, len(model) if model is not None else 0
+
+    last_id = int(model.movie_ids[-1]) if len(model.movie_ids) else None
+    movie_ids, corpus = movie_corpus(after_id=last_id)
+    if not len(movie_ids):
+        return model, 0
+
+    model.add_movies(movie_ids, corpus)
+    model.version = f"{model.version.split('+')[0]}+{len(model)}"
+    save_content_model(model, path)
+    with _lock:
+        _loaded['model'] = model
+        _loaded['mtime'] = os.path.getmtime(path)
+    return model, len(movie_ids)
+
+
+def get_content_model():
+    """
+    Return the process-wide content model, loading it lazily.
+
+    The artifact's mtime is checked on every call so that a rebuild by the
+    management command is picked up without restarting the server. When no
+    usable artifact exists one is built on demand, under the lock, so
+    concurrent first requests wait for a single build and then find it
+    installed instead of each building their own.
+    """
+    path = artifact_path()
+    with _lock:
+        # Checked after acquiring the lock, which another thread may have
+        # held to build and save the model
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if _loaded['model'] is not None and _loaded['mtime'] == mtime:
+            return _loaded['model']
+
+        model = load_content_model(path) if mtime is not None else None
+        if model is not None:
+            _loaded['model'] = model
+            _loaded['mtime'] = mtime
+            return model
+
+        return rebuild_content_model()
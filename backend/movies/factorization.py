@@ -0,0 +1,176 @@
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .content_model import artifact_dir
+from .rating_matrix import RatingMatrix
+
+ARTIFACT_NAME = 'mf_model.npz'
+
+_lock = threading.Lock()
+_loaded = {'model': None, 'mtime': None}
+
+
+def artifact_path():
+    return os.path.join(artifact_dir(), ARTIFACT_NAME)
+
+
+class FactorModel:
+    """
+    Low-rank factorisation of the rating matrix: a rating is predicted as
+    global_mean + user_factors[u] . item_factors[i].
+
+    `user_ids` and `movie_ids` are sorted ascending and map factor rows back
+    to primary keys.
+    """
+
+    def __init__(self, user_factors, item_factors, user_ids, movie_ids, global_mean, version):
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.global_mean = global_mean
+        self.version = version
+
+    @property
+    def n_factors(self):
+        return self.item_factors.shape[1]
+
+    def user_row(self, user_id):
+        idx = int(np.searchsorted(self.user_ids, user_id))
+        if idx < len(self.user_ids) and self.user_ids[idx] == user_id:
+            return idx
+        return None
+
+    def columns_of(self, movie_ids):
+        """Factor rows of `movie_ids`, silently dropping movies unseen in training"""
+        ids = np.asarray(list(movie_ids), dtype=np.int64)
+        if not len(ids) or not len(self.movie_ids):
+            return np.empty(0, dtype=np.int64)
+        idx = np.clip(np.searchsorted(self.movie_ids, ids), 0, len(self.movie_ids) - 1)
+        return idx[self.movie_ids[idx] == ids]
+
+    def recommend(self, user_row, top_n, exclude=()):
+        """
+        Score every movie for one user with a single vector-matrix product.
+        Returns (movie_columns, predicted_ratings), best first.
+        """
+        scores = self.item_factors @ self.user_factors[user_row] + self.global_mean
+        if len(exclude):
+            scores[np.asarray(exclude, dtype=np.int64)] = -np.inf
+        top_n = min(top_n, len(scores) - len(exclude))
+        if top_n <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, top_n - 1)[:top_n]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return top, scores[top]
+
+    def save(self, path=None):
+        path = path or artifact_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # np.savez appends .npz to names without it, so keep the suffix on the temp file
+        tmp_path = f"{path[:-len('.npz')]}.tmp.npz"
+        np.savez(
+            tmp_path,
+            user_factors=self.user_factors,
+            item_factors=self.item_factors,
+            user_ids=self.user_ids,
+            movie_ids=self.movie_ids,
+            global_mean=np.float32(self.global_mean),
+            version=np.array(self.version),
+        )
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        with np.load(path or artifact_path()) as data:
+            return cls(
+                data['user_factors'], data['item_factors'], data['user_ids'],
+                data['movie_ids'], float(data['global_mean']), str(data['version']),
+            )
+
+
+def _solve_side(matrix, fixed, regularization):
+    """
+    One ALS half-step: for every row of `matrix` (CSR, values already
+    centred) solve the ridge regression of its ratings onto `fixed`.
+    """
+    n_factors = fixed.shape[1]
+    solved = np.zeros((matrix.shape[0], n_factors), dtype=np.float32)
+    eye = regularization * np.eye(n_factors, dtype=np.float64)
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == end:
+            continue
+        factors = fixed[matrix.indices[start:end]].astype(np.float64)
+        # Scale the penalty with the number of ratings (weighted-lambda ALS)
+        gram = factors.T @ factors + eye * (end - start)
+        solved[row] = np.linalg.solve(gram, factors.T @ matrix.data[start:end])
+    return solved
+
+
+def train_als(ratings, n_factors=32, iterations=10, regularization=0.1, seed=0, callback=None):
+    """
+    Fit a FactorModel to a RatingMatrix with alternating least squares.
+
+    `callback(iteration, rmse)` is called after every sweep with the training
+    RMSE, which is handy for progress output.
+    """
+    rng = np.random.default_rng(seed)
+    global_mean = float(ratings.matrix.data.mean()) if ratings.nnz else 0.0
+
+    by_user = ratings.matrix.copy().astype(np.float32)
+    by_user.data -= global_mean
+    by_item = by_user.T.tocsr()
+
+    n_users, n_movies = by_user.shape
+    user_factors = (rng.standard_normal((n_users, n_factors)) * 0.1).astype(np.float32)
+    item_factors = (rng.standard_normal((n_movies, n_factors)) * 0.1).astype(np.float32)
+
+    rows = np.repeat(np.arange(n_users), np.diff(by_user.indptr))
+    for iteration in range(1, iterations + 1):
+        user_factors = _solve_side(by_user, item_factors, regularization)
+        item_factors = _solve_side(by_item, user_factors, regularization)
+        if callback is not None:
+            predicted = np.einsum('ij,ij->i', user_factors[rows], item_factors[by_user.indices])
+            rmse = float(np.sqrt(np.mean((predicted - by_user.data) ** 2))) if ratings.nnz else 0.0
+            callback(iteration, rmse)
+
+    version = f"{datetime.now(timezone.utc):%Y%m%d%H%M%S}-{n_users}x{n_movies}x{n_factors}"
+    return FactorModel(
+        user_factors, item_factors, ratings.user_ids, ratings.movie_ids, global_mean, version,
+    )
+
+
+def train_factor_model(**kwargs):
+    """Train on the current ratings, persist and install the model in this process"""
+    ratings = RatingMatrix.load()
+    if not ratings.nnz:
+        return None
+    model = train_als(ratings, **kwargs)
+    path = model.save()
+    with _lock:
+        _loaded['model'] = model
+        _loaded['mtime'] = os.path.getmtime(path)
+    return model
+
+
+def get_factor_model():
+    """
+    Return the process-wide factor model, reloading it when the artifact
+    changes. Returns None until `manage.py train_recommender` has run.
+    """
+    path = artifact_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _lock:
+        if _loaded['model'] is None or _loaded['mtime'] != mtime:
+            _loaded['model'] = FactorModel.load(path)
+            _loaded['mtime'] = mtime
+        return _loaded['model']
@@ -0,0 +1,389 @@
+import csv
+import datetime
+import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .models import Genre, Movie
+
+TMDB_IMAGE_URL = 'https://image.tmdb.org/t/p'
+
+# Movie columns an import overwrites when the tmdb_id is already stored
+UPSERT_FIELDS = (
+    'title', 'overview', 'release_date', 'poster_path', 'backdrop_path',
+    'popularity', 'vote_average', 'vote_count', 'updated_at',
+)
+
+# TMDB genre ids -> our genre names
+TMDB_GENRES = {
+    28: "Action", 12: "Adventure", 16: "Animation", 35: "Comedy",
+    80: "Crime", 99: "Documentary", 18: "Drama", 10751: "Family",
+    14: "Fantasy", 36: "History", 27: "Horror", 10402: "Music",
+    9648: "Mystery", 10749: "Romance", 878: "Science Fiction",
+    53: "Thriller", 10752: "War", 37: "Western"
+}
+
+
+def ingest_options():
+    options = {
+        'BASE_URL': 'https://api.themoviedb.org/3',
+        'WORKERS': 4,
+        'RETRIES': 3,
+        'BACKOFF': 0.5,
+        'TIMEOUT': 10,
+        'BATCH_SIZE': 500,
+    }
+    options.update(getattr(settings, 'TMDB_INGEST', {}))
+    return options
+
+
+def tmdb_session(retries=3, backoff=0.5, pool_size=4):
+    """
+    A pooled session that retries failed connections, rate limiting (429,
+    honouring Retry-After) and 5xx responses with exponential backoff.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def is_excluded(record):
+    """Records seed_movies has always left out"""
+    return 'sex' in (record.get('title') or '').lower() or 'sex' in (record.get('overview') or '').lower()
+
+
+def tmdb_movie(record):
+    """
+    An unsaved Movie and its genre names from a TMDB list result. Raises
+    KeyError, ValueError or TypeError for a malformed record.
+    """
+    if not record['title']:
+        raise ValueError('empty title')
+    movie = Movie(
+        title=record['title'],
+        overview=record.get('overview') or '',
+        release_date=(
+            datetime.datetime.strptime(record['release_date'], '%Y-%m-%d').date()
+            if record.get('release_date') else datetime.date.today()
+        ),
+        poster_path=f"{TMDB_IMAGE_URL}/w500{record['poster_path']}" if record.get('poster_path') else None,
+        backdrop_path=f"{TMDB_IMAGE_URL}/original{record['backdrop_path']}" if record.get('backdrop_path') else None,
+        tmdb_id=int(record['id']),
+        # Converted here, so a bad value fails this record rather than its whole batch
+        popularity=float(record.get('popularity') or 0),
+        vote_average=float(record.get('vote_average') or 0),
+        vote_count=int(record.get('vote_count') or 0),
+    )
+    return movie, [TMDB_GENRES[genre_id] for genre_id in record.get('genre_ids', []) if genre_id in TMDB_GENRES]
+
+
+class MovieWriter:
+    """
+    Buffers new movies and writes them with their genres in bulk.
+
+    Known TMDB ids and the genre name -> id map are loaded once up front,
+    so skipping duplicates and resolving genres costs no queries per
+    movie. Every `batch_size` movies, one transaction bulk-inserts them
+    and then their genre through-rows. `skipped` counts the malformed
+    records an ingest left out.
+    """
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.known_tmdb_ids = set(Movie.objects.exclude(tmdb_id=None).values_list('tmdb_id', flat=True))
+        self.genre_ids = dict(Genre.objects.values_list('name', 'id'))
+        self.pending = []
+        self.written = 0
+        self.skipped = 0
+
+    @property
+    def accepted(self):
+        return self.written + len(self.pending)
+
+    def add(self, movie, genre_names=()):
+        """Queue `movie` unless its TMDB id is already stored or queued. Returns whether it was queued."""
+        if movie.tmdb_id is not None:
+            if movie.tmdb_id in self.known_tmdb_ids:
+                return False
+            self.known_tmdb_ids.add(movie.tmdb_id)
+        genre_ids = [self.genre_ids[name] for name in genre_names if name in self.genre_ids]
+        self.pending.append((movie, genre_ids))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        if not self.pending:
+            return
+        Through = Movie.genres.through
+        with transaction.atomic():
+            # Primary keys come back from the insert, so the through rows can follow
+            movies = Movie.objects.bulk_create([movie for movie, _ in self.pending], batch_size=self.batch_size)
+            Through.objects.bulk_create(
+                [
+                    Through(movie_id=movie.pk, genre_id=genre_id)
+                    for movie, (_, genre_ids) in zip(movies, self.pending)
+                    for genre_id in genre_ids
+                ],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+        self.written += len(self.pending)
+        self.pending = []
+
+
+def _records(fetch, workers, log=None):
+    """
+    Results of consecutive pages, in order. `workers` pages are fetched at
+    a time; stops after the last page or at the first empty one.
+    """
+    page, last_page = 1, None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while last_page is None or page <= last_page:
+            end = page + workers if last_page is None else min(page + workers, last_page + 1)
+            for data in pool.map(fetch, range(page, end)):
+                last_page = data.get('total_pages', last_page)
+                records = data.get('results') or []
+                if not records:
+                    return
+                yield from records
+            if log:
+                log(f"Fetched pages {page}-{end - 1}")
+            page = end
+
+
+def ingest_tmdb(path, count, params=None, api_key=None, base_url=None, writer=None, log=None):
+    """
+    Write up to `count` new movies from a paginated TMDB list endpoint
+    (`path`, e.g. 'movie/popular') and return how many were created.
+
+    Pages are fetched `TMDB_INGEST['WORKERS']` at a time on a pooled,
+    retrying session, while this thread converts them in page order and
+    hands them to a MovieWriter, so the database is only touched from the
+    calling thread. Malformed records are reported to `log`, counted in
+    the writer's `skipped` and left out. Movies fetched before an error
+    are still written; pass a `writer` to see how many there were when an
+    exception escapes.
+    """
+    options = ingest_options()
+    url = f"{(base_url or options['BASE_URL']).rstrip('/')}/{path.lstrip('/')}"
+    params = dict(params or {})
+    if api_key:
+        params['api_key'] = api_key
+    session = tmdb_session(options['RETRIES'], options['BACKOFF'], options['WORKERS'])
+
+    def fetch(page):
+        response = session.get(url, params={**params, 'page': page}, timeout=options['TIMEOUT'])
+        response.raise_for_status()
+        return response.json()
+
+    if count <= 0:
+        return 0
+    writer = writer or MovieWriter(options['BATCH_SIZE'])
+    try:
+        with session:
+            for position, record in enumerate(_records(fetch, options['WORKERS'], log), start=1):
+                try:
+                    if is_excluded(record):
+                        if log:
+                            log(f"Skipped movie (contains 'sex'): {record.get('title')}")
+                        continue
+                    movie, genre_names = tmdb_movie(record)
+                except (KeyError, ValueError, TypeError, AttributeError) as error:
+                    writer.skipped += 1
+                    if log:
+                        log(f"Skipped malformed record {position}: {error!r}")
+                    continue
+                writer.add(movie, genre_names)
+                if writer.accepted >= count:
+                    break
+    finally:
+        writer.flush()
+    return writer.written
+
+
+def read_catalog(path, file_format=None, skip=0):
+    """
+    Yield the records of a JSONL (one object per line) or CSV (header row)
+    catalog dump one at a time, so memory stays flat however large the
+    file is. The format defaults to the file extension; the first `skip`
+    records are passed over without being parsed where the format allows.
+    A JSONL line that is not valid JSON is yielded as the raw line, so it
+    still counts as a record and catalog_movie rejects it.
+    """
+    file_format = file_format or ('csv' if str(path).lower().endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf-8') as dump:
+        if file_format == 'csv':
+            yield from islice(csv.DictReader(dump), skip, None)
+        else:
+            lines = (line for line in dump if line.strip())
+            for line in islice(lines, skip, None):
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    yield line
+
+
+def batched(records, size):
+    """Lists of up to `size` consecutive records"""
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+
+def _number(value, cast, default=0):
+    return cast(value) if value not in (None, '') else default
+
+
+def _image_url(path, size):
+    if not path:
+        return None
+    return path if path.startswith('http') else f"{TMDB_IMAGE_URL}/{size}{path}"
+
+
+def _genre_names(record):
+    """
+    Genre names from TMDB style `genre_ids` or `genres` (names, or objects
+    with a name); CSV cells separate several values with "|". None when
+    the record has neither, or only empty CSV cells, so its stored genres
+    are left alone.
+    """
+    if all(record.get(key) in (None, '') for key in ('genre_ids', 'genres')):
+        return None
+    names = []
+    for key in ('genre_ids', 'genres'):
+        values = record.get(key) or []
+        if isinstance(values, str):
+            values = [value.strip() for value in values.split('|') if value.strip()]
+        for value in values:
+            if isinstance(value, dict):
+                value = value.get('name')
+            elif key == 'genre_ids':
+                value = TMDB_GENRES.get(int(value))
+            if value:
+                names.append(value)
+    return names
+
+
+def catalog_movie(record):
+    """
+    An unsaved Movie and its genre names (None to keep the stored ones)
+    from a dump record, or None when the record has no TMDB id to upsert
+    on or is excluded. Raises ValueError or TypeError for malformed ones.
+
+    Records use TMDB's field names (`id` or `tmdb_id`, `title`,
+    `release_date`, ...); CSV values arrive as strings and are converted.
+    """
+    if not isinstance(record, dict):
+        raise ValueError(f"not a JSON object: {str(record)[:80]!r}")
+    tmdb_id = record.get('tmdb_id') or record.get('id')
+    if tmdb_id in (None, '') or not record.get('title') or is_excluded(record):
+        return None
+    release_date = record.get('release_date')
+    movie = Movie(
+        title=record['title'],
+        overview=record.get('overview') or '',
+        release_date=(
+            datetime.datetime.strptime(release_date, '%Y-%m-%d').date() if release_date else datetime.date.today()
+        ),
+        poster_path=_image_url(record.get('poster_path'), 'w500'),
+        backdrop_path=_image_url(record.get('backdrop_path'), 'original'),
+        tmdb_id=int(tmdb_id),
+        popularity=_number(record.get('popularity'), float),
+        vote_average=_number(record.get('vote_average'), float),
+        vote_count=_number(record.get('vote_count'), int),
+    )
+    return movie, _genre_names(record)
+
+
+def upsert_movies(entries, genre_ids):
+    """
+    Insert or update `entries` ((movie, genre names) with distinct TMDB
+    ids) by tmdb_id in one transaction and replace the genres of those
+    whose names are not None. Genres missing from `genre_ids` (name -> id)
+    are created and added to it. Returns (created, updated).
+    """
+    Through = Movie.genres.through
+    tmdb_ids = [movie.tmdb_id for movie, _ in entries]
+    with_genres = [(movie, names) for movie, names in entries if names is not None]
+    missing = {name for _, names in with_genres for name in names} - genre_ids.keys()
+    with transaction.atomic():
+        if missing:
+            Genre.objects.bulk_create([Genre(name=name) for name in missing], ignore_conflicts=True)
+            genre_ids.update(Genre.objects.filter(name__in=missing).values_list('name', 'id'))
+        existing = Movie.objects.filter(tmdb_id__in=tmdb_ids).count()
+        Movie.objects.bulk_create(
+            [movie for movie, _ in entries],
+            update_conflicts=True,
+            unique_fields=['tmdb_id'],
+            update_fields=UPSERT_FIELDS,
+        )
+        if with_genres:
+            # Looked up rather than read back from the insert, which not every backend returns for upserts
+            movie_ids = dict(
+                Movie.objects.filter(tmdb_id__in=[movie.tmdb_id for movie, _ in with_genres])
+                .values_list('tmdb_id', 'id')
+            )
+            Through.objects.filter(movie_id__in=movie_ids.values()).delete()
+            Through.objects.bulk_create(
+                [
+                    Through(movie_id=movie_ids[movie.tmdb_id], genre_id=genre_ids[name])
+                    for movie, names in with_genres
+                    for name in set(names)
+                ],
+                ignore_conflicts=True,
+            )
+    return len(entries) - existing, existing
+
+
+def import_catalog(records, batch_size=1000, progress=None, log=None, start=0):
+    """
+    Upsert the movies of `records` (dump records, e.g. from read_catalog)
+    in transactions of `batch_size` records.
+
+    Malformed records are counted as skipped and reported to `log` with
+    their 1-based position, counting `start` records before `records`.
+    After each committed batch `progress(rows, created, updated, skipped)`
+    is called with running totals, where `rows` counts records consumed
+    so far; a caller can checkpoint it and skip that many records to
+    resume. Returns the final (rows, created, updated, skipped).
+    """
+    genre_ids = dict(Genre.objects.values_list('name', 'id'))
+    rows = created = updated = skipped = 0
+    for batch in batched(records, batch_size):
+        entries = {}
+        for position, record in enumerate(batch, start=start + rows + 1):
+            try:
+                entry = catalog_movie(record)
+            except (ValueError, TypeError, AttributeError) as error:
+                entry = None
+                if log:
+                    log(f"Skipped record {position}: {error}")
+            if entry is None:
+                skipped += 1
+            else:
+                # A later record of the same movie wins, as it would row by row
+                entries[entry[0].tmdb_id] = entry
+        if entries:
+            batch_created, batch_updated = upsert_movies(list(entries.values()), genre_ids)
+            created += batch_created
+            updated += batch_updated
+        rows += len(batch)
+        if progress:
+            progress(rows, created, updated, skipped)
+    return rows, created, updated, skipped
@@ -0,0 +1,266 @@
+import csv
+from datetime import datetime, timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone as django_timezone
+
+from .caching import bump_user_state_version
+from .ingest import batched
+from .models import Favorite, Movie, Rating, UserRecommendation, Watchlist
+from .rating_aggregates import refresh_rating_aggregates
+
+# Interaction kind -> (model, timestamp field)
+INTERACTION_MODELS = {
+    'rating': (Rating, 'created_at'),
+    'favorite': (Favorite, 'created_at'),
+    'watchlist': (Watchlist, 'added_at'),
+}
+
+# Accepted header names of each column, MovieLens' first
+COLUMNS = {
+    'user': ('userId', 'user_id', 'user'),
+    'movie': ('movieId', 'movie_id', 'tmdb_id', 'movie'),
+    'rating': ('rating',),
+    'timestamp': ('timestamp', 'created_at'),
+}
+
+# Movies, users and aggregates are refreshed this many at a time afterwards
+REFRESH_CHUNK_SIZE = 1000
+
+
+def read_interactions(path, delimiter=','):
+    """
+    Yield (user, movie, rating, timestamp) tuples of a ratings file with a
+    header row, such as MovieLens' ratings.csv, one row at a time. Values
+    are the raw strings; they are None when the file has no such column or
+    the row is too short to hold it.
+    """
+    with open(path, newline='', encoding='utf-8') as dump:
+        reader = csv.reader(dump, delimiter=delimiter)
+        header = next(reader, [])
+        positions = {}
+        for column, names in COLUMNS.items():
+            positions[column] = next((header.index(name) for name in names if name in header), None)
+        if positions['user'] is None or positions['movie'] is None:
+            raise ValueError(f"{path} needs a user and a movie column, found {header}")
+        for row in reader:
+            if row:
+                yield tuple(
+                    row[position] if position is not None and position < len(row) else None
+                    for position in positions.values()
+                )
+
+
+def read_movie_links(path):
+    """MovieLens movieId -> TMDB id from its links.csv, leaving out movies without one"""
+    with open(path, newline='', encoding='utf-8') as links:
+        return {row['movieId']: int(row['tmdbId']) for row in csv.DictReader(links) if row.get('tmdbId')}
+
+
+class InteractionImporter:
+    """
+    Writes ratings, favorites or watchlist entries from external ids in bulk.
+
+    External users become `<user_prefix><id>` accounts without a usable
+    password; external movies are TMDB ids, or MovieLens ids when
+    `movie_links` (MovieLens id -> TMDB id) is given. Both are resolved
+    through dictionaries loaded once up front, so a chunk costs a query for
+    its new users and one bulk write, whatever its size. Rows whose movie
+    is not in the catalog, or whose rating is below `min_rating` or
+    outside 1-10 after multiplying by `rating_scale`, are skipped; for
+    favorites and watchlist entries the rating only matters with a
+    `min_rating`.
+
+    Bulk writes bypass the signals; `finish()` applies what they would
+    have done. bulk_create stamps rows with the current time, so the file's
+    timestamps are written afterwards by bulk_update, which takes them as
+    given, rather than by switching off auto_now on fields every thread
+    of the process shares.
+    """
+
+    def __init__(self, kind='rating', user_prefix='ml_', movie_links=None, rating_scale=2, min_rating=None):
+        self.model, self.timestamp_field = INTERACTION_MODELS[kind]
+        self.kind = kind
+        self.user_prefix = user_prefix
+        self.movie_links = movie_links
+        self.rating_scale = rating_scale
+        self.min_rating = min_rating
+        self.user_ids = {
+            username[len(user_prefix):]: user_id
+            for username, user_id in User.objects.filter(username__startswith=user_prefix)
+            .values_list('username', 'id').iterator(chunk_size=10000)
+        }
+        self.movie_ids = dict(Movie.objects.exclude(tmdb_id=None).values_list('tmdb_id', 'id'))
+        self.users_created = 0
+        self.touched_users = set()
+        self.touched_movies = set()
+
+    def _movie_id(self, external):
+        if self.movie_links is not None:
+            external = self.movie_links.get(external)
+            return None if external is None else self.movie_ids.get(external)
+        try:
+            return self.movie_ids.get(int(external))
+        except (ValueError, OverflowError):
+            return None
+
+    def _rating(self, value):
+        """The stored rating of a raw value, or None to skip the row"""
+        if value in (None, ''):
+            return None
+        if self.min_rating is not None and float(value) < self.min_rating:
+            return None
+        rating = round(float(value) * self.rating_scale)
+        return rating if 1 <= rating <= 10 else None
+
+    def _create_users(self, externals):
+        missing = {external for external in externals if external not in self.user_ids}
+        if not missing:
+            return
+        password = make_password(None)
+        usernames = [f"{self.user_prefix}{external}" for external in missing]
+        User.objects.bulk_create(
+            [User(username=username, password=password) for username in usernames], ignore_conflicts=True
+        )
+        for start in range(0, len(usernames), REFRESH_CHUNK_SIZE):
+            created = User.objects.filter(username__in=usernames[start:start + REFRESH_CHUNK_SIZE])
+            for username, user_id in created.values_list('username', 'id'):
+                self.user_ids[username[len(self.user_prefix):]] = user_id
+        self.users_created += len(missing)
+
+    def _stored_ids(self, pairs):
+        """(user id, movie id) -> row id of the stored rows among `pairs`"""
+        user_ids = sorted({user_id for user_id, _ in pairs})
+        ids = {}
+        for start in range(0, len(user_ids), REFRESH_CHUNK_SIZE):
+            rows = self.model.objects.filter(user_id__in=user_ids[start:start + REFRESH_CHUNK_SIZE])
+            for user_id, movie_id, row_id in rows.values_list('user_id', 'movie_id', 'id'):
+                if (user_id, movie_id) in pairs:
+                    ids[user_id, movie_id] = row_id
+        return ids
+
+    def _stamp(self, pairs, existing):
+        """
+        Give the rows of `pairs` ((user id, movie id) -> time) their file
+        timestamps. Rows in `existing` were stored before and keep their
+        creation time; updated ratings take the file's as their update time.
+        """
+        ids = self._stored_ids(pairs)
+        created = [
+            self.model(pk=ids[pair], **{self.timestamp_field: at}) for pair, at in pairs.items() if pair not in existing
+        ]
+        if self.kind != 'rating':
+            self.model.objects.bulk_update(created, [self.timestamp_field], batch_size=REFRESH_CHUNK_SIZE)
+            return
+        for rating in created:
+            rating.updated_at = rating.created_at
+        updated = [self.model(pk=ids[pair], updated_at=at) for pair, at in pairs.items() if pair in existing]
+        self.model.objects.bulk_update(created, ['created_at', 'updated_at'], batch_size=REFRESH_CHUNK_SIZE)
+        self.model.objects.bulk_update(updated, ['updated_at'], batch_size=REFRESH_CHUNK_SIZE)
+
+    def _entry(self, row, now):
+        """((user, movie id), (rating, time)) of a row, or None to skip it"""
+        user, movie, rating, timestamp = row
+        if not user or movie is None:
+            return None
+        movie_id = self._movie_id(movie)
+        if movie_id is None:
+            return None
+        if self.kind == 'rating' or self.min_rating is not None:
+            rating = self._rating(rating)
+            if rating is None:
+                return None
+        at = datetime.fromtimestamp(int(timestamp), tz=timezone.utc) if timestamp else now
+        return (user, movie_id), (rating, at)
+
+    def write(self, rows):
+        """
+        Write one chunk of (user, movie, rating, timestamp) rows in a single
+        transaction. Returns (written, skipped); a later row for the same
+        user and movie replaces an earlier one, and malformed rows are
+        skipped.
+        """
+        now = django_timezone.now()
+        entries = {}
+        for row in rows:
+            try:
+                entry = self._entry(row, now)
+            except (ValueError, OverflowError, OSError):
+                # Unparseable rating or timestamp, or one out of range
+                continue
+            if entry is not None:
+                entries[entry[0]] = entry[1]
+        if not entries:
+            return 0, len(rows)
+
+        with transaction.atomic():
+            self._create_users({user for user, _ in entries})
+            pairs = {(self.user_ids[user], movie_id): value for (user, movie_id), value in entries.items()}
+            existing = self._stored_ids(pairs)
+            instances = []
+            for (user_id, movie_id), (rating, _) in pairs.items():
+                instance = self.model(user_id=user_id, movie_id=movie_id)
+                if self.kind == 'rating':
+                    instance.rating = rating
+                instances.append(instance)
+            if self.kind == 'rating':
+                self.model.objects.bulk_create(
+                    instances,
+                    update_conflicts=True,
+                    unique_fields=['user', 'movie'],
+                    update_fields=['rating', 'updated_at'],
+                )
+            else:
+                self.model.objects.bulk_create(instances, ignore_conflicts=True)
+            self._stamp({pair: at for pair, (_, at) in pairs.items()}, existing)
+        self.touched_users.update(instance.user_id for instance in instances)
+        self.touched_movies.update(instance.movie_id for instance in instances)
+        return len(instances), len(rows) - len(instances)
+
+    def finish(self):
+        """
+        Recount the stored aggregates and histograms of the rated movies
+        and drop the affected users' cached and precomputed
+        recommendations, as the per-row signals would have.
+        """
+        if self.kind == 'rating':
+            movie_ids = sorted(self.touched_movies)
+            for start in range(0, len(movie_ids), REFRESH_CHUNK_SIZE):
+                refresh_rating_aggregates(movie_ids[start:start + REFRESH_CHUNK_SIZE])
+        user_ids = sorted(self.touched_users)
+        for start in range(0, len(user_ids), REFRESH_CHUNK_SIZE):
+            chunk = user_ids[start:start + REFRESH_CHUNK_SIZE]
+            UserRecommendation.objects.filter(user_id__in=chunk).delete()
+            for user_id in chunk:
+                bump_user_state_version(user_id)
+
+
+def import_interactions(rows, importer, batch_size=10000, progress=None):
+    """
+    Write `rows` (e.g. from read_interactions) through `importer` in
+    transactions of `batch_size` rows, then run its `finish()`, which also
+    happens when an error stops the import, for the batches committed
+    before it.
+
+    Foreign key checks are switched off for the writes where the backend
+    allows it (the ids all come from the importer's lookups) and the
+    table is checked once at the end instead. After each committed batch
+    `progress(rows, written, skipped)` is called with running totals.
+    Returns the final (rows, written, skipped).
+    """
+    total = written = skipped = 0
+    try:
+        with connection.constraint_checks_disabled():
+            for batch in batched(rows, batch_size):
+                batch_written, batch_skipped = importer.write(batch)
+                total += len(batch)
+                written += batch_written
+                skipped += batch_skipped
+                if progress:
+                    progress(total, written, skipped)
+        connection.check_constraints(table_names=[importer.model._meta.db_table])
+    finally:
+        importer.finish()
+    return total, written, skipped
@@ -0,0 +1,173 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from sklearn.preprocessing import normalize
+
+from .models import ItemNeighbor, PendingNeighborUpdate, Rating
+from .neighbors import NeighborIndex
+from .rating_matrix import RatingMatrix
+
+WRITE_BATCH_SIZE = 5000
+
+# Incremental writes replace a (movie, neighbor) row another update inserted first
+UPSERT = {'update_conflicts': True, 'unique_fields': ['movie', 'neighbor'], 'update_fields': ['score']}
+
+
+def neighbor_count():
+    return getattr(settings, 'RECOMMENDER_ITEM_NEIGHBORS', 50)
+
+
+def max_update_raters():
+    return getattr(settings, 'RECOMMENDER_ITEM_UPDATE_RATERS', 2000)
+
+
+def build_item_neighbors(k=None):
+    """
+    Recompute every movie's neighbour list from scratch.
+
+    Similarity is the cosine between movies' rating vectors (one entry per
+    user), computed in blocks by NeighborIndex. Only positive similarities
+    are stored, and updates queued before the build are dropped as it
+    covers them. Returns the number of rows written.
+    """
+    k = k or neighbor_count()
+    started = timezone.now()
+    ratings = RatingMatrix.load()
+    items = normalize(ratings.matrix.T.tocsr())
+    index = NeighborIndex.build(items, k)
+
+    rows = []
+    for row in range(len(index)):
+        neighbor_rows, scores = index.lookup(row)
+        keep = scores > 0
+        movie_id = int(ratings.movie_ids[row])
+        rows.extend(
+            ItemNeighbor(movie_id=movie_id, neighbor_id=int(neighbor_id), score=float(score))
+            for neighbor_id, score in zip(ratings.movie_ids[neighbor_rows[keep]], scores[keep])
+        )
+
+    with transaction.atomic():
+        ItemNeighbor.objects.all().delete()
+        ItemNeighbor.objects.bulk_create(rows, batch_size=WRITE_BATCH_SIZE)
+        PendingNeighborUpdate.objects.filter(queued_at__lte=started).delete()
+    return len(rows)
+
+
+def queue_neighbor_updates(movie_ids):
+    """
+    Mark movies whose ratings changed for `build_item_neighbors --pending`,
+    which keeps the similarity work out of the write requests.
+    """
+    PendingNeighborUpdate.objects.bulk_create(
+        [PendingNeighborUpdate(movie_id=movie_id) for movie_id in set(movie_ids)], ignore_conflicts=True,
+    )
+
+
+def process_neighbor_updates(limit=None, k=None):
+    """
+    Apply queued updates, oldest first, up to `limit` movies. Each entry is
+    dequeued before its update, so a rating written meanwhile queues the
+    movie again. Returns the number of movies updated.
+    """
+    pending = PendingNeighborUpdate.objects.order_by('queued_at').values_list('movie_id', flat=True)
+    updated = 0
+    for movie_id in list(pending[:limit] if limit else pending):
+        if PendingNeighborUpdate.objects.filter(movie_id=movie_id).delete()[0]:
+            update_item_neighbors(movie_id, k)
+            updated += 1
+    return updated
+
+
+def _similarities_for(movie_id):
+    """
+    Cosine similarity of `movie_id` with every movie co-rated by one of its
+    raters. Returns {movie_id: score}, excluding the movie itself.
+
+    Costs two rating queries over the movie's raters plus one aggregate over
+    the co-rated movies, independent of the catalog size. Only the
+    `RECOMMENDER_ITEM_UPDATE_RATERS` most recent raters are used, so a
+    popular movie costs a bounded amount of work; its similarities are
+    then estimates until the next full rebuild.
+    """
+    raters = dict(
+        Rating.objects.filter(movie_id=movie_id).order_by('-created_at', 'id')
+        .values_list('user_id', 'rating')[:max_update_raters()]
+    )
+    if not raters:
+        return {}
+
+    co_ratings = np.array(
+        list(Rating.objects.filter(user_id__in=list(raters)).exclude(movie_id=movie_id)
+             .order_by().values_list('user_id', 'movie_id', 'rating')),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    if not len(co_ratings):
+        return {}
+
+    own = np.array([raters[user_id] for user_id in co_ratings[:, 0]], dtype=np.float64)
+    co_movies, inverse = np.unique(co_ratings[:, 1], return_inverse=True)
+    dots = np.bincount(inverse, weights=own * co_ratings[:, 2])
+
+    squares = dict(
+        Rating.objects.filter(movie_id__in=co_movies.tolist()).order_by().values('movie_id')
+        .annotate(total=Sum(F('rating') * F('rating'))).values_list('movie_id', 'total')
+    )
+    own_norm = np.sqrt(sum(rating * rating for rating in raters.values()))
+    norms = np.sqrt(np.array([squares.get(int(m), 0) for m in co_movies], dtype=np.float64))
+    scores = np.divide(dots, own_norm * norms, out=np.zeros_like(dots), where=norms > 0)
+    return {int(m): float(score) for m, score in zip(co_movies, scores) if score > 0}
+
+
+def update_item_neighbors(movie_id, k=None):
+    """
+    Incrementally refresh the neighbourhoods touched by a rating change on
+    `movie_id`.
+
+    A rating only changes the similarities between `movie_id` and other
+    movies, so this recomputes that one row of similarities, replaces the
+    movie's own top-k list and inserts, rescores or removes `movie_id` in the
+    lists of the movies it is related to. A movie whose list loses
+    `movie_id` keeps k-1 entries until the next full rebuild. Rows another
+    update wrote concurrently are overwritten rather than conflicting.
+    """
+    k = k or neighbor_count()
+    similarities = _similarities_for(movie_id)
+    ranked = sorted(similarities.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    with transaction.atomic():
+        ItemNeighbor.objects.filter(movie_id=movie_id).delete()
+        ItemNeighbor.objects.bulk_create(
+            [ItemNeighbor(movie_id=movie_id, neighbor_id=other_id, score=score) for other_id, score in ranked],
+            **UPSERT,
+        )
+
+        # Reverse direction: lists of the related movies plus lists that currently hold movie_id
+        related = set(similarities) | set(
+            ItemNeighbor.objects.filter(neighbor_id=movie_id).values_list('movie_id', flat=True)
+        )
+        lists = {}
+        for row_id, owner_id, score in (
+            ItemNeighbor.objects.filter(movie_id__in=list(related))
+            .exclude(neighbor_id=movie_id)
+            .values_list('id', 'movie_id', 'score')
+        ):
+            lists.setdefault(owner_id, []).append((score, row_id))
+
+        upserts = []
+        evicted = []
+        for owner_id in related:
+            score = similarities.get(owner_id)
+            if score is None:
+                continue
+            entries = sorted(lists.get(owner_id, []), reverse=True)
+            if len(entries) < k:
+                upserts.append(ItemNeighbor(movie_id=owner_id, neighbor_id=movie_id, score=score))
+            elif score > entries[k - 1][0]:
+                upserts.append(ItemNeighbor(movie_id=owner_id, neighbor_id=movie_id, score=score))
+                evicted.append(entries[k - 1][1])
+
+        ItemNeighbor.objects.filter(neighbor_id=movie_id).delete()
+        ItemNeighbor.objects.bulk_create(upserts, batch_size=WRITE_BATCH_SIZE, **UPSERT)
+        ItemNeighbor.objects.filter(id__in=evicted).delete()
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from movies.ann import IVFIndex, recall_report
+from movies.content_model import ann_options, get_content_model
+
+
+class Command(BaseCommand):
+    help = 'Measure recall and latency of the approximate content index against exact search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10, help='Neighbours compared per query')
+        parser.add_argument('--sample', type=int, default=200, help='Number of movies queried')
+        parser.add_argument('--probes', type=int, nargs='+', help='Probe counts to compare (default: the index setting)')
+        parser.add_argument('--lists', type=int, help='Rebuild the index with this many lists before measuring')
+
+    def handle(self, *args, **options):
+        model = get_content_model()
+        if model is None:
+            self.stdout.write(self.style.WARNING('Not enough movies to build a content model'))
+            return
+
+        index = model.ann
+        if options.get('lists'):
+            params = ann_options()
+            index = IVFIndex.build(
+                model.matrix, n_lists=options['lists'], n_probe=params['PROBES'],
+                centroid_terms=params['CENTROID_TERMS'], iterations=params['ITERATIONS'],
+                seed=params['SEED'],
+            )
+
+        self.stdout.write(f"movies={len(model)} lists={index.n_lists} k={options['k']}")
+        self.stdout.write("probes  recall  candidates  %catalog  exact_ms  ann_ms")
+        for n_probe in options.get('probes') or [index.n_probe]:
+            report = recall_report(
+                index, model.matrix, k=options['k'], sample_size=options['sample'], n_probe=n_probe,
+            )
+            self.stdout.write(
+                f"{n_probe:>6}  {report['recall']:.3f}  {report['mean_candidates']:>10.1f}  "
+                f"{100 * report['candidate_fraction']:>8.2f}  {report['exact_ms']:>8.3f}  "
+                f"{report['ann_ms']:>6.3f}"
+            )
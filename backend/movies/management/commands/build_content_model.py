@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from movies.content_model import artifact_path, rebuild_content_model, update_content_model
+
+
+class Command(BaseCommand):
+    help = 'Build the TF-IDF content model used for content-based recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbors', type=int, default=None,
+            help='Number of precomputed neighbours per movie (default: RECOMMENDER_CONTENT_NEIGHBORS)'
+        )
+        parser.add_argument(
+            '--update', action='store_true',
+            help='Only insert movies added since the last build instead of refitting'
+        )
+
+    def handle(self, *args, **options):
+        if options.get('update'):
+            model, added = update_content_model()
+            if model is None:
+                self.stdout.write(self.style.WARNING('Not enough movies to build a content model'))
+                return
+            self.stdout.write(self.style.SUCCESS(
+                f"Inserted {added} movies into content model {model.version}"
+            ))
+            return
+
+        model = rebuild_content_model(options.get('neighbors'))
+        if model is None:
+            self.stdout.write(self.style.WARNING('Not enough movies to build a content model'))
+            return
+
+        self.stdout.write(
+            f"Vectorized {len(model)} movies into {model.matrix.shape[1]} terms "
+            f"({model.matrix.nnz} non-zeros), {model.neighbors.k} neighbours per movie"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved content model {model.version} to {artifact_path()}"
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from movies.item_similarity import build_item_neighbors, process_neighbor_updates
+
+
+class Command(BaseCommand):
+    help = 'Recompute the item-item collaborative neighbour lists from all ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbors', type=int, default=None,
+            help='Neighbours kept per movie (default: RECOMMENDER_ITEM_NEIGHBORS)'
+        )
+        parser.add_argument(
+            '--pending', action='store_true',
+            help='Only update the movies whose ratings changed since their last update'
+        )
+        parser.add_argument('--limit', type=int, default=None, help='Most movies updated with --pending')
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            updated = process_neighbor_updates(options['limit'], options.get('neighbors'))
+            self.stdout.write(self.style.SUCCESS(f"Updated the item neighbours of {updated} movies"))
+            return
+        written = build_item_neighbors(options.get('neighbors'))
+        self.stdout.write(self.style.SUCCESS(f"Stored {written} item neighbour pairs"))
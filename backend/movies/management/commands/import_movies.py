@@ -0,0 +1,88 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.catalog_cache import invalidate_catalog
+from movies.ingest import import_catalog, read_catalog
+
+
+class Command(BaseCommand):
+    help = 'Import or update movies from a local JSONL or CSV catalog dump, upserting by tmdb_id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL (one TMDB movie object per line) or CSV file')
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='File format (default: from the file extension)'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Records upserted per transaction')
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording how far the import got (default: <path>.checkpoint)'
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Continue after the records the checkpoint says were committed'
+        )
+        parser.add_argument('--report-every', type=float, default=10, help='Seconds between progress lines')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f"No such file: {path}")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        checkpoint_path = options['checkpoint'] or f"{path}.checkpoint"
+        source = self.source_state(path)
+
+        skip = 0
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as checkpoint:
+                saved = json.load(checkpoint)
+            if saved.get('source') == source:
+                skip = saved['rows']
+                self.stdout.write(f"Resuming after {skip} records")
+            else:
+                self.stdout.write(self.style.WARNING('The file changed since the checkpoint, starting over'))
+
+        started = last_report = time.monotonic()
+
+        def report(rows, created, updated, skipped):
+            nonlocal last_report
+            self.save_checkpoint(checkpoint_path, source, skip + rows)
+            now = time.monotonic()
+            if now - last_report >= options['report_every']:
+                last_report = now
+                self.stdout.write(f"{skip + rows} records ({rows / (now - started):.0f} records/s)")
+
+        records = read_catalog(path, options['format'], skip=skip)
+        rows, created, updated, skipped = import_catalog(
+            records, options['batch_size'], progress=report,
+            log=lambda message: self.stdout.write(self.style.WARNING(message)), start=skip,
+        )
+        invalidate_catalog()
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {rows} records in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} records/s): "
+            f"{created} created, {updated} updated, {skipped} skipped"
+        ))
+
+    @staticmethod
+    def source_state(path):
+        """What identifies the file a checkpoint belongs to"""
+        stat = os.stat(path)
+        return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    @staticmethod
+    def save_checkpoint(checkpoint_path, source, rows):
+        # Written beside the target and renamed over it, so an interruption
+        # never leaves a half-written checkpoint
+        partial = f"{checkpoint_path}.tmp"
+        with open(partial, 'w') as checkpoint:
+            json.dump({'source': source, 'rows': rows}, checkpoint)
+        os.replace(partial, checkpoint_path)
@@ -0,0 +1,91 @@
+import os
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.catalog_cache import invalidate_catalog
+from movies.interactions import (
+    INTERACTION_MODELS, InteractionImporter, import_interactions, read_interactions, read_movie_links,
+)
+
+# Commands that rebuild what depends on the interactions, in order
+REBUILD_COMMANDS = (
+    ('update_trending', {'rebuild': True}),
+    ('train_recommender', {}),
+    ('build_item_neighbors', {}),
+)
+
+
+class Command(BaseCommand):
+    help = 'Import ratings, favorites or watchlist entries from a MovieLens style ratings file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV with a header row: userId, movieId and optionally rating, timestamp')
+        parser.add_argument(
+            '--kind', choices=tuple(INTERACTION_MODELS), default='rating', help='What each row becomes'
+        )
+        parser.add_argument(
+            '--links',
+            help="MovieLens links.csv mapping the file's movieId to TMDB ids (default: movie ids are TMDB ids)"
+        )
+        parser.add_argument('--user-prefix', default='ml_', help='Username prefix of the imported users')
+        parser.add_argument(
+            '--rating-scale', type=float, default=2,
+            help='Multiplier onto the 1-10 scale (default 2, for 0.5-5 star ratings)'
+        )
+        parser.add_argument('--min-rating', type=float, help='Skip rows rated below this, on the file scale')
+        parser.add_argument('--delimiter', default=',', help='Field delimiter')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows written per transaction')
+        parser.add_argument('--report-every', type=float, default=10, help='Seconds between progress lines')
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Rebuild trending scores, the matrix-factorization model and item neighbours afterwards'
+        )
+
+    def handle(self, *args, **options):
+        for path in (options['path'], options['links']):
+            if path and not os.path.isfile(path):
+                raise CommandError(f"No such file: {path}")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        importer = InteractionImporter(
+            kind=options['kind'],
+            user_prefix=options['user_prefix'],
+            movie_links=read_movie_links(options['links']) if options['links'] else None,
+            rating_scale=options['rating_scale'],
+            min_rating=options['min_rating'],
+        )
+        started = last_report = time.monotonic()
+
+        def report(rows, written, skipped):
+            nonlocal last_report
+            now = time.monotonic()
+            if now - last_report >= options['report_every']:
+                last_report = now
+                self.stdout.write(f"{rows} rows ({rows / (now - started):.0f} rows/s)")
+
+        try:
+            rows = read_interactions(options['path'], options['delimiter'])
+            rows, written, skipped = import_interactions(rows, importer, options['batch_size'], progress=report)
+        except ValueError as error:
+            raise CommandError(error)
+        finally:
+            # Batches committed before an error are live as well
+            invalidate_catalog()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s): "
+            f"{written} {options['kind']} rows written, {skipped} skipped, {importer.users_created} users created"
+        ))
+
+        if options['rebuild']:
+            for name, command_options in REBUILD_COMMANDS:
+                call_command(name, stdout=self.stdout, **command_options)
+        else:
+            self.stdout.write(
+                'Run with --rebuild, or run update_trending --rebuild, train_recommender and build_item_neighbors, '
+                'to bring the recommenders up to date'
+            )
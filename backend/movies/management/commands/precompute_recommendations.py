@@ -0,0 +1,44 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies.precompute import PRECOMPUTED_TYPES, precompute_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Precompute top-N recommendations for every user and store them in UserRecommendation'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type', dest='types', nargs='+', choices=PRECOMPUTED_TYPES, default=list(PRECOMPUTED_TYPES),
+            help='Recommendation types to precompute'
+        )
+        parser.add_argument('--top-n', type=int, default=10, help='Recommendations stored per user')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users scored per task')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Skip users whose stored rows already match the current ratings/model'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def report(done, total):
+            elapsed = time.monotonic() - started
+            rate = done / elapsed if elapsed else 0
+            self.stdout.write(f"{done}/{total} users ({rate:.0f} users/s)")
+
+        scored = precompute_recommendations(
+            types=options['types'],
+            top_n=options['top_n'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            resume=options['resume'],
+            progress=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Precomputed {', '.join(options['types'])} recommendations for {scored} users "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from django.db import connection
+
+from movies.search import FTS_TABLE, missing_sync_triggers, rebuild_search_index, search_available
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index over movie titles and overviews'
+
+    def handle(self, *args, **options):
+        if not search_available():
+            if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+                raise CommandError(
+                    f"The triggers keeping the search index current are missing ({', '.join(missing_sync_triggers())}); "
+                    'a rebuild of movies_movie dropped them. Recreate them with '
+                    '`migrate movies 0004` followed by `migrate`'
+                )
+            raise CommandError('The full-text index requires SQLite with FTS5 (see migration 0005)')
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS('Rebuilt the movie search index'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from movies.rating_aggregates import refresh_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored rating sum/count/average and histogram of movies from their ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('movie_ids', nargs='*', type=int, help='Movies to check (default: all)')
+
+    def handle(self, *args, **options):
+        repaired = refresh_rating_aggregates(options['movie_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Repaired rating aggregates of {repaired} movies"))
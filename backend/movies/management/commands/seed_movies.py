@@ -4,6 +4,8 @@ import datetime
 from django.core.management.base import BaseCommand
 from django.utils.text import slugify
 from movies.models import Movie, Genre
+from movies.catalog_cache import invalidate_catalog
+from movies.ingest import MovieWriter, ingest_options, ingest_tmdb
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -28,7 +30,9 @@ class Command(BaseCommand):
         else:
             self.stdout.write(self.style.SUCCESS('Fetching movies from TMDB API...'))
             self.fetch_from_tmdb(count)
-            
+        
+        # Cached anonymous movie and genre responses no longer match the catalog
+        invalidate_catalog()
         self.stdout.write(self.style.SUCCESS('Successfully seeded the database!'))
 
     def create_genres(self):
@@ -39,8 +43,7 @@ class Command(BaseCommand):
             "Mystery", "Romance", "Science Fiction", "Thriller", "War", "Western"
         ]
         
-        for genre_name in genres:
-            Genre.objects.get_or_create(name=genre_name)
+        Genre.objects.bulk_create([Genre(name=genre_name) for genre_name in genres], ignore_conflicts=True)
             
         self.stdout.write(f"Created {len(genres)} genres")
 
@@ -139,9 +142,15 @@ class Command(BaseCommand):
             }
         ]
         
-        created_count = 0
+        writer = MovieWriter()
+        existing_titles = set(
+            Movie.objects.filter(title__in=[movie_data['title'] for movie_data in sample_movies])
+            .values_list('title', flat=True)
+        )
         for movie_data in sample_movies:
             genres = movie_data.pop('genres', [])
+            if movie_data['title'] in existing_titles:
+                continue
             
             # Convert string date to datetime object
             release_date = datetime.datetime.strptime(movie_data['release_date'], '%Y-%m-%d').date()
@@ -151,110 +160,23 @@ class Command(BaseCommand):
             movie_data['vote_average'] = float(movie_data['popularity']) / 10
             movie_data['vote_count'] = int(movie_data['popularity'] * 10)
             
-            # Create the movie
-            movie, created = Movie.objects.get_or_create(
-                title=movie_data['title'],
-                defaults=movie_data
-            )
-            
-            # Add genres
             for genre_name in genres:
-                try:
-                    genre = Genre.objects.get(name=genre_name)
-                    movie.genres.add(genre)
-                except Genre.DoesNotExist:
+                if genre_name not in writer.genre_ids:
                     self.stdout.write(self.style.WARNING(f"Genre {genre_name} does not exist"))
-            
-            if created:
-                created_count += 1
-                
-        self.stdout.write(f"Created {created_count} sample movies")
+            writer.add(Movie(**movie_data), genres)
+        
+        writer.flush()
+        self.stdout.write(f"Created {writer.written} sample movies")
 
     def fetch_from_tmdb(self, count):
-        """Fetch movies from TMDB API"""
+        """Fetch popular movies from TMDB API"""
         api_key = os.environ.get('TMDB_API_KEY')
         if not api_key:
             self.stdout.write(self.style.ERROR('TMDB_API_KEY not found in environment variables'))
             return
         
-        # Map TMDB genre IDs to our genre names
-        tmdb_genre_map = {
-            28: "Action", 12: "Adventure", 16: "Animation", 35: "Comedy", 
-            80: "Crime", 99: "Documentary", 18: "Drama", 10751: "Family", 
-            14: "Fantasy", 36: "History", 27: "Horror", 10402: "Music", 
-            9648: "Mystery", 10749: "Romance", 878: "Science Fiction", 
-            53: "Thriller", 10752: "War", 37: "Western"
-        }
-        
-        # Fetch popular movies
-        url = f"https://api.themoviedb.org/3/movie/popular?api_key={api_key}&language=en-US"
-        created_count = 0
-        page = 1
-        
-        while created_count < count:
-            try:
-                response = requests.get(f"{url}&page={page}")
-                if response.status_code != 200:
-                    self.stdout.write(self.style.ERROR(f'Error fetching from TMDB: {response.status_code}'))
-                    break
-                
-                data = response.json()
-                if not data.get('results'):
-                    break
-                
-                for movie_data in data['results']:
-                
-                    if created_count >= count:
-                        break
-
-                    title_lower = movie_data.get('title', '').lower()
-                    overview_lower = movie_data.get('overview', '').lower()
-
-    # Skip movie if it contains the word "sex" in title or overview
-                    if 'sex' in title_lower or 'sex' in overview_lower:
-                        self.stdout.write(self.style.WARNING(f"Skipped movie (contains 'sex'): {movie_data.get('title')}"))
-                        continue
-
-    # Skip if already exists
-                    if Movie.objects.filter(tmdb_id=movie_data['id']).exists():
-                        continue
-
-
-                    
-                    
-                    # Prepare movie data
-                    movie = Movie(
-                        title=movie_data['title'],
-                        overview=movie_data['overview'],
-                        release_date=datetime.datetime.strptime(movie_data['release_date'], '%Y-%m-%d').date() if movie_data.get('release_date') else datetime.date.today(),
-                        poster_path=f"https://image.tmdb.org/t/p/w500{movie_data['poster_path']}" if movie_data.get('poster_path') else None,
-                        backdrop_path=f"https://image.tmdb.org/t/p/original{movie_data['backdrop_path']}" if movie_data.get('backdrop_path') else None,
-                        tmdb_id=movie_data['id'],
-                        popularity=movie_data['popularity'],
-                        vote_average=movie_data['vote_average'],
-                        vote_count=movie_data['vote_count']
-                    )
-                    movie.save()
-                    
-                    # Add genres
-                    for genre_id in movie_data.get('genre_ids', []):
-                        if genre_id in tmdb_genre_map:
-                            try:
-                                genre = Genre.objects.get(name=tmdb_genre_map[genre_id])
-                                movie.genres.add(genre)
-                            except Genre.DoesNotExist:
-                                pass
-                    
-                    created_count += 1
-                    self.stdout.write(f"Created movie: {movie.title}")
-                
-                page += 1
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Error: {str(e)}'))
-                break
-                
-        self.stdout.write(f"Created {created_count} movies from TMDB API")
+        created_count, skipped_count = self.ingest('movie/popular', count, {'language': 'en-US'}, api_key)
+        self.stdout.write(f"Created {created_count} movies from TMDB API, skipped {skipped_count} malformed records")
 
     def fetch_nepali_movies(self, count):
         """Fetch Nepali movies from TMDB API"""
@@ -263,63 +185,22 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR('TMDB_API_KEY not found in environment variables'))
             return
 
-        tmdb_genre_map = {
-            28: "Action", 12: "Adventure", 16: "Animation", 35: "Comedy",
-            80: "Crime", 99: "Documentary", 18: "Drama", 10751: "Family",
-            14: "Fantasy", 36: "History", 27: "Horror", 10402: "Music",
-            9648: "Mystery", 10749: "Romance", 878: "Science Fiction",
-            53: "Thriller", 10752: "War", 37: "Western"
-        }
-
-        url = f"https://api.themoviedb.org/3/discover/movie?api_key={api_key}&with_original_language=ne&sort_by=popularity.desc"
-        created_count, page = 0, 1
-
-        while created_count < count:
-            response = requests.get(f"{url}&page={page}")
-            if response.status_code != 200:
-                self.stdout.write(self.style.ERROR(f'Error fetching from TMDB: {response.status_code}'))
-                break
-
-            data = response.json()
-            if not data.get('results'):
-                break
-
-            for movie_data in data['results']:
-                if created_count >= count:
-                    break
-
-                title_lower = movie_data.get('title', '').lower()
-                overview_lower = movie_data.get('overview', '').lower()
-                if 'sex' in title_lower or 'sex' in overview_lower:
-                    continue
-
-                if Movie.objects.filter(tmdb_id=movie_data['id']).exists():
-                    continue
-
-                movie = Movie(
-                    title=movie_data['title'],
-                    overview=movie_data['overview'],
-                    release_date=datetime.datetime.strptime(movie_data['release_date'], '%Y-%m-%d').date() if movie_data.get('release_date') else datetime.date.today(),
-                    poster_path=f"https://image.tmdb.org/t/p/w500{movie_data['poster_path']}" if movie_data.get('poster_path') else None,
-                    backdrop_path=f"https://image.tmdb.org/t/p/original{movie_data['backdrop_path']}" if movie_data.get('backdrop_path') else None,
-                    tmdb_id=movie_data['id'],
-                    popularity=movie_data['popularity'],
-                    vote_average=movie_data['vote_average'],
-                    vote_count=movie_data['vote_count']
-                )
-                movie.save()
-
-                for genre_id in movie_data.get('genre_ids', []):
-                    if genre_id in tmdb_genre_map:
-                        try:
-                            genre = Genre.objects.get(name=tmdb_genre_map[genre_id])
-                            movie.genres.add(genre)
-                        except Genre.DoesNotExist:
-                            pass
-
-                created_count += 1
-                self.stdout.write(f"Created Nepali movie: {movie.title}")
-
-            page += 1
-
-        self.stdout.write(f"Created {created_count} Nepali movies from TMDB API")
+        created_count, skipped_count = self.ingest(
+            'discover/movie', count, {'with_original_language': 'ne', 'sort_by': 'popularity.desc'}, api_key,
+        )
+        self.stdout.write(
+            f"Created {created_count} Nepali movies from TMDB API, skipped {skipped_count} malformed records"
+        )
+
+    def ingest(self, path, count, params, api_key):
+        """
+        Run the concurrent TMDB ingestion pipeline (see movies.ingest),
+        reporting errors. Returns the movies created and records skipped.
+        """
+        writer = MovieWriter(ingest_options()['BATCH_SIZE'])
+        try:
+            ingest_tmdb(path, count, params, api_key=api_key, writer=writer, log=self.stdout.write)
+        except requests.RequestException as e:
+            # Movies fetched before the error have been written
+            self.stdout.write(self.style.ERROR(f'Error fetching from TMDB: {e}'))
+        return writer.written, writer.skipped
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from movies.factorization import artifact_path, train_factor_model
+
+
+class Command(BaseCommand):
+    help = 'Train the matrix-factorization recommender (ALS) on all ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=32, help='Number of latent factors')
+        parser.add_argument('--iterations', type=int, default=10, help='Number of ALS sweeps')
+        parser.add_argument('--regularization', type=float, default=0.1, help='L2 penalty per rating')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the initial factors')
+
+    def handle(self, *args, **options):
+        def report(iteration, rmse):
+            self.stdout.write(f"Iteration {iteration}: training RMSE {rmse:.4f}")
+
+        model = train_factor_model(
+            n_factors=options['factors'],
+            iterations=options['iterations'],
+            regularization=options['regularization'],
+            seed=options['seed'],
+            callback=report,
+        )
+        if model is None:
+            self.stdout.write(self.style.WARNING('No ratings to train on'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {model.n_factors}-factor model for {len(model.user_ids)} users and "
+            f"{len(model.movie_ids)} movies ({model.version}) to {artifact_path()}"
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from movies.trending import decay_scores, rebuild_scores
+
+
+class Command(BaseCommand):
+    help = 'Decay and prune trending scores, or rebuild them from recent activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Recompute every score from recent favorites, watchlist entries and ratings'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            scored = rebuild_scores()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt trending scores for {scored} movies"))
+            return
+        updated, pruned = decay_scores()
+        self.stdout.write(self.style.SUCCESS(f"Decayed {updated} trending scores, pruned {pruned}"))
@@ -0,0 +1,80 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# External-content FTS5 index over Movie.title/overview. The triggers keep it
+# in sync with every write to movies_movie, including bulk inserts and raw
+# SQL, so no application code has to remember to update it.
+#
+# SQLite drops a table's triggers when the table is rebuilt, which Django's
+# SQLite schema editor does for most field changes on movies_movie. A later
+# migration that rebuilds the table must create these triggers again (and
+# rebuild the index); movies.search.search_available() turns the index off
+# while they are missing and SearchTests fails on it.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE movies_movie_fts USING fts5(
+        title, overview,
+        content='movies_movie', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER movies_movie_fts_insert AFTER INSERT ON movies_movie BEGIN
+        INSERT INTO movies_movie_fts(rowid, title, overview) VALUES (new.id, new.title, new.overview);
+    END
+    """,
+    """
+    CREATE TRIGGER movies_movie_fts_delete AFTER DELETE ON movies_movie BEGIN
+        INSERT INTO movies_movie_fts(movies_movie_fts, rowid, title, overview)
+        VALUES ('delete', old.id, old.title, old.overview);
+    END
+    """,
+    """
+    CREATE TRIGGER movies_movie_fts_update AFTER UPDATE OF title, overview ON movies_movie BEGIN
+        INSERT INTO movies_movie_fts(movies_movie_fts, rowid, title, overview)
+        VALUES ('delete', old.id, old.title, old.overview);
+        INSERT INTO movies_movie_fts(rowid, title, overview) VALUES (new.id, new.title, new.overview);
+    END
+    """,
+    "INSERT INTO movies_movie_fts(movies_movie_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS movies_movie_fts_update",
+    "DROP TRIGGER IF EXISTS movies_movie_fts_delete",
+    "DROP TRIGGER IF EXISTS movies_movie_fts_insert",
+    "DROP TABLE IF EXISTS movies_movie_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # Other databases keep using the icontains fallback in movies.search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_SQL[0])
+        except OperationalError:
+            # SQLite built without FTS5
+            return
+        for statement in CREATE_SQL[1:]:
+            cursor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in DROP_SQL:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_movie_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_histograms(apps, schema_editor):
+    Rating = apps.get_model('movies', 'Rating')
+    RatingHistogramBin = apps.get_model('movies', 'RatingHistogramBin')
+    counts = Rating.objects.order_by().values('movie_id', 'rating').annotate(total=Count('id'))
+    RatingHistogramBin.objects.bulk_create(
+        (
+            RatingHistogramBin(movie_id=row['movie_id'], rating=row['rating'], count=row['total'])
+            for row in counts.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_trendingscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingHistogramBin',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_histogram', to='movies.movie')),
+            ],
+            options={
+                'unique_together': {('movie', 'rating')},
+            },
+        ),
+        migrations.RunPython(backfill_rating_histograms, migrations.RunPython.noop),
+    ]
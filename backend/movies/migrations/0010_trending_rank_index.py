@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_pendingneighborupdate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trendingscore',
+            name='rank_key',
+            field=models.FloatField(),
+        ),
+        migrations.AddIndex(
+            model_name='trendingscore',
+            index=models.Index(fields=['-rank_key', 'movie'], name='trending_rank_movie_idx'),
+        ),
+    ]
@@ -1,7 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Avg
 
 class Genre(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -23,6 +22,10 @@ class Movie(models.Model):
         default=0
     )
     vote_count = models.IntegerField(default=0)
+    # Maintained from Rating writes by movies.signals, repaired by `manage.py refresh_rating_aggregates`
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_average = models.FloatField(null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -31,10 +34,15 @@ class Movie(models.Model):
     
     @property
     def average_rating(self):
-        return self.ratings.aggregate(Avg('rating'))['rating__avg']
+        return self.rating_average
     
     class Meta:
         ordering = ['-popularity']
+        indexes = [
+            # The default list order, -popularity then id (see MovieViewSet.get_pagination_ordering)
+            models.Index(fields=['-popularity', 'id'], name='movie_popularity_id_idx'),
+            models.Index(fields=['release_date'], name='movie_release_date_idx'),
+        ]
 
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites')
@@ -44,6 +52,9 @@ class Favorite(models.Model):
     class Meta:
         unique_together = ('user', 'movie')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['movie', 'created_at'], name='favorite_movie_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.movie.title}"
@@ -61,9 +72,35 @@ class Rating(models.Model):
     class Meta:
         unique_together = ('user', 'movie')
         ordering = ['-created_at']
+        indexes = [
+            # A user's highly rated movies, which seed content-based recommendations
+            models.Index(fields=['user', 'rating'], name='rating_user_rating_idx'),
+            # A movie's ratings feed, newest first
+            models.Index(fields=['movie', '-created_at', 'id'], name='rating_movie_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.movie.title} - {self.rating}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored value so a save can apply just the difference to the movie's aggregates
+        instance._stored_rating = instance.__dict__.get('rating')
+        instance._stored_movie_id = instance.__dict__.get('movie_id')
+        return instance
+
+class RatingHistogramBin(models.Model):
+    """How many ratings of one value a movie has, maintained by movies.signals"""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='rating_histogram')
+    rating = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('movie', 'rating')
+    
+    def __str__(self):
+        return f"{self.movie_id} - {self.rating}: {self.count}"
 
 class Watchlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='watchlist')
@@ -76,3 +113,64 @@ class Watchlist(models.Model):
     
     def __str__(self):
         return f"{self.user.username} - {self.movie.title}"
+
+
+class ItemNeighbor(models.Model):
+    """Precomputed item-item collaborative similarity, top-k neighbours per movie"""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='item_neighbors')
+    neighbor = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('movie', 'neighbor')
+        ordering = ['-score']
+
+    def __str__(self):
+        return f"{self.movie.title} ~ {self.neighbor.title} ({self.score:.3f})"
+
+
+class PendingNeighborUpdate(models.Model):
+    """A movie whose ratings changed since its item neighbours were last updated"""
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    queued_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.movie_id} (queued {self.queued_at})"
+
+
+class UserRecommendation(models.Model):
+    """Top-N recommendations precomputed offline by `precompute_recommendations`"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='precomputed_recommendations')
+    recommendation_type = models.CharField(max_length=20)
+    movie_ids = models.JSONField(default=list)
+    model_version = models.CharField(max_length=100)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'recommendation_type')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.recommendation_type} ({len(self.movie_ids)})"
+
+
+class TrendingScore(models.Model):
+    """
+    Exponentially decayed activity score of a movie (see movies.trending).
+
+    `rank_key` is ln(score) shifted by the time of the last update, which
+    makes it constant while the score decays, so ordering by it is always
+    ordering by the current score.
+    """
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    rank_key = models.FloatField()
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # The trending list, best first (see MovieViewSet.get_pagination_sections)
+            models.Index(fields=['-rank_key', 'movie'], name='trending_rank_movie_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie.title} ({self.score:.2f})"
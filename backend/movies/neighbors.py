@@ -0,0 +1,84 @@
+import numpy as np
+
+# Upper bound on the dense similarity block materialised per chunk (float32
+# cells). 2**25 cells is 128 MB regardless of the catalog size.
+DEFAULT_BLOCK_CELLS = 2 ** 25
+
+
+class NeighborIndex:
+    """
+    Precomputed top-k most similar rows for every row of a movie matrix.
+
+    `neighbors[i]` holds the row indices of the k best matches of row i,
+    best first, and `scores[i]` the matching cosine similarities. Movies
+    sharing no terms score 0 and are not neighbours: lookups and aggregates
+    leave out entries scoring 0 or less, as well as the -1 entries left
+    after rows added by `ContentModel.add_movies`. Memory is O(N * k).
+    """
+
+    def __init__(self, neighbors, scores):
+        self.neighbors = neighbors
+        self.scores = scores
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    def __len__(self):
+        return self.neighbors.shape[0]
+
+    def lookup(self, row):
+        """Return (rows, scores) for the neighbours of `row`, best first"""
+        rows, scores = self.neighbors[row], self.scores[row]
+        valid = (rows >= 0) & (scores > 0)
+        return rows[valid], scores[valid]
+
+    def aggregate(self, rows):
+        """
+        Sum the neighbour scores of several rows.
+
+        Returns (candidate_rows, summed_scores) in no particular order. This is
+        the neighbourhood approximation of adding up full similarity rows and
+        costs O(len(rows) * k).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        neighbors = self.neighbors[rows].ravel()
+        scores = self.scores[rows].ravel()
+        valid = (neighbors >= 0) & (scores > 0)
+        candidates, inverse = np.unique(neighbors[valid], return_inverse=True)
+        return candidates, np.bincount(inverse, weights=scores[valid]).astype(np.float32)
+
+    @classmethod
+    def build(cls, matrix, k, block_cells=DEFAULT_BLOCK_CELLS):
+        """
+        Build the index from an L2-normalised CSR matrix.
+
+        Similarities are computed one block of rows at a time so that only a
+        (chunk x N) slab is ever dense, and the k best of each row are picked
+        with `argpartition` instead of a full sort.
+        """
+        n_rows = matrix.shape[0]
+        k = max(0, min(k, n_rows - 1))
+        neighbors = np.full((n_rows, k), -1, dtype=np.int32)
+        scores = np.zeros((n_rows, k), dtype=np.float32)
+        if k == 0:
+            return cls(neighbors, scores)
+
+        matrix_t = matrix.T.tocsc()
+        chunk_size = max(1, block_cells // max(n_rows, 1))
+        for start in range(0, n_rows, chunk_size):
+            end = min(start + chunk_size, n_rows)
+            block = (matrix[start:end] @ matrix_t).toarray().astype(np.float32, copy=False)
+            local = np.arange(end - start)
+            # A movie is never its own neighbour
+            block[local, local + start] = -np.inf
+
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            neighbors[start:end] = np.take_along_axis(top, order, axis=1)
+            scores[start:end] = np.take_along_axis(top_scores, order, axis=1)
+
+        return cls(neighbors, scores)
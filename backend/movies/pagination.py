@@ -0,0 +1,184 @@
+import json
+from datetime import date
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from django.db.models.expressions import Col
+from django.db.models.sql.constants import LOUTER
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+def _nullable(queryset, name):
+    annotation = queryset.query.annotations.get(name)
+    if isinstance(annotation, Col):
+        # A column of a joined table, NULL when it is nullable or the join outer
+        join = queryset.query.alias_map.get(annotation.alias)
+        return annotation.target.null or getattr(join, 'join_type', None) == LOUTER
+    try:
+        return queryset.model._meta.get_field(name).null
+    except FieldDoesNotExist:
+        # Other annotations may be NULL and have no index to protect
+        return True
+
+
+def _order_expression(name, descending, nullable):
+    # Explicit NULL placement only where needed, so NOT NULL columns keep a
+    # plain ORDER BY that can walk an index on any backend
+    if not nullable:
+        return F(name).desc() if descending else F(name).asc()
+    return F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_first=True)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on the full ordering key.
+
+    DRF's CursorPagination filters on the first ordering field only and
+    skips ties with an OFFSET, which degrades (and stops working after
+    `offset_cutoff` rows) when many rows share a value, e.g. movies with
+    no favorites under `trending=true`. Here the cursor stores the values
+    of every ordering field and the last field must be unique (normally
+    `id`), so each page is a single
+    `WHERE (a, b, id) < (...) ORDER BY a, b, id LIMIT n` seek whose cost
+    does not depend on how deep the page is.
+
+    Views choose the ordering through `get_pagination_ordering()` or a
+    `pagination_ordering` attribute. NULLs sort as the smallest value in
+    both directions on every backend.
+
+    A view may instead split its list into sections with
+    `get_pagination_sections(queryset)`, a list of (queryset, ordering)
+    pairs paged one after the other, each seeking on its own ordering
+    (and so its own index); the cursor then also records the section.
+    """
+    ordering = ('-created_at', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        if hasattr(view, 'get_pagination_ordering'):
+            return tuple(view.get_pagination_ordering())
+        return tuple(getattr(view, 'pagination_ordering', self.ordering))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        sections = view.get_pagination_sections(queryset) if hasattr(view, 'get_pagination_sections') else None
+        self.sectioned = sections is not None
+        if sections is None:
+            sections = [(queryset, self.get_ordering(request, queryset, view))]
+        self.sections = [(section, tuple(ordering)) for section, ordering in sections]
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+        section, after = (position[0], position[1:]) if self.sectioned and position is not None else (0, position)
+
+        # One extra row tells whether there is anything beyond this page;
+        # a section that runs out hands over to the next one's start (or
+        # the previous one's end, going backwards)
+        rows = []
+        while 0 <= section < len(self.sections) and len(rows) <= self.page_size:
+            found = self._seek(section, after, reverse, self.page_size + 1 - len(rows))
+            rows += [(section, instance) for instance in found]
+            section += -1 if reverse else 1
+            after = None
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        # An empty page keeps pointing at the cursor it was requested with
+        self.page = [instance for _, instance in rows]
+        current = json.dumps(position) if position is not None else None
+        self.next_position = self._position(*rows[-1]) if rows else current
+        self.previous_position = self._position(*rows[0]) if rows else current
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def _seek(self, section, position, reverse, limit):
+        """Up to `limit` rows of a section after `position`, or from its start"""
+        queryset, names = self.sections[section]
+        ordering = [
+            (name.lstrip('-'), name.startswith('-') != reverse, _nullable(queryset, name.lstrip('-')))
+            for name in names
+        ]
+        queryset = queryset.order_by(*[
+            _order_expression(name, descending, nullable) for name, descending, nullable in ordering
+        ])
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+        return list(queryset[:limit])
+
+    def _after(self, ordering, position):
+        """Rows strictly after `position` in `ordering`, as a Q"""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending, nullable), value in zip(ordering, position):
+            if value is None:
+                after = None if descending else Q(**{f"{name}__isnull": False})
+                same = Q(**{f"{name}__isnull": True})
+            else:
+                after = Q(**{f"{name}__lt" if descending else f"{name}__gt": value})
+                if descending and nullable:
+                    after |= Q(**{f"{name}__isnull": True})
+                same = Q(**{name: value})
+
+            if after is not None:
+                condition |= equal & after
+            equal &= same
+        # A range on the leading key as well, which the OR above hides from
+        # the planner, so the page seeks into the index instead of scanning
+        # up to the cursor
+        (name, descending, nullable), value = ordering[0], position[0]
+        if value is not None and not nullable:
+            condition &= Q(**{f"{name}__lte" if descending else f"{name}__gte": value})
+        return condition
+
+    def _position(self, section, instance):
+        values = [section] if self.sectioned else []
+        for name in self.sections[section][1]:
+            name = name.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            values.append(value.isoformat() if isinstance(value, date) else value)
+        return json.dumps(values)
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+        try:
+            position = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list):
+            raise NotFound(self.invalid_cursor_message)
+        section = 0
+        if self.sectioned:
+            section = position[0] if position else None
+            if not isinstance(section, int) or not 0 <= section < len(self.sections):
+                raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.sections[section][1]) + self.sectioned:
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
@@ -0,0 +1,157 @@
+import multiprocessing
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .factorization import get_factor_model
+from .models import Rating, UserRecommendation
+from .rating_matrix import RatingMatrix, enough_collaborative_data, score_user_user
+
+PRECOMPUTED_TYPES = ('collaborative', 'mf')
+
+# Read-only arrays used by pool workers. Filled in the parent before the pool
+# is created, so forked workers share the pages copy-on-write.
+_shared = {}
+
+
+def _init_worker(shared):
+    # Only used when the platform cannot fork, each worker gets its own copy
+    _shared.update(shared)
+
+
+def score_users(user_rows):
+    """
+    Worker: compute recommendations for a chunk of rating-matrix rows.
+
+    Touches only the shared arrays, never the database. Returns the number
+    of rows scored and a list of (user_id, recommendation_type, movie_ids).
+    """
+    ratings = _shared['ratings']
+    factors = _shared.get('factors')
+    top_n = _shared['top_n']
+    results = []
+    for row in user_rows:
+        user_id = int(ratings.user_ids[row])
+        if 'collaborative' in _shared['types']:
+            columns, _ = score_user_user(ratings, row, top_n)
+            results.append((user_id, 'collaborative', ratings.movie_ids[columns].tolist()))
+        if 'mf' in _shared['types'] and factors is not None:
+            factor_row = factors.user_row(user_id)
+            if factor_row is not None:
+                rated = ratings.movie_ids[ratings.matrix[row].indices]
+                columns, _ = factors.recommend(factor_row, top_n, exclude=factors.columns_of(rated))
+                results.append((user_id, 'mf', factors.movie_ids[columns].tolist()))
+    return len(user_rows), results
+
+
+def data_versions(factors):
+    """Version token per type: the rating snapshot for CF, the trained model for MF"""
+    snapshot = Rating.objects.aggregate(count=Count('id'), last=Max('updated_at'))
+    last = snapshot['last'].isoformat() if snapshot['last'] else ''
+    return {
+        'collaborative': f"ratings-{snapshot['count']}-{last}",
+        'mf': factors.version if factors is not None else '',
+    }
+
+
+def write_results(results, versions):
+    """Upsert one chunk of results in a single statement"""
+    now = timezone.now()
+    UserRecommendation.objects.bulk_create(
+        [
+            UserRecommendation(
+                user_id=user_id, recommendation_type=recommendation_type, movie_ids=movie_ids,
+                model_version=versions[recommendation_type], computed_at=now,
+            )
+            for user_id, recommendation_type, movie_ids in results
+        ],
+        update_conflicts=True,
+        unique_fields=['user', 'recommendation_type'],
+        update_fields=['movie_ids', 'model_version', 'computed_at'],
+    )
+
+
+def precompute_recommendations(types=PRECOMPUTED_TYPES, top_n=10, workers=1, chunk_size=500,
+                               resume=False, progress=None):
+    """
+    Compute and store top-N recommendations for every user with ratings.
+
+    Users are split into chunks scored on a process pool; each finished chunk
+    is written and committed on its own, so an interrupted run can continue
+    with `resume=True`, which skips users whose rows already match the
+    current data versions. `progress(done, total)` is called after each chunk.
+    Returns the number of users scored.
+
+    Lists shorter than a request's top-N are left to the live path, which
+    fills them with content-based movies (see get_recommendations), and
+    while there is too little data for collaborative filtering no
+    collaborative lists are stored, as the live path would not use it.
+    """
+    types = tuple(t for t in types if t in PRECOMPUTED_TYPES)
+    ratings = RatingMatrix.load()
+    if 'collaborative' in types and not enough_collaborative_data(ratings):
+        UserRecommendation.objects.filter(recommendation_type='collaborative').delete()
+        types = tuple(t for t in types if t != 'collaborative')
+    factors = get_factor_model() if 'mf' in types else None
+    versions = data_versions(factors)
+    # Centre once here so workers inherit it instead of each recomputing it
+    ratings.centered()
+
+    rows = np.arange(len(ratings.user_ids))
+    if resume:
+        done = {}
+        for user_id, recommendation_type in UserRecommendation.objects.filter(
+            recommendation_type__in=types,
+        ).filter(
+            model_version__in=[versions[t] for t in types],
+        ).values_list('user_id', 'recommendation_type'):
+            done[user_id] = done.get(user_id, 0) + 1
+        finished = np.array([uid for uid, count in done.items() if count == len(types)], dtype=np.int64)
+        rows = rows[~np.isin(ratings.user_ids, finished)]
+
+    chunks = [rows[start:start + chunk_size] for start in range(0, len(rows), chunk_size)]
+    shared = {'ratings': ratings, 'factors': factors, 'types': types, 'top_n': top_n}
+    _shared.update(shared)
+
+    done_users = 0
+    if workers <= 1 or len(chunks) <= 1:
+        results_iter = map(score_users, chunks)
+        pool = None
+    else:
+        # Forked children must not reuse the parent's database connections
+        connections.close_all()
+        if 'fork' in multiprocessing.get_all_start_methods():
+            pool = multiprocessing.get_context('fork').Pool(workers)
+        else:
+            pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(shared,))
+        results_iter = pool.imap_unordered(score_users, chunks)
+
+    try:
+        for scored, results in results_iter:
+            write_results(results, versions)
+            done_users += scored
+            if progress is not None:
+                progress(done_users, len(rows))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _shared.clear()
+    return done_users
+
+
+def precomputed_movie_ids(user_id, recommendation_type):
+    """Stored recommendations for the user, or None when there is no fresh row"""
+    if recommendation_type not in PRECOMPUTED_TYPES:
+        return None
+    max_age = getattr(settings, 'RECOMMENDER_PRECOMPUTED_MAX_AGE', timedelta(hours=24))
+    movie_ids = UserRecommendation.objects.filter(
+        user_id=user_id,
+        recommendation_type=recommendation_type,
+        computed_at__gte=timezone.now() - max_age,
+    ).values_list('movie_ids', flat=True).first()
+    return movie_ids or None
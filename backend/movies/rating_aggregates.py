@@ -0,0 +1,117 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Now
+
+from .models import Movie, Rating, RatingHistogramBin
+
+# Values a rating can take (see Rating.rating)
+RATING_VALUES = range(1, 11)
+
+
+def apply_rating_delta(movie_id, sum_delta, count_delta):
+    """
+    Adjust a movie's stored rating aggregates by the given deltas.
+
+    A single UPDATE computes the new sum, count and average from the
+    current column values, so concurrent writers never lose each other's
+    changes. `updated_at` is bumped because the average is part of the
+    movie's representation.
+    """
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('rating_count') + count_delta
+    Movie.objects.filter(pk=movie_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        # The condition sees the old count, so "old > -delta" means "new > 0"
+        rating_average=Case(
+            When(rating_count__gt=-count_delta, then=new_sum * 1.0 / new_count),
+            default=None,
+            output_field=FloatField(),
+        ),
+        updated_at=Now(),
+    )
+
+
+def apply_histogram_delta(movie_id, rating, delta):
+    """Adjust the number of `rating` ratings of a movie, creating its bin on first use"""
+    bins = RatingHistogramBin.objects.filter(movie_id=movie_id, rating=rating)
+    if bins.update(count=F('count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            RatingHistogramBin.objects.create(movie_id=movie_id, rating=rating, count=delta)
+    except IntegrityError:
+        # Another request created the bin first
+        bins.update(count=F('count') + delta)
+
+
+def rating_histogram(movie_id):
+    """{rating value: number of ratings} of a movie, with every value present"""
+    histogram = dict.fromkeys(RATING_VALUES, 0)
+    histogram.update(
+        RatingHistogramBin.objects.filter(movie_id=movie_id, count__gt=0).values_list('rating', 'count')
+    )
+    return histogram
+
+
+def refresh_rating_histograms(movie_ids=None):
+    """
+    Recount the histogram bins of `movie_ids` (or every movie) from the
+    Rating table, rewriting only the bins that drifted. Returns the number
+    of bins fixed.
+    """
+    ratings = Rating.objects.order_by()
+    bins = RatingHistogramBin.objects.order_by()
+    if movie_ids is not None:
+        movie_ids = list(movie_ids)
+        ratings = ratings.filter(movie_id__in=movie_ids)
+        bins = bins.filter(movie_id__in=movie_ids)
+
+    actual = {
+        (movie_id, rating): total
+        for movie_id, rating, total in ratings.values('movie_id', 'rating')
+        .annotate(total=Count('id')).values_list('movie_id', 'rating', 'total').iterator()
+    }
+    stored = {
+        (movie_id, rating): (pk, count)
+        for pk, movie_id, rating, count in bins.values_list('pk', 'movie_id', 'rating', 'count').iterator()
+    }
+    # Bins emptied by deletes stay behind with a count of 0, which is not drift
+    drifted = [key for key in stored.keys() | actual.keys() if stored.get(key, (None, 0))[1] != actual.get(key, 0)]
+    stale = [stored[key][0] for key in drifted if key in stored]
+    fresh = [
+        RatingHistogramBin(movie_id=movie_id, rating=rating, count=actual[movie_id, rating])
+        for movie_id, rating in drifted if (movie_id, rating) in actual
+    ]
+    with transaction.atomic():
+        for start in range(0, len(stale), 500):
+            RatingHistogramBin.objects.filter(pk__in=stale[start:start + 500]).delete()
+        RatingHistogramBin.objects.bulk_create(fresh, batch_size=500)
+    return len(drifted)
+
+
+def refresh_rating_aggregates(movie_ids=None):
+    """
+    Recompute stored aggregates and histograms from the Rating table for
+    `movie_ids` (or every movie) and fix the rows that drifted, e.g. after
+    bulk inserts that bypass signals. Returns the number of movies whose
+    aggregates were repaired.
+    """
+    if movie_ids is not None:
+        movie_ids = list(movie_ids)
+    refresh_rating_histograms(movie_ids)
+    ratings = Rating.objects.filter(movie=OuterRef('pk')).order_by().values('movie')
+    actual_sum = Coalesce(Subquery(ratings.annotate(total=Sum('rating')).values('total')), Value(0))
+    actual_count = Coalesce(Subquery(ratings.annotate(total=Count('id')).values('total')), Value(0))
+    actual_average = Subquery(ratings.annotate(average=Avg('rating')).values('average'))
+
+    movies = Movie.objects.all() if movie_ids is None else Movie.objects.filter(pk__in=movie_ids)
+    stale = movies.annotate(actual_sum=actual_sum, actual_count=actual_count).filter(
+        ~Q(rating_sum=F('actual_sum')) | ~Q(rating_count=F('actual_count'))
+    )
+    return Movie.objects.filter(pk__in=stale.values('pk')).update(
+        rating_sum=actual_sum,
+        rating_count=actual_count,
+        rating_average=actual_average,
+        updated_at=Now(),
+    )
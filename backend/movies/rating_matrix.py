@@ -0,0 +1,131 @@
+from itertools import chain
+
+import numpy as np
+import scipy.sparse as sp
+from django.contrib.auth.models import User
+
+from .models import Movie, Rating
+
+
+class RatingMatrix:
+    """
+    Sparse user x movie rating matrix.
+
+    Only users and movies with at least one rating get a row/column, and
+    `user_ids` / `movie_ids` (both sorted ascending) map them back to primary
+    keys. Memory is proportional to the number of ratings.
+    """
+
+    def __init__(self, matrix, user_ids, movie_ids):
+        self.matrix = matrix
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self._centered = None
+
+    @classmethod
+    def from_triples(cls, user_ids, movie_ids, ratings):
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        unique_users, rows = np.unique(user_ids, return_inverse=True)
+        unique_movies, cols = np.unique(movie_ids, return_inverse=True)
+        matrix = sp.csr_matrix(
+            (np.asarray(ratings, dtype=np.float32), (rows, cols)),
+            shape=(len(unique_users), len(unique_movies)),
+        )
+        return cls(matrix, unique_users, unique_movies)
+
+    @classmethod
+    def load(cls, queryset=None):
+        """Build the matrix from a single `values_list` query over Rating"""
+        queryset = Rating.objects.all() if queryset is None else queryset
+        rows = queryset.order_by().values_list('user_id', 'movie_id', 'rating')
+        triples = np.fromiter(
+            chain.from_iterable(rows.iterator(chunk_size=10000)), dtype=np.int64,
+        ).reshape(-1, 3)
+        return cls.from_triples(triples[:, 0], triples[:, 1], triples[:, 2])
+
+    @property
+    def nnz(self):
+        return self.matrix.nnz
+
+    def user_row(self, user_id):
+        idx = int(np.searchsorted(self.user_ids, user_id))
+        if idx < len(self.user_ids) and self.user_ids[idx] == user_id:
+            return idx
+        return None
+
+    def user_means(self):
+        counts = np.diff(self.matrix.indptr)
+        sums = np.asarray(self.matrix.sum(axis=1)).ravel()
+        return np.divide(sums, counts, out=np.zeros(len(counts), dtype=np.float64), where=counts > 0)
+
+    def centered(self):
+        """
+        Return (centered, means): each user's ratings minus their mean, with
+        the same sparsity pattern as the original matrix.
+        """
+        if self._centered is None:
+            means = self.user_means()
+            counts = np.diff(self.matrix.indptr)
+            data = self.matrix.data - np.repeat(means, counts).astype(np.float32)
+            centered = sp.csr_matrix(
+                (data, self.matrix.indices.copy(), self.matrix.indptr.copy()),
+                shape=self.matrix.shape,
+            )
+            self._centered = (centered, means)
+        return self._centered
+
+
+def enough_collaborative_data(ratings):
+    """
+    Whether there are enough users, movies and ratings for user-user
+    collaborative filtering; below that, recommendations are content-based.
+    """
+    return ratings.nnz >= 10 and User.objects.count() >= 5 and Movie.objects.count() >= 5
+
+
+def score_user_user(ratings, user_row, top_n, n_neighbors=10):
+    """
+    User-user collaborative filtering for one user, fully vectorised.
+
+    Finds the `n_neighbors` users whose mean-centred ratings are most
+    cosine-similar to the target, predicts every movie they rated as
+    mean + weighted average of their centred ratings, and returns
+    (movie_columns, predicted_ratings) for the best `top_n` movies the target
+    has not rated yet.
+    """
+    centered, means = ratings.centered()
+    n_users = centered.shape[0]
+    empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+    if n_users < 2:
+        return empty
+
+    norms = np.sqrt(np.asarray(centered.multiply(centered).sum(axis=1)).ravel())
+    target = centered[user_row]
+    dots = (centered @ target.T).toarray().ravel()
+    denom = norms * norms[user_row]
+    similarity = np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+    similarity[user_row] = -np.inf
+
+    # Top similar users (excluding self)
+    n_neighbors = min(n_neighbors, n_users - 1)
+    neighbors = np.argpartition(-similarity, n_neighbors - 1)[:n_neighbors]
+    weights = similarity[neighbors]
+
+    # Weighted sum of neighbour ratings and of the weights of neighbours who rated each movie
+    rated = ratings.matrix[neighbors].copy()
+    rated.data = np.ones_like(rated.data)
+    numerator = centered[neighbors].T @ weights
+    total_weight = rated.T @ weights
+
+    candidates = total_weight > 0
+    candidates[ratings.matrix[user_row].indices] = False
+    columns = np.flatnonzero(candidates)
+    if not len(columns):
+        return empty
+
+    predictions = numerator[columns] / total_weight[columns] + means[user_row]
+    top_n = min(top_n, len(columns))
+    top = np.argpartition(-predictions, top_n - 1)[:top_n]
+    top = top[np.argsort(-predictions[top], kind='stable')]
+    return columns[top], predictions[top]
@@ -1,87 +1,146 @@
+import os
+
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from .models import Movie, Rating
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from django.conf import settings
+from .models import ItemNeighbor, Movie, Rating
+from .content_model import get_content_model
+from .rating_matrix import RatingMatrix, enough_collaborative_data, score_user_user
+from .factorization import get_factor_model
+from . import content_model, factorization
 from django.contrib.auth.models import User
 
+def movies_in_order(movie_ids):
+    """Fetch movies for `movie_ids` in one query, preserving the given order"""
+    movie_map = Movie.objects.in_bulk(list(movie_ids))
+    return [movie_map[movie_id] for movie_id in movie_ids if movie_id in movie_map]
+
+
+def _top_rows(scores, top_n, exclude=()):
+    """Indices of the `top_n` highest scores, best first, skipping `exclude` rows"""
+    scores = scores.astype(np.float64, copy=True)
+    if len(exclude):
+        scores[np.asarray(exclude, dtype=np.int64)] = -np.inf
+    top_n = min(top_n, int(np.isfinite(scores).sum()))
+    if top_n <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, top_n - 1)[:top_n]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def model_version():
+    """
+    Cheap token identifying the model artifacts currently on disk, used to
+    key cached recommendations without loading the models.
+    """
+    parts = []
+    for path in (content_model.artifact_path(), factorization.artifact_path()):
+        try:
+            parts.append(str(os.stat(path).st_mtime_ns))
+        except OSError:
+            parts.append('0')
+    return '-'.join(parts)
+
+
+def _use_ann():
+    return getattr(settings, 'RECOMMENDER_CONTENT_INDEX', 'neighbors') == 'ann'
+
+
+def _similar_rows(model, movie_idx, top_n):
+    """Rows of the `top_n` movies most similar to row `movie_idx`"""
+    if _use_ann():
+        rows, _ = model.ann.query(model.matrix[movie_idx], top_n, exclude=[movie_idx])
+        if len(rows) >= top_n:
+            return rows
+    elif top_n <= model.neighbors.k:
+        # O(k) lookup in the precomputed neighbour index
+        rows, _ = model.neighbors.lookup(movie_idx)
+        return rows[:top_n]
+
+    # Rows are L2-normalised, so the dot product is the cosine similarity
+    sim_scores = (model.matrix @ model.matrix[movie_idx].T).toarray().ravel()
+    return _top_rows(sim_scores, top_n, exclude=[movie_idx])
+
+
+def _profile_rows(model, liked_rows, top_n):
+    """Rows of the `top_n` movies closest to a set of liked rows, excluding them"""
+    profile = csr_matrix(model.matrix[liked_rows].sum(axis=0))
+
+    if _use_ann():
+        rows, _ = model.ann.query(normalize(profile), top_n, exclude=liked_rows)
+        if len(rows) >= top_n:
+            return rows
+    else:
+        # Summed similarity with the user's liked movies, restricted to
+        # their precomputed neighbourhoods
+        candidates, sim_scores = model.neighbors.aggregate(liked_rows)
+        keep = ~np.isin(candidates, liked_rows)
+        candidates, sim_scores = candidates[keep], sim_scores[keep]
+        if len(candidates) >= top_n:
+            return candidates[_top_rows(sim_scores, top_n)]
+
+    # Not enough candidates to fill the list, score the whole catalog
+    sim_scores = (model.matrix @ profile.T).toarray().ravel()
+    # Filter out movies that user has already interacted with
+    return _top_rows(sim_scores, top_n, exclude=liked_rows)
+
+
 def get_content_based_recommendations(user_id=None, movie_id=None, top_n=10):
     """
     Content-Based Filtering: Recommends movies similar to a user's liked movies or a specific movie
     based on movie metadata (e.g., genre, overview, etc.)
-    
+
+    The TF-IDF model is built offline (see `build_content_model`) and loaded
+    lazily, so a request only pays for scoring against it. Candidates come
+    from the exact neighbour index or, with RECOMMENDER_CONTENT_INDEX = 'ann',
+    from the approximate IVF (spherical k-means) index.
+
     Args:
         user_id (int): User ID to get recommendations for (optional)
         movie_id (int): Movie ID to find similar movies for (optional)
         top_n (int): Number of recommendations to return
-    
+
     Returns:
         list: List of recommended movie objects
     """
-    # Get all movies
-    movies = list(Movie.objects.all())
-    
-    if len(movies) < 2:
-        return []
-    
-    # Create a corpus of movie metadata (combining overview and genre names)
-    corpus = []
-    for movie in movies:
-        genre_names = " ".join([genre.name for genre in movie.genres.all()])
-        metadata = f"{movie.title} {movie.overview} {genre_names}"
-        corpus.append(metadata.lower())
-    
-    # Use TF-IDF Vectorization
-    tfidf = TfidfVectorizer(stop_words='english')
-    tfidf_matrix = tfidf.fit_transform(corpus)
-    
-    # Calculate cosine similarity between movies
-    cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
-    
     if movie_id:
+        model = get_content_model()
+        if model is None:
+            return []
         # Get recommendations for a specific movie
-        try:
-            movie_idx = next(i for i, movie in enumerate(movies) if movie.id == movie_id)
-            sim_scores = list(enumerate(cosine_sim[movie_idx]))
-            sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-            sim_scores = sim_scores[1:top_n+1]  # Exclude the movie itself
-            movie_indices = [i[0] for i in sim_scores]
-            return [movies[i] for i in movie_indices]
-        except (StopIteration, IndexError):
+        movie_idx = model.row_of(int(movie_id))
+        if movie_idx is None:
             return []
-    
+        top = _similar_rows(model, movie_idx, top_n)
+        return movies_in_order(model.movie_ids[top].tolist())
+
     elif user_id:
         # Get recommendations based on user's favorite or highly-rated movies
         try:
             user = User.objects.get(id=user_id)
-            # Get user's favorites and highly rated movies
-            favorite_movie_ids = user.favorites.values_list('movie_id', flat=True)
-            highly_rated = Rating.objects.filter(user=user, rating__gte=7).values_list('movie_id', flat=True)
-            
+            # Get user's favorites and highly rated movies; the profile ignores
+            # their order, so the default ordering's sort is dropped
+            favorite_movie_ids = user.favorites.order_by().values_list('movie_id', flat=True)
+            highly_rated = Rating.objects.filter(user=user, rating__gte=7).order_by().values_list('movie_id', flat=True)
+
             movie_ids = list(favorite_movie_ids) + list(highly_rated)
             if not movie_ids:
                 # If user has no favorites or ratings, return popular movies
                 return Movie.objects.order_by('-popularity')[:top_n]
-            
-            # Calculate mean similarity with the user's liked movies
-            sim_scores = np.zeros(len(movies))
-            for movie_id in movie_ids:
-                try:
-                    movie_idx = next(i for i, movie in enumerate(movies) if movie.id == movie_id)
-                    sim_scores += cosine_sim[movie_idx]
-                except (StopIteration, IndexError):
-                    continue
-            
-            sim_scores = list(enumerate(sim_scores))
-            sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-            
-            # Filter out movies that user has already interacted with
-            sim_scores = [score for score in sim_scores if movies[score[0]].id not in movie_ids]
-            sim_scores = sim_scores[:top_n]
-            movie_indices = [i[0] for i in sim_scores]
-            return [movies[i] for i in movie_indices]
+
+            model = get_content_model()
+            if model is None:
+                return []
+            liked_rows = model.rows_of(movie_ids)
+            if not len(liked_rows):
+                return []
+
+            top = _profile_rows(model, liked_rows, top_n)
+            return movies_in_order(model.movie_ids[top].tolist())
         except User.DoesNotExist:
             return []
-    
+
     # If no user_id or movie_id is provided, return popular movies
     return Movie.objects.order_by('-popularity')[:top_n]
 
@@ -89,104 +148,34 @@ def get_content_based_recommendations(user_id=None, movie_id=None, top_n=10):
 def get_collaborative_filtering_recommendations(user_id, top_n=10):
     """
     Collaborative Filtering: Recommends movies based on user-item interactions
-    using a simplified matrix factorization approach.
-    
+    using user-user similarity over mean-centred ratings.
+
+    The ratings are loaded with one query into a sparse user x movie matrix
+    and every step (centering, neighbour selection, prediction) is a batched
+    sparse/dense operation.
+
     Args:
         user_id (int): User ID to get recommendations for
         top_n (int): Number of recommendations to return
-    
+
     Returns:
         list: List of recommended movie objects
     """
-    # Get all users, movies and ratings
-    users = User.objects.all()
-    movies = Movie.objects.all()
-    ratings = Rating.objects.all()
-    
-    if len(users) < 5 or len(movies) < 5 or len(ratings) < 10:
+    ratings = RatingMatrix.load()
+
+    if not enough_collaborative_data(ratings):
         # Not enough data for collaborative filtering, fall back to content-based
         return get_content_based_recommendations(user_id=user_id, top_n=top_n)
-    
-    # Create a user-item matrix
-    user_ids = list(users.values_list('id', flat=True))
-    movie_ids = list(movies.values_list('id', flat=True))
-    
-    # Map IDs to indices
-    user_idx_map = {user_id: idx for idx, user_id in enumerate(user_ids)}
-    movie_idx_map = {movie_id: idx for idx, movie_id in enumerate(movie_ids)}
-    
-    # Create rating matrix
-    rating_matrix = np.zeros((len(users), len(movies)))
-    
-    for rating in ratings:
-        try:
-            user_idx = user_idx_map[rating.user_id]
-            movie_idx = movie_idx_map[rating.movie_id]
-            rating_matrix[user_idx, movie_idx] = rating.rating
-        except KeyError:
-            continue
-    
-    # Fill missing values with mean
-    user_ratings_mean = np.true_divide(rating_matrix.sum(1), (rating_matrix != 0).sum(1))
-    user_ratings_mean = np.nan_to_num(user_ratings_mean)
-    
-    # Normalize the matrix
-    normalized_matrix = rating_matrix.copy()
-    for i in range(rating_matrix.shape[0]):
-        non_zero_indices = rating_matrix[i, :] != 0
-        normalized_matrix[i, non_zero_indices] -= user_ratings_mean[i]
-    
-    # Compute user similarity
-    user_similarity = cosine_similarity(normalized_matrix)
-    
-    try:
-        # Get current user's index
-        current_user_idx = user_idx_map[user_id]
-    except KeyError:
-        # User not found, fall back to content-based filtering
+
+    # Get current user's row
+    current_user_idx = ratings.user_row(user_id)
+    if current_user_idx is None:
+        # User has no ratings, fall back to content-based filtering
         return get_content_based_recommendations(user_id=user_id, top_n=top_n)
-    
-    # Get similar users
-    similar_users = np.argsort(user_similarity[current_user_idx])[::-1]
-    similar_users = similar_users[1:11]  # Top 10 similar users (excluding self)
-    
-    # Get movies that the user hasn't rated
-    user_ratings = rating_matrix[current_user_idx]
-    unwatched = np.where(user_ratings == 0)[0]
-    
-    # Predict ratings
-    predictions = []
-    for movie_idx in unwatched:
-        prediction = 0
-        total_weight = 0
-        
-        for similar_user_idx in similar_users:
-            if rating_matrix[similar_user_idx, movie_idx] > 0:
-                # Add weighted rating
-                weight = user_similarity[current_user_idx, similar_user_idx]
-                prediction += weight * normalized_matrix[similar_user_idx, movie_idx]
-                total_weight += weight
-        
-        if total_weight > 0:
-            prediction /= total_weight
-            prediction += user_ratings_mean[current_user_idx]
-            # Store movie index and predicted rating
-            predictions.append((movie_idx, prediction))
-    
-    # Sort by predicted rating
-    predictions.sort(key=lambda x: x[1], reverse=True)
-    top_predictions = predictions[:top_n]
-    
-    # Convert indices back to movie objects
-    recommended_movies = []
-    for movie_idx, _ in top_predictions:
-        movie_id = movie_ids[movie_idx]
-        try:
-            movie = Movie.objects.get(id=movie_id)
-            recommended_movies.append(movie)
-        except Movie.DoesNotExist:
-            continue
-    
+
+    columns, _ = score_user_user(ratings, current_user_idx, top_n)
+    recommended_movies = movies_in_order(ratings.movie_ids[columns].tolist())
+
     # If we couldn't get enough recommendations, fill with content-based ones
     if len(recommended_movies) < top_n:
         content_recommendations = get_content_based_recommendations(user_id=user_id, top_n=top_n)
@@ -195,5 +184,96 @@ def get_collaborative_filtering_recommendations(user_id, top_n=10):
         for movie in content_recommendations:
             if movie.id not in existing_ids and len(recommended_movies) < top_n:
                 recommended_movies.append(movie)
-    
+
+    return recommended_movies
+
+
+def get_matrix_factorization_recommendations(user_id, top_n=10):
+    """
+    Matrix Factorization: Scores every movie for the user with the factors
+    trained offline by `manage.py train_recommender`.
+
+    Users the model has not seen (or a missing model) fall back to
+    collaborative filtering, which in turn falls back to content-based.
+
+    Args:
+        user_id (int): User ID to get recommendations for
+        top_n (int): Number of recommendations to return
+
+    Returns:
+        list: List of recommended movie objects
+    """
+    model = get_factor_model()
+    user_row = model.user_row(user_id) if model is not None else None
+    if user_row is None:
+        # Cold-start user, fall back to the neighbourhood and content methods
+        return get_collaborative_filtering_recommendations(user_id=user_id, top_n=top_n)
+
+    # Don't recommend anything the user has rated, including since training
+    rated_ids = Rating.objects.filter(user_id=user_id).values_list('movie_id', flat=True)
+    columns, _ = model.recommend(user_row, top_n, exclude=model.columns_of(rated_ids))
+    recommended_movies = movies_in_order(model.movie_ids[columns].tolist())
+
+    if len(recommended_movies) < top_n:
+        content_recommendations = get_content_based_recommendations(user_id=user_id, top_n=top_n)
+        existing_ids = {movie.id for movie in recommended_movies}
+        for movie in content_recommendations:
+            if movie.id not in existing_ids and len(recommended_movies) < top_n:
+                recommended_movies.append(movie)
+
+    return recommended_movies
+
+
+def get_item_based_recommendations(user_id=None, movie_id=None, top_n=10):
+    """
+    Item-Based Collaborative Filtering: Uses the precomputed item-item
+    neighbour lists (see `build_item_neighbors`), so serving is a single
+    indexed query.
+
+    For a movie, returns its nearest neighbours. For a user, scores every
+    neighbour of the movies they rated by the similarity-weighted deviation of
+    their rating from their own mean.
+
+    Args:
+        user_id (int): User ID to get recommendations for (optional)
+        movie_id (int): Movie ID to find similar movies for (optional)
+        top_n (int): Number of recommendations to return
+
+    Returns:
+        list: List of recommended movie objects
+    """
+    if movie_id:
+        neighbor_ids = ItemNeighbor.objects.filter(movie_id=movie_id).values_list('neighbor_id', flat=True)
+        recommended_movies = movies_in_order(list(neighbor_ids[:top_n]))
+        if len(recommended_movies) < top_n:
+            # Not enough co-ratings yet, complete with content similarity
+            existing_ids = {movie.id for movie in recommended_movies} | {int(movie_id)}
+            for movie in get_content_based_recommendations(movie_id=movie_id, top_n=top_n):
+                if movie.id not in existing_ids and len(recommended_movies) < top_n:
+                    recommended_movies.append(movie)
+        return recommended_movies
+
+    user_ratings = dict(Rating.objects.filter(user_id=user_id).values_list('movie_id', 'rating'))
+    if not user_ratings:
+        return get_content_based_recommendations(user_id=user_id, top_n=top_n)
+
+    user_mean = sum(user_ratings.values()) / len(user_ratings)
+    scores = {}
+    for rated_id, neighbor_id, score in ItemNeighbor.objects.filter(
+        movie_id__in=list(user_ratings)
+    ).values_list('movie_id', 'neighbor_id', 'score'):
+        if neighbor_id in user_ratings:
+            continue
+        scores[neighbor_id] = scores.get(neighbor_id, 0.0) + score * (user_ratings[rated_id] - user_mean)
+
+    ranked = sorted((movie for movie in scores if scores[movie] > 0), key=scores.get, reverse=True)
+    recommended_movies = movies_in_order(ranked[:top_n])
+
+    if len(recommended_movies) < top_n:
+        content_recommendations = get_content_based_recommendations(user_id=user_id, top_n=top_n)
+        existing_ids = {movie.id for movie in recommended_movies}
+        for movie in content_recommendations:
+            if movie.id not in existing_ids and len(recommended_movies) < top_n:
+                recommended_movies.append(movie)
+
     return recommended_movies
@@ -0,0 +1,131 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+FTS_TABLE = 'movies_movie_fts'
+# Keep the index in step with movies_movie (see migration 0005)
+SYNC_TRIGGERS = ('movies_movie_fts_insert', 'movies_movie_fts_delete', 'movies_movie_fts_update')
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_available = {}
+
+
+def max_results():
+    return getattr(settings, 'SEARCH_MAX_RESULTS', 500)
+
+
+def ranked_candidates():
+    return getattr(settings, 'SEARCH_RANKED_CANDIDATES', 500)
+
+
+def missing_sync_triggers():
+    """
+    The SYNC_TRIGGERS missing from this SQLite database. SQLite drops a
+    table's triggers when Django rebuilds the table for a schema change,
+    after which the index would silently fall behind the catalog.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'movies_movie'")
+        present = {row[0] for row in cursor.fetchall()}
+    return [name for name in SYNC_TRIGGERS if name not in present]
+
+
+def search_available():
+    """
+    True when the FTS5 index from migration 0005 and the triggers keeping
+    it current exist on this database. Without the triggers the index is
+    stale, so search falls back to the unindexed scan.
+    """
+    if connection.alias not in _available:
+        _available[connection.alias] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+            and not missing_sync_triggers()
+        )
+    return _available[connection.alias]
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 MATCH expression: every word must match,
+    and the last one may be a prefix so results appear while typing.
+
+    Words are quoted, so user input can never inject FTS5 syntax. Returns
+    None when the query has no searchable words.
+    """
+    tokens = _TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens[:-1]]
+    terms.append(f'"{tokens[-1]}"*')
+    return ' '.join(terms)
+
+
+def _match(cursor, expression, limit, ranked=False):
+    order = f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) " if ranked else ""
+    cursor.execute(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s {order}LIMIT %s",
+        [expression, limit],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def search_movie_ids(query, limit=None):
+    """
+    Ids of the movies matching `query`, best first, at most `limit`
+    (default `SEARCH_MAX_RESULTS`); a search lists no matches beyond that.
+
+    BM25 has to score every match before it can sort, which takes seconds
+    for words that occur in most of a million overviews. So the matches
+    are first counted up to `SEARCH_RANKED_CANDIDATES` with a plain index
+    read: selective queries (the usual case) are then ranked exactly by
+    BM25 with titles weighted above overviews, while unselective ones
+    return title matches before overview matches without scoring, which
+    keeps every query bounded.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    limit = limit or max_results()
+    pool = ranked_candidates()
+    with connection.cursor() as cursor:
+        if len(_match(cursor, expression, pool + 1)) <= pool:
+            return _match(cursor, expression, limit, ranked=True)
+
+        movie_ids = _match(cursor, f"{{title}} : ({expression})", limit)
+        if len(movie_ids) < limit:
+            seen = set(movie_ids)
+            movie_ids.extend(
+                movie_id for movie_id in _match(cursor, expression, limit + len(movie_ids))
+                if movie_id not in seen
+            )
+        return movie_ids[:limit]
+
+
+def search_movies(queryset, query):
+    """
+    Filter a Movie queryset to `query` and annotate `search_rank` (0 for the
+    best match) for ordering. Falls back to an unranked substring scan when
+    the FTS index is not available.
+    """
+    if not search_available():
+        return queryset.filter(
+            Q(title__icontains=query) | Q(overview__icontains=query)
+        ).annotate(search_rank=Value(0, output_field=IntegerField()))
+
+    movie_ids = search_movie_ids(query)
+    if not movie_ids:
+        return queryset.none().annotate(search_rank=Value(0, output_field=IntegerField()))
+    return queryset.filter(id__in=movie_ids).annotate(search_rank=Case(
+        *[When(id=movie_id, then=Value(rank)) for rank, movie_id in enumerate(movie_ids)],
+        output_field=IntegerField(),
+    ))
+
+
+def rebuild_search_index():
+    """Repopulate the FTS index from movies_movie and merge its segments"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
@@ -1,6 +1,34 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Movie, Genre, Favorite, Rating, Watchlist
+from .user_state import CONTEXT_KEY
+
+# What a movie card shows; the default field set of compact movies
+COMPACT_MOVIE_FIELDS = ('id', 'title', 'poster_path', 'release_date', 'vote_average', 'genres')
+
+
+def movie_field_selection(query_params):
+    """
+    MovieSerializer options from the `fields` and `omit` query parameters
+    (comma separated field names) and `compact` (true/1).
+    """
+    def names(param):
+        value = query_params.get(param)
+        return {name.strip() for name in value.split(',') if name.strip()} if value else None
+
+    return {
+        'fields': names('fields'),
+        'omit': names('omit'),
+        'compact': query_params.get('compact', '').lower() in ('1', 'true'),
+    }
+
+
+def field_selection_key(query_params):
+    """`movie_field_selection` in a canonical, hashable form for response validators"""
+    return tuple(
+        tuple(sorted(value)) if isinstance(value, set) else value
+        for value in movie_field_selection(query_params).values()
+    )
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -45,19 +73,47 @@ class MovieSerializer(serializers.ModelSerializer):
                   'popularity', 'vote_average', 'vote_count', 
                   'is_favorite', 'is_in_watchlist', 'user_rating', 'average_rating')
     
+    def __init__(self, *args, fields=None, omit=None, compact=False, **kwargs):
+        """
+        `fields` limits the output to the named fields and `omit` drops the
+        named ones; fields that are not rendered are never computed. Compact
+        movies render genres as ids and default to COMPACT_MOVIE_FIELDS.
+        """
+        super().__init__(*args, **kwargs)
+        if compact:
+            self.fields['genres'] = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+            if fields is None:
+                fields = COMPACT_MOVIE_FIELDS
+        for name, field in list(self.fields.items()):
+            if field.write_only:
+                continue
+            if (fields is not None and name not in fields) or (omit and name in omit):
+                del self.fields[name]
+    
+    # Views preload the user's state for all rendered movies (see
+    # movies.user_state); the per-movie queries are only a fallback
     def get_is_favorite(self, obj):
+        state = self.context.get(CONTEXT_KEY)
+        if state is not None:
+            return state.is_favorite(obj.id)
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Favorite.objects.filter(user=request.user, movie=obj).exists()
         return False
     
     def get_is_in_watchlist(self, obj):
+        state = self.context.get(CONTEXT_KEY)
+        if state is not None:
+            return state.is_in_watchlist(obj.id)
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Watchlist.objects.filter(user=request.user, movie=obj).exists()
         return False
     
     def get_user_rating(self, obj):
+        state = self.context.get(CONTEXT_KEY)
+        if state is not None:
+            return state.rating_of(obj.id)
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             try:
@@ -111,6 +167,22 @@ class RatingSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class MovieRatingSerializer(serializers.ModelSerializer):
+    """A rating listed under its movie, so without the movie itself"""
+    username = serializers.CharField(source='user.username', read_only=True)
+    
+    class Meta:
+        model = Rating
+        fields = ('id', 'user', 'username', 'rating', 'comment', 'created_at')
+
+
+class BulkRatingItemSerializer(serializers.Serializer):
+    """One rating of a bulk rating request"""
+    movie_id = serializers.IntegerField()
+    rating = serializers.IntegerField(min_value=1, max_value=10)
+    comment = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+
 class WatchlistSerializer(serializers.ModelSerializer):
     movie = MovieSerializer(read_only=True)
     movie_id = serializers.IntegerField(write_only=True)
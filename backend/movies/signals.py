@@ -0,0 +1,77 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import bump_user_state_version
+from .catalog_cache import invalidate_catalog, movie_scope
+from .models import Favorite, Rating, UserRecommendation, Watchlist
+from .rating_aggregates import apply_histogram_delta, apply_rating_delta, refresh_rating_aggregates
+from .trending import EVENT_KINDS, EVENT_SOURCES, event_weight, record_event
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=Watchlist)
+@receiver(post_delete, sender=Watchlist)
+def invalidate_user_state(sender, instance, **kwargs):
+    """A user's inputs changed, so their cached and precomputed recommendations are stale"""
+    bump_user_state_version(instance.user_id)
+    UserRecommendation.objects.filter(user_id=instance.user_id).delete()
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_movie_detail(sender, instance, **kwargs):
+    """The movie's average rating changes, so its cached anonymous detail is stale"""
+    invalidate_catalog(movie_scope(instance.movie_id))
+
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, created, **kwargs):
+    """Fold the new or changed rating into the movie's stored aggregates and histogram"""
+    stored_rating = getattr(instance, '_stored_rating', None)
+    stored_movie_id = getattr(instance, '_stored_movie_id', None)
+    if created:
+        apply_rating_delta(instance.movie_id, instance.rating, 1)
+        apply_histogram_delta(instance.movie_id, instance.rating, 1)
+    elif stored_rating is None:
+        # Saved from an instance that was not loaded from the database, so the old value is unknown
+        refresh_rating_aggregates([instance.movie_id])
+    elif stored_movie_id != instance.movie_id:
+        apply_rating_delta(stored_movie_id, -stored_rating, -1)
+        apply_rating_delta(instance.movie_id, instance.rating, 1)
+        apply_histogram_delta(stored_movie_id, stored_rating, -1)
+        apply_histogram_delta(instance.movie_id, instance.rating, 1)
+    elif stored_rating != instance.rating:
+        apply_rating_delta(instance.movie_id, instance.rating - stored_rating, 0)
+        apply_histogram_delta(instance.movie_id, stored_rating, -1)
+        apply_histogram_delta(instance.movie_id, instance.rating, 1)
+    instance._stored_rating = instance.rating
+    instance._stored_movie_id = instance.movie_id
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    stored_rating = getattr(instance, '_stored_rating', None)
+    movie_id = getattr(instance, '_stored_movie_id', instance.movie_id)
+    rating = instance.rating if stored_rating is None else stored_rating
+    apply_rating_delta(movie_id, -rating, -1)
+    apply_histogram_delta(movie_id, rating, -1)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Watchlist)
+def trending_event_added(sender, instance, created, **kwargs):
+    if created:
+        record_event(instance.movie_id, event_weight(EVENT_KINDS[sender]))
+
+
+@receiver(post_delete, sender=Rating)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Watchlist)
+def trending_event_removed(sender, instance, **kwargs):
+    """Withdraw the event's remaining decayed weight, so toggling back and forth gains nothing"""
+    kind = EVENT_KINDS[sender]
+    record_event(instance.movie_id, -event_weight(kind), at=getattr(instance, EVENT_SOURCES[kind][1]))
@@ -1,3 +1,2211 @@
-from django.test import TestCase
+import datetime
+import json
+import math
+import os
+import pickle
+import tempfile
+import threading
+import time
+import unittest
+from io import StringIO
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import numpy as np
+import requests
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, connections
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import autocomplete, content_model, factorization, ingest, search
+from .ann import IVFIndex, recall_report
+from .autocomplete import TitleIndex
+from .caching import user_state_version
+from .catalog_cache import invalidate_catalog
+from .content_model import get_content_model, load_content_model, update_content_model
+from .factorization import FactorModel, get_factor_model, train_als
+from .ingest import MovieWriter, ingest_tmdb
+from .interactions import InteractionImporter, import_interactions, read_interactions
+from .item_similarity import build_item_neighbors, process_neighbor_updates, update_item_neighbors
+from .management.commands.import_movies import Command as ImportMoviesCommand
+from .models import (
+    Favorite, Genre, ItemNeighbor, Movie, PendingNeighborUpdate, Rating, TrendingScore, UserRecommendation, Watchlist,
+)
+from .neighbors import NeighborIndex
+from .precompute import precompute_recommendations
+from .recommendation import get_item_based_recommendations
+from .rating_aggregates import rating_histogram
+from .rating_matrix import RatingMatrix, score_user_user
+from .search import match_expression, missing_sync_triggers, search_available, search_movie_ids
+from .trending import decay_scores, time_key
+from . import views
+from .serializers import COMPACT_MOVIE_FIELDS
+from .views import MovieViewSet
+
+
+class StubTMDBHandler(BaseHTTPRequestHandler):
+    """Serves the server's `pages` as a TMDB list endpoint, failing pages listed in `failures`"""
+
+    def do_GET(self):
+        server = self.server
+        page = int(parse_qs(urlparse(self.path).query)['page'][0])
+        with server.lock:
+            server.requests.append(page)
+            failing = server.failures.get(page, 0)
+            if failing:
+                server.failures[page] = failing - 1
+        if failing:
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = json.dumps({
+            'page': page,
+            'total_pages': len(server.pages),
+            'results': server.pages.get(page, []),
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def tmdb_record(tmdb_id, title=None, genre_ids=(28,)):
+    return {
+        'id': tmdb_id,
+        'title': title or f"Movie {tmdb_id}",
+        'overview': 'An overview',
+        'release_date': '2020-05-01',
+        'poster_path': f"/{tmdb_id}.jpg",
+        'backdrop_path': None,
+        'popularity': float(tmdb_id),
+        'vote_average': 7.5,
+        'vote_count': 10,
+        'genre_ids': list(genre_ids),
+    }
+
+
+@override_settings(TMDB_INGEST={'WORKERS': 2, 'RETRIES': 2, 'BACKOFF': 0, 'TIMEOUT': 5, 'BATCH_SIZE': 4})
+class TMDBIngestTests(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubTMDBHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.failures = {}
+        self.server.pages = {
+            page: [tmdb_record(page * 100 + offset, genre_ids=(28, 18)) for offset in range(5)]
+            for page in range(1, 4)
+        }
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/3"
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        Genre.objects.create(name='Action')
+        Genre.objects.create(name='Drama')
+
+    def test_ingests_every_page_with_genres(self):
+        self.server.pages[2][0] = tmdb_record(200, title='Sex and the City')
+        Movie.objects.create(title='Known', overview='', release_date='2020-01-01', tmdb_id=301)
+
+        created = ingest_tmdb('movie/popular', 100, base_url=self.base_url)
+
+        self.assertEqual(created, 13)
+        self.assertEqual(sorted(set(self.server.requests)), [1, 2, 3])
+        self.assertFalse(Movie.objects.filter(tmdb_id=200).exists())
+        movie = Movie.objects.get(tmdb_id=102)
+        self.assertEqual(movie.poster_path, 'https://image.tmdb.org/t/p/w500/102.jpg')
+        self.assertEqual(sorted(movie.genres.values_list('name', flat=True)), ['Action', 'Drama'])
+        self.assertEqual(Movie.genres.through.objects.count(), 26)
+
+        # A second run finds every movie already stored
+        self.assertEqual(ingest_tmdb('movie/popular', 100, base_url=self.base_url), 0)
+
+    def test_skips_malformed_records(self):
+        del self.server.pages[1][1]['title']
+        self.server.pages[2][2]['release_date'] = '2020-13-45'
+        self.server.pages[2][3]['title'] = None
+        self.server.pages[3][0] = ['not', 'a', 'record']
+        self.server.pages[3][1]['popularity'] = 'very'
+        writer = MovieWriter(batch_size=4)
+        messages = []
+
+        created = ingest_tmdb('movie/popular', 100, base_url=self.base_url, writer=writer, log=messages.append)
+
+        self.assertEqual((created, writer.skipped), (10, 5))
+        self.assertFalse(Movie.objects.filter(tmdb_id__in=[101, 202, 203, 301]).exists())
+        self.assertIn("Skipped malformed record 2: KeyError('title')", messages)
+        self.assertEqual(sum(message.startswith('Skipped malformed record') for message in messages), 5)
+
+    def test_stops_at_count(self):
+        created = ingest_tmdb('movie/popular', 7, base_url=self.base_url)
+
+        self.assertEqual(created, 7)
+        self.assertEqual(Movie.objects.count(), 7)
+        self.assertNotIn(3, self.server.requests)
+
+    def test_retries_transient_errors(self):
+        self.server.failures = {2: 2}
+
+        created = ingest_tmdb('movie/popular', 100, base_url=self.base_url)
+
+        self.assertEqual(created, 15)
+        self.assertEqual(self.server.requests.count(2), 3)
+
+    def test_keeps_movies_fetched_before_a_failure(self):
+        self.server.failures = {3: 10}
+        writer = MovieWriter(batch_size=4)
+
+        with self.assertRaises(requests.RequestException):
+            ingest_tmdb('movie/popular', 100, base_url=self.base_url, writer=writer)
+
+        self.assertEqual(writer.written, 10)
+        self.assertEqual(Movie.objects.count(), 10)
+
+
+
+
+
+def create_movies(count, **fields):
+    return [
+        Movie.objects.create(
+            title=f"Movie {number}", overview=f"Overview {number}", release_date='2020-01-01', **fields
+        )
+        for number in range(count)
+    ]
+
+
+def create_ratings(users, movies, scores):
+    """Ratings from `scores`, rows per user and columns per movie, None for no rating"""
+    for user, row in zip(users, scores):
+        for movie, score in zip(movies, row):
+            if score is not None:
+                Rating.objects.create(user=user, movie=movie, rating=score)
+
+
+# Three pairs of movies that share most of their words
+THEMED_MOVIES = (
+    ('Red Planet', 'Astronauts land a rocket on mars', 'Science Fiction'),
+    ('Orbit', 'Astronauts repair a rocket in orbit around mars', 'Science Fiction'),
+    ('Paris Letters', 'A love story told in letters across paris', 'Romance'),
+    ('Summer Wedding', 'Love letters before a wedding in paris', 'Romance'),
+    ('The Vault', 'Thieves plan a bank heist on the vault', 'Crime'),
+    ('Night Job', 'A crew of thieves robs a bank vault', 'Crime'),
+)
+
+
+def create_themed_movies():
+    movies = []
+    for title, overview, genre in THEMED_MOVIES:
+        movie = Movie.objects.create(title=title, overview=overview, release_date='2020-01-01')
+        movie.genres.add(Genre.objects.get_or_create(name=genre)[0])
+        movies.append(movie)
+    return movies
+
+
+class ArtifactDirMixin:
+    """Model artifacts go to a temporary directory, so each test builds its own"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        artifacts = override_settings(RECOMMENDER_ARTIFACT_DIR=directory.name)
+        artifacts.enable()
+        self.addCleanup(artifacts.disable)
+        caches['recommendations'].clear()
+        for module in (content_model, factorization):
+            module._loaded.update(model=None, mtime=None)
+            self.addCleanup(module._loaded.update, model=None, mtime=None)
+
+
+class ContentModelTests(ArtifactDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.movies = create_themed_movies()
+
+    def test_build_command_saves_a_loadable_artifact(self):
+        output = StringIO()
+        call_command('build_content_model', '--neighbors', 3, stdout=output)
+
+        self.assertIn('Saved content model', output.getvalue())
+        model = load_content_model()
+        self.assertEqual(model.movie_ids.tolist(), [movie.id for movie in self.movies])
+        self.assertEqual(model.neighbors.k, 3)
+        self.assertEqual(model.matrix.shape[0], 6)
+
+    def test_model_is_loaded_once_and_reloaded_after_a_rebuild(self):
+        model = get_content_model()
+        self.assertIsNotNone(model)
+        with mock.patch.object(content_model, 'build_content_model') as build:
+            self.assertIs(get_content_model(), model)
+        build.assert_not_called()
+
+        # A rebuild by the management command, in another process
+        rebuilt = content_model.build_content_model(neighbor_count=2)
+        content_model.save_content_model(rebuilt)
+        os.utime(content_model.artifact_path(), ns=(0, time.time_ns() + 10 ** 9))
+
+        self.assertEqual(get_content_model().neighbors.k, 2)
+
+    def test_concurrent_cold_requests_build_once(self):
+        built = content_model.build_content_model()
+        calls = []
+
+        def slow_build(neighbor_count=None):
+            calls.append(neighbor_count)
+            time.sleep(0.2)
+            return built
+
+        models = []
+        with mock.patch.object(content_model, 'build_content_model', side_effect=slow_build):
+            threads = [threading.Thread(target=lambda: models.append(get_content_model())) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(models), 4)
+        self.assertTrue(all(model is built for model in models))
+
+    def test_artifacts_of_an_older_format_are_rebuilt(self):
+        with open(content_model.artifact_path(), 'wb') as artifact:
+            pickle.dump({'format': content_model.ARTIFACT_FORMAT - 1}, artifact)
+
+        model = get_content_model()
+
+        self.assertEqual(len(model), 6)
+        self.assertEqual(load_content_model().version, model.version)
+
+    def test_update_inserts_new_movies_with_the_fitted_vocabulary(self):
+        get_content_model()
+        movie = Movie.objects.create(
+            title='Lunar Base', overview='Astronauts fly a rocket to the moon', release_date='2020-01-01'
+        )
+
+        model, added = update_content_model()
+
+        self.assertEqual(added, 1)
+        self.assertIn('+7', model.version)
+        self.assertEqual(model.row_of(movie.id), 6)
+        rows, _ = model.neighbors.lookup(6)
+        self.assertIn(model.row_of(self.movies[0].id), rows[:2])
+        self.assertEqual(update_content_model()[1], 0)
+
+    def test_similar_movies_share_their_words(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('viewer'))
+
+        for index in ('neighbors', 'ann'):
+            with self.settings(RECOMMENDER_CONTENT_INDEX=index):
+                for first, second in ((0, 1), (2, 3), (4, 5)):
+                    caches['recommendations'].clear()
+                    response = client.get(
+                        '/api/recommendations/', {'movie_id': self.movies[first].id, 'fields': 'id'}
+                    )
+                    self.assertEqual(response.data[0]['id'], self.movies[second].id, index)
+
+    def test_ann_recall_report_command(self):
+        output = StringIO()
+        call_command('ann_recall_report', '--k', 1, '--sample', 6, '--probes', 1, 2, stdout=output)
+
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('movies=6 lists=2 k=1'))
+        self.assertEqual([line.split()[0] for line in lines[2:]], ['1', '2'])
+        self.assertEqual(lines[3].split()[1], '1.000')
+
+
+
+class NeighborIndexTests(SimpleTestCase):
+    def setUp(self):
+        # Rows 0-2 share terms, row 3 shares none with them
+        dense = np.array([
+            [1, 1, 0, 0],
+            [1, 0.5, 0, 0],
+            [0.2, 1, 0, 0],
+            [0, 0, 1, 1],
+        ], dtype=np.float32)
+        self.matrix = sp.csr_matrix(dense / np.linalg.norm(dense, axis=1, keepdims=True))
+
+    def test_build_keeps_the_exact_top_k_best_first(self):
+        exact = (self.matrix @ self.matrix.T).toarray()
+        np.fill_diagonal(exact, -np.inf)
+
+        for block_cells in (2 ** 25, 4):
+            index = NeighborIndex.build(self.matrix, 2, block_cells=block_cells)
+            self.assertEqual(index.k, 2)
+            for row in range(3):
+                rows, scores = index.lookup(row)
+                self.assertEqual(rows.tolist(), np.argsort(-exact[row])[:2].tolist())
+                np.testing.assert_allclose(scores, exact[row][rows], rtol=1e-6)
+
+    def test_movies_sharing_no_terms_are_not_neighbours(self):
+        index = NeighborIndex.build(self.matrix, 3)
+
+        rows, scores = index.lookup(3)
+        self.assertEqual(len(rows), 0)
+        self.assertNotIn(3, index.lookup(0)[0].tolist())
+        self.assertTrue((index.lookup(0)[1] > 0).all())
+
+    def test_aggregate_sums_the_neighbour_scores(self):
+        index = NeighborIndex.build(self.matrix, 3)
+        similarity = (self.matrix @ self.matrix.T).toarray()
+
+        candidates, scores = index.aggregate([0, 1])
+
+        self.assertEqual(sorted(candidates.tolist()), [0, 1, 2])
+        summed = dict(zip(candidates.tolist(), scores.tolist()))
+        self.assertAlmostEqual(summed[2], similarity[0, 2] + similarity[1, 2], places=5)
+        self.assertAlmostEqual(summed[0], similarity[1, 0], places=5)
+        self.assertEqual(len(index.aggregate([])[0]), 0)
+
+    def test_padding_is_left_out(self):
+        index = NeighborIndex(
+            np.array([[1, -1], [0, -1]], dtype=np.int32), np.array([[0.5, 0], [0.5, 0]], dtype=np.float32)
+        )
+
+        self.assertEqual(index.lookup(0)[0].tolist(), [1])
+        self.assertEqual(index.aggregate([0, 1])[0].tolist(), [0, 1])
+
+
+
+class IVFIndexTests(SimpleTestCase):
+    def setUp(self):
+        # 400 rows around 8 topics of 50 terms each, plus shared noise
+        rng = np.random.default_rng(1)
+        topics = np.repeat(np.arange(8), 50)
+        dense = rng.random((400, 400)) * (rng.random((400, 400)) < 0.02)
+        for row, topic in enumerate(topics):
+            dense[row, topic * 50:(topic + 1) * 50] += rng.random(50) * (rng.random(50) < 0.3)
+        self.vectors = normalize(sp.csr_matrix(dense, dtype=np.float32))
+
+    def exact(self, row, k):
+        scores = (self.vectors @ self.vectors[row].T).toarray().ravel()
+        scores[row] = -np.inf
+        return np.argsort(-scores, kind='stable')[:k]
+
+    def test_probing_every_list_is_exact(self):
+        index = IVFIndex.build(self.vectors, n_lists=8, n_probe=8)
+
+        for row in (0, 123, 399):
+            rows, scores = index.query(self.vectors[row], 5, exclude=[row])
+            self.assertEqual(sorted(rows.tolist()), sorted(self.exact(row, 5).tolist()))
+            self.assertTrue((np.diff(scores) <= 0).all())
+
+    def test_recall_of_a_partial_probe(self):
+        index = IVFIndex.build(self.vectors, n_lists=16, n_probe=4)
+
+        report = recall_report(index, self.vectors, k=10, sample_size=50)
+
+        self.assertGreater(report['recall'], 0.8)
+        self.assertLess(report['candidate_fraction'], 0.5)
+        self.assertEqual(recall_report(index, self.vectors, k=10, sample_size=50, n_probe=16)['recall'], 1.0)
+
+    def test_added_rows_are_searchable_before_and_after_merging(self):
+        index = IVFIndex.build(self.vectors[:300], n_lists=8, n_probe=8)
+        index.add(self.vectors[300:])
+        self.assertEqual(len(index), 400)
+
+        for merged in (False, True):
+            if merged:
+                index.merge()
+                self.assertEqual(len(index.pending_rows), 0)
+            rows, _ = index.query(self.vectors[350], 1)
+            self.assertEqual(rows.tolist(), [350])
+
+    def test_artifact_round_trip(self):
+        index = IVFIndex.build(self.vectors, n_lists=8, n_probe=2)
+        restored = IVFIndex.from_artifact(pickle.loads(pickle.dumps(index.to_artifact())), self.vectors)
+
+        for row in (5, 250):
+            np.testing.assert_array_equal(
+                restored.query(self.vectors[row], 5, exclude=[row])[0],
+                index.query(self.vectors[row], 5, exclude=[row])[0],
+            )
+
+
+
+class RatingMatrixTests(TestCase):
+    def setUp(self):
+        # 12 users x 15 movies, about half rated, on the 1-10 scale
+        rng = np.random.default_rng(3)
+        self.dense = np.where(rng.random((12, 15)) < 0.5, rng.integers(1, 11, (12, 15)), 0).astype(np.float32)
+        users, movies = np.nonzero(self.dense)
+        # Sparse, unordered ids as they come from the database
+        self.ratings = RatingMatrix.from_triples(users * 7 + 3, movies * 5 + 2, self.dense[users, movies])
+
+    def reference_scores(self, user, n_neighbors):
+        """score_user_user written out one user and one movie at a time"""
+        rated = self.dense > 0
+        means = [self.dense[row][rated[row]].mean() for row in range(len(self.dense))]
+        centered = np.where(rated, self.dense - np.array(means)[:, None], 0)
+        similarity = {}
+        for other in range(len(self.dense)):
+            if other != user:
+                norm = np.linalg.norm(centered[user]) * np.linalg.norm(centered[other])
+                similarity[other] = centered[user] @ centered[other] / norm if norm else 0.0
+        neighbors = sorted(similarity, key=similarity.get, reverse=True)[:n_neighbors]
+        predictions = {}
+        for movie in range(self.dense.shape[1]):
+            if rated[user, movie]:
+                continue
+            raters = [other for other in neighbors if rated[other, movie]]
+            weight = sum(similarity[other] for other in raters)
+            if weight > 0:
+                predictions[movie] = (
+                    sum(similarity[other] * centered[other, movie] for other in raters) / weight + means[user]
+                )
+        return predictions
+
+    def test_ids_map_to_sorted_rows_and_columns(self):
+        self.assertEqual(self.ratings.user_ids.tolist(), [row * 7 + 3 for row in range(12)])
+        self.assertEqual(self.ratings.movie_ids.tolist(), [column * 5 + 2 for column in range(15)])
+        np.testing.assert_array_equal(self.ratings.matrix.toarray(), self.dense)
+        self.assertEqual(self.ratings.user_row(3 * 7 + 3), 3)
+        self.assertIsNone(self.ratings.user_row(4))
+        self.assertIsNone(self.ratings.user_row(10 ** 6))
+
+    def test_centering_keeps_the_sparsity_pattern(self):
+        centered, means = self.ratings.centered()
+
+        np.testing.assert_allclose(means, [row[row > 0].mean() for row in self.dense], rtol=1e-6)
+        self.assertEqual(centered.nnz, self.ratings.nnz)
+        np.testing.assert_allclose(
+            centered.toarray(), np.where(self.dense > 0, self.dense - means[:, None], 0), atol=1e-5
+        )
+
+    def test_scores_match_the_per_user_computation(self):
+        for user in range(12):
+            for n_neighbors in (3, 11):
+                expected = self.reference_scores(user, n_neighbors)
+                columns, predictions = score_user_user(self.ratings, user, top_n=20, n_neighbors=n_neighbors)
+
+                self.assertEqual(set(columns.tolist()), set(expected))
+                # Relative: near-zero weight sums blow float32 rounding up
+                np.testing.assert_allclose(
+                    predictions, [expected[column] for column in columns.tolist()], rtol=1e-4, atol=1e-4
+                )
+                self.assertTrue((np.diff(predictions) <= 0).all())
+                self.assertFalse(np.isin(columns, np.flatnonzero(self.dense[user])).any())
+
+    def test_load_reads_every_rating(self):
+        users = [User.objects.create_user(f"rater{number}") for number in range(3)]
+        movies = create_movies(4)
+        create_ratings(users, movies, [[5, None, 7, None], [None, 2, None, None], [1, 1, 1, 10]])
+
+        ratings = RatingMatrix.load()
+
+        self.assertEqual(ratings.user_ids.tolist(), [user.id for user in users])
+        self.assertEqual(ratings.movie_ids.tolist(), [movie.id for movie in movies])
+        np.testing.assert_array_equal(
+            ratings.matrix.toarray(), [[5, 0, 7, 0], [0, 2, 0, 0], [1, 1, 1, 10]]
+        )
+        self.assertEqual(RatingMatrix.load(Rating.objects.filter(user=users[1])).nnz, 1)
+
+
+
+class FactorModelTests(ArtifactDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Rank-2 tastes: users 0-2 like movies 0-3, users 3-5 movies 4-7
+        self.users = [User.objects.create_user(f"viewer{number}") for number in range(6)]
+        self.movies = create_movies(8)
+        liked = [[9, 9, 8, None, 2, 1, 2, 1], [8, None, 9, 9, 1, 2, None, 2], [9, 8, None, 8, 2, None, 1, 1],
+                 [1, 2, 1, 2, 9, 8, None, 9], [2, None, 2, 1, 8, 9, 9, None], [1, 1, None, 2, None, 9, 8, 8]]
+        create_ratings(self.users, self.movies, liked)
+
+    def test_training_lowers_the_error_and_fits_the_ratings(self):
+        errors = []
+        model = train_als(RatingMatrix.load(), n_factors=2, iterations=8, regularization=0.01,
+                          callback=lambda iteration, rmse: errors.append(rmse))
+
+        self.assertEqual(len(errors), 8)
+        self.assertLess(errors[-1], errors[0])
+        self.assertLess(errors[-1], 1.0)
+        row = model.user_row(self.users[0].id)
+        column = model.columns_of([self.movies[3].id])[0]
+        # The unrated movie 3 is predicted from the tastes of users 1 and 2
+        self.assertGreater(model.item_factors[column] @ model.user_factors[row] + model.global_mean, 6)
+
+    def test_recommend_skips_excluded_movies(self):
+        model = train_als(RatingMatrix.load(), n_factors=2, iterations=4)
+        row = model.user_row(self.users[0].id)
+
+        columns, scores = model.recommend(row, 3, exclude=[0, 1])
+
+        self.assertEqual(len(columns), 3)
+        self.assertFalse(np.isin(columns, [0, 1]).any())
+        self.assertTrue((np.diff(scores) <= 0).all())
+        self.assertEqual(len(model.recommend(row, 10, exclude=list(range(8)))[0]), 0)
+        self.assertEqual(model.columns_of([self.movies[2].id, 10 ** 6]).tolist(), [2])
+        self.assertIsNone(model.user_row(10 ** 6))
+
+    def test_saved_model_loads_back(self):
+        model = train_als(RatingMatrix.load(), n_factors=3, iterations=2)
+        restored = FactorModel.load(model.save())
+
+        np.testing.assert_array_equal(restored.user_factors, model.user_factors)
+        np.testing.assert_array_equal(restored.item_factors, model.item_factors)
+        np.testing.assert_array_equal(restored.movie_ids, model.movie_ids)
+        self.assertAlmostEqual(restored.global_mean, model.global_mean, places=5)
+        self.assertEqual(restored.version, model.version)
+
+    def test_train_command_installs_the_model(self):
+        self.assertIsNone(get_factor_model())
+        output = StringIO()
+
+        call_command('train_recommender', '--factors', 2, '--iterations', 3, stdout=output)
+
+        self.assertIn('Iteration 3: training RMSE', output.getvalue())
+        self.assertEqual(get_factor_model().n_factors, 2)
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        response = client.get('/api/recommendations/', {'type': 'mf', 'fields': 'id'})
+        # Movie 3 is the only one user 0 has not rated; content fills the rest
+        self.assertEqual(response.data[0]['id'], self.movies[3].id)
+
+
+
+class RecommendationCacheTests(ArtifactDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, self.other = User.objects.create_user('viewer'), User.objects.create_user('other')
+        self.movies = create_themed_movies()
+        # Built up front, as building it on demand changes the model version
+        get_content_model()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        compute = mock.patch.object(views, 'compute_recommendations', wraps=views.compute_recommendations)
+        self.compute = compute.start()
+        self.addCleanup(compute.stop)
+
+    def computes(self, change=None):
+        """How many times serving the user's recommendations twice, around `change`, computes them"""
+        self.compute.reset_mock()
+        self.client.get('/api/recommendations/', {'type': 'content'})
+        if change is not None:
+            change()
+        self.client.get('/api/recommendations/', {'type': 'content'})
+        return self.compute.call_count
+
+    def test_repeat_requests_are_served_from_the_cache(self):
+        self.assertEqual(self.computes(), 1)
+        self.assertEqual(self.computes(), 0)
+        # Keyed per type and per movie as well
+        self.client.get('/api/recommendations/', {'type': 'item'})
+        self.client.get('/api/recommendations/', {'movie_id': self.movies[0].id})
+        self.assertEqual(self.compute.call_count, 2)
+
+    def test_the_users_own_writes_invalidate_their_entries(self):
+        def rerate():
+            rating = Rating.objects.get()
+            rating.rating = 2
+            rating.save()
+
+        self.computes()
+        writes = [
+            lambda: Rating.objects.create(user=self.user, movie=self.movies[0], rating=9),
+            rerate,
+            lambda: Rating.objects.get().delete(),
+            lambda: Favorite.objects.create(user=self.user, movie=self.movies[1]),
+            lambda: Favorite.objects.get().delete(),
+            lambda: Watchlist.objects.create(user=self.user, movie=self.movies[2]),
+            lambda: Watchlist.objects.get().delete(),
+        ]
+        for write in writes:
+            self.assertEqual(self.computes(write), 1)
+
+    def test_other_users_writes_keep_the_entries(self):
+        self.computes()
+        UserRecommendation.objects.create(
+            user=self.user, recommendation_type='content', movie_ids=[], model_version='', computed_at=timezone.now(),
+        )
+
+        self.assertEqual(self.computes(lambda: Favorite.objects.create(user=self.other, movie=self.movies[0])), 0)
+        self.assertTrue(UserRecommendation.objects.filter(user=self.user).exists())
+        Favorite.objects.create(user=self.user, movie=self.movies[0])
+        self.assertFalse(UserRecommendation.objects.filter(user=self.user).exists())
+
+    def test_model_rebuilds_invalidate_every_entry(self):
+        self.computes()
+        self.assertEqual(self.computes(lambda: call_command('build_content_model', stdout=StringIO())), 1)
+
+    def test_stats_count_hits_and_misses(self):
+        admin = User.objects.create_superuser('admin')
+        self.client.force_authenticate(admin)
+        before = self.client.get('/api/cache-stats/').data.get('recommendations', {'hits': 0, 'misses': 0})
+        self.client.force_authenticate(self.user)
+        self.computes()
+        self.assertEqual(self.client.get('/api/cache-stats/').status_code, 403)
+
+        self.client.force_authenticate(admin)
+        after = self.client.get('/api/cache-stats/').data['recommendations']
+
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (1, 1))
+
+
+
+class UserStateTests(TestCase):
+    def setUp(self):
+        caches['catalog'].clear()
+        self.user = User.objects.create_user('viewer')
+        self.movies = create_movies(25)
+        Favorite.objects.create(user=self.user, movie=self.movies[0])
+        Watchlist.objects.create(user=self.user, movie=self.movies[1])
+        Rating.objects.create(user=self.user, movie=self.movies[2], rating=7)
+        Favorite.objects.create(user=User.objects.create_user('other'), movie=self.movies[3])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_list_renders_the_users_state(self):
+        data, _ = self.get('/api/movies/', page_size=25, fields='id,is_favorite,is_in_watchlist,user_rating')
+        state = {movie['id']: movie for movie in data['results']}
+
+        self.assertEqual(
+            [(movie['is_favorite'], movie['is_in_watchlist'], movie['user_rating']) for movie in
+             (state[self.movies[number].id] for number in range(4))],
+            [(True, False, None), (False, True, None), (False, False, 7), (False, False, None)],
+        )
+
+    def test_queries_do_not_grow_with_the_page(self):
+        _, small = self.get('/api/movies/', page_size=2)
+        _, large = self.get('/api/movies/', page_size=25)
+        self.assertEqual(small, large)
+
+        _, small = self.get('/api/favorites/', page_size=1)
+        Favorite.objects.bulk_create([Favorite(user=self.user, movie=movie) for movie in self.movies[4:20]])
+        data, large = self.get('/api/favorites/', page_size=25)
+        self.assertEqual(small, large)
+        self.assertTrue(all(favorite['movie']['is_favorite'] for favorite in data['results']))
+
+    def test_state_is_not_loaded_when_not_rendered(self):
+        _, with_state = self.get('/api/movies/', fields='id,is_favorite')
+        _, without_state = self.get('/api/movies/', fields='id,title')
+        self.assertEqual(with_state - without_state, 3)
+
+        self.client.force_authenticate(None)
+        data, _ = self.get('/api/movies/', page_size=25, fields='id,is_favorite,user_rating')
+        self.assertFalse(any(movie['is_favorite'] or movie['user_rating'] for movie in data['results']))
+
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f"rater{number}") for number in range(3)]
+        self.movies = create_movies(3)
+
+    def aggregates(self, movie):
+        movie.refresh_from_db()
+        return movie.rating_sum, movie.rating_count, movie.rating_average
+
+    def histogram(self, movie):
+        return {rating: count for rating, count in rating_histogram(movie.id).items() if count}
+
+    def test_writes_maintain_the_aggregates(self):
+        movie = self.movies[0]
+        first = Rating.objects.create(user=self.users[0], movie=movie, rating=8)
+        Rating.objects.create(user=self.users[1], movie=movie, rating=5)
+        self.assertEqual(self.aggregates(movie), (13, 2, 6.5))
+        self.assertEqual(self.histogram(movie), {8: 1, 5: 1})
+
+        first.rating = 2
+        first.save()
+        self.assertEqual(self.aggregates(movie), (7, 2, 3.5))
+        self.assertEqual(self.histogram(movie), {2: 1, 5: 1})
+
+        first.movie = self.movies[1]
+        first.save()
+        self.assertEqual(self.aggregates(movie), (5, 1, 5.0))
+        self.assertEqual(self.aggregates(self.movies[1]), (2, 1, 2.0))
+
+        Rating.objects.filter(movie=movie).get().delete()
+        self.assertEqual(self.aggregates(movie), (0, 0, None))
+        self.assertEqual(self.histogram(movie), {})
+
+    def test_saving_without_the_old_rating_recounts(self):
+        rating = Rating.objects.create(user=self.users[0], movie=self.movies[0], rating=8)
+        rating = Rating.objects.only('id', 'user', 'movie').get(pk=rating.pk)
+
+        rating.rating = 4
+        rating.save()
+
+        self.assertEqual(self.aggregates(self.movies[0]), (4, 1, 4.0))
+        self.assertEqual(self.histogram(self.movies[0]), {4: 1})
+
+    def test_api_writes_update_the_average(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+
+        response = client.post('/api/ratings/', {'movie_id': self.movies[0].id, 'rating': 9}, format='json')
+        client.patch(f"/api/ratings/{response.data['id']}/", {'rating': 3}, format='json')
+
+        self.assertEqual(self.aggregates(self.movies[0]), (3, 1, 3.0))
+        client.delete(f"/api/ratings/{response.data['id']}/")
+        self.assertEqual(self.aggregates(self.movies[0]), (0, 0, None))
+
+    def test_refresh_command_repairs_drift(self):
+        create_ratings(self.users, self.movies, [[8, 2, None], [6, None, None], [10, None, None]])
+        Rating.objects.filter(movie=self.movies[0], user=self.users[2]).update(rating=1)
+        Movie.objects.filter(pk=self.movies[2].pk).update(rating_sum=5, rating_count=1, rating_average=5)
+        output = StringIO()
+
+        call_command('refresh_rating_aggregates', stdout=output)
+
+        self.assertIn('Repaired rating aggregates of 2 movies', output.getvalue())
+        self.assertEqual(self.aggregates(self.movies[0]), (15, 3, 5.0))
+        self.assertEqual(self.histogram(self.movies[0]), {8: 1, 6: 1, 1: 1})
+        self.assertEqual(self.aggregates(self.movies[1]), (2, 1, 2.0))
+        self.assertEqual(self.aggregates(self.movies[2]), (0, 0, None))
+
+    def test_ordering_by_average_puts_unrated_movies_last(self):
+        create_ratings(self.users[:1], self.movies, [[4, None, 9]])
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+
+        response = client.get('/api/movies/', {'ordering': 'average_rating', 'fields': 'id,average_rating'})
+
+        self.assertEqual(
+            [(movie['id'], movie['average_rating']) for movie in response.data['results']],
+            [(self.movies[2].id, 9.0), (self.movies[0].id, 4.0), (self.movies[1].id, None)],
+        )
+
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('viewer')
+        # Few distinct popularities, so most rows tie on the first key
+        self.movies = create_movies(23)
+        for number, movie in enumerate(self.movies):
+            Movie.objects.filter(pk=movie.pk).update(popularity=number % 3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, path, params, direction='next'):
+        """Ids of every page from `path` on, following `direction` links"""
+        pages = []
+        response = self.client.get(path, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            if not response.data[direction]:
+                return pages, response
+            response = self.client.get(response.data[direction])
+
+    def test_pages_cover_every_movie_once_in_order(self):
+        pages, last = self.walk('/api/movies/', {'page_size': 5, 'fields': 'id'})
+
+        expected = [
+            movie.id for number, movie in sorted(enumerate(self.movies), key=lambda item: (-(item[0] % 3), item[1].id))
+        ]
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertEqual(sum(pages, []), expected)
+
+        # and back again
+        previous, _ = self.walk(last.data['previous'], {}, direction='previous')
+        self.assertEqual(previous, pages[-2::-1])
+
+    def test_pages_over_nullable_keys(self):
+        create_ratings([self.user], self.movies, [[5, None, 5, None, 8, None, 1]])
+
+        pages, _ = self.walk('/api/movies/', {'ordering': 'average_rating', 'page_size': 4, 'fields': 'id'})
+
+        ids = sum(pages, [])
+        self.assertEqual(len(ids), 23)
+        self.assertEqual(ids[:4], [self.movies[4].id, self.movies[2].id, self.movies[0].id, self.movies[6].id])
+        self.assertEqual(len(set(ids)), 23)
+
+    def test_page_size_is_capped_and_bad_cursors_are_404(self):
+        Movie.objects.bulk_create([
+            Movie(title=f"Extra {number}", overview='', release_date='2020-01-01') for number in range(100)
+        ])
+
+        self.assertEqual(len(self.client.get('/api/movies/', {'page_size': 500}).data['results']), 100)
+        self.assertEqual(self.client.get('/api/movies/', {'cursor': 'garbage'}).status_code, 404)
+
+    def test_user_lists_page_newest_first(self):
+        for movie in self.movies[:7]:
+            Favorite.objects.create(user=self.user, movie=movie)
+        # Ties on the first key are ordered by id
+        Favorite.objects.update(created_at=timezone.now())
+
+        pages, _ = self.walk('/api/favorites/', {'page_size': 3})
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(
+            sum(pages, []), list(Favorite.objects.order_by('-created_at', 'id').values_list('id', flat=True))
+        )
+
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        if not search_available():
+            self.skipTest('needs SQLite with FTS5')
+        self.movies = create_themed_movies()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('viewer'))
+
+    def titles(self, query, **params):
+        response = self.client.get('/api/movies/', {'search': query, 'fields': 'title', **params})
+        self.assertEqual(response.status_code, 200)
+        return [movie['title'] for movie in response.data['results']]
+
+    def test_match_expression_quotes_every_word(self):
+        self.assertEqual(match_expression('Love letters'), '"love" "letters"*')
+        self.assertEqual(match_expression('mars" OR title:*'), '"mars" "or" "title"*')
+        self.assertIsNone(match_expression(' -*" '))
+
+    def test_every_word_must_match_and_the_last_may_be_a_prefix(self):
+        self.assertEqual(set(self.titles('astro')), {'Red Planet', 'Orbit'})
+        self.assertEqual(self.titles('astronauts orb'), ['Orbit'])
+        self.assertEqual(self.titles('bank heist'), ['The Vault'])
+        self.assertEqual(self.titles('!!!'), [])
+
+    def test_title_matches_rank_first(self):
+        # "paris" is in the title of one movie and the overview of both
+        self.assertEqual(self.titles('paris'), ['Paris Letters', 'Summer Wedding'])
+        self.assertEqual(self.titles('vault'), ['The Vault', 'Night Job'])
+
+        with self.settings(SEARCH_RANKED_CANDIDATES=1):
+            # Too many matches to rank: title matches, then the rest
+            self.assertEqual(self.titles('vault'), ['The Vault', 'Night Job'])
+            self.assertEqual(search_movie_ids('vault', limit=1), [self.movies[4].id])
+
+    def test_index_follows_catalog_writes(self):
+        self.movies[0].title = 'Crimson World'
+        self.movies[0].save()
+        self.movies[1].delete()
+        Movie.objects.create(title='Mars Attacks', overview='Martians invade', release_date='2020-01-01')
+
+        self.assertEqual(self.titles('crimson'), ['Crimson World'])
+        self.assertEqual(self.titles('orbit'), [])
+        self.assertEqual(self.titles('mars'), ['Mars Attacks', 'Crimson World'])
+
+        output = StringIO()
+        call_command('rebuild_search_index', stdout=output)
+        self.assertIn('Rebuilt the movie search index', output.getvalue())
+        self.assertEqual(self.titles('mars'), ['Mars Attacks', 'Crimson World'])
+
+    def test_results_stop_at_the_cap(self):
+        with self.settings(SEARCH_MAX_RESULTS=2):
+            response = self.client.get('/api/movies/', {'search': 'a', 'fields': 'id', 'page_size': 1})
+            ids = [movie['id'] for movie in response.data['results']]
+            while response.data['next']:
+                response = self.client.get(response.data['next'])
+                ids += [movie['id'] for movie in response.data['results']]
+
+        self.assertEqual(len(search_movie_ids('a')), 6)
+        self.assertEqual(ids, search_movie_ids('a', limit=2))
+
+    def test_sync_triggers_survive_the_migrations(self):
+        # A migration rebuilding movies_movie drops them; see migration 0005
+        self.assertEqual(missing_sync_triggers(), [])
+
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER movies_movie_fts_update')
+        self.addCleanup(search._available.clear)
+        search._available.clear()
+
+        self.assertFalse(search_available())
+        # Unindexed, but never stale
+        Movie.objects.filter(pk=self.movies[0].pk).update(title='Crimson World')
+        self.assertEqual(self.titles('crimson'), ['Crimson World'])
+        with self.assertRaisesMessage(CommandError, 'movies_movie_fts_update'):
+            call_command('rebuild_search_index', stdout=StringIO())
+
+
+
+class ConditionalGetTests(ArtifactDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        caches['catalog'].clear()
+        self.user = User.objects.create_user('viewer')
+        self.movies = create_themed_movies()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def revalidate(self, path, params=None, **headers):
+        """Status of a conditional repeat of a GET to `path`"""
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return self.client.get(path, params, HTTP_IF_NONE_MATCH=response['ETag'], **headers).status_code
+
+    def test_unchanged_responses_are_not_modified(self):
+        detail = f"/api/movies/{self.movies[0].id}/"
+        for path in ('/api/movies/', detail, f"{detail}full/", '/api/genres/'):
+            self.assertEqual(self.revalidate(path), 304, path)
+
+        response = self.client.get(detail)
+        self.assertEqual(
+            self.client.get(detail, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_changes_make_the_etag_stale(self):
+        path = f"/api/movies/{self.movies[0].id}/"
+        etag = self.client.get(path)['ETag']
+        changes = [
+            lambda: Movie.objects.filter(pk=self.movies[0].pk).update(title='Renamed', updated_at=timezone.now()),
+            # The user's own state is part of the response
+            lambda: Favorite.objects.create(user=self.user, movie=self.movies[0]),
+        ]
+        for change in changes:
+            change()
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+
+        Favorite.objects.create(user=User.objects.create_user('other'), movie=self.movies[1])
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_field_selection_is_part_of_the_etag(self):
+        for path in ('/api/movies/', f"/api/movies/{self.movies[0].id}/", f"/api/movies/{self.movies[0].id}/full/"):
+            full = self.client.get(path)['ETag']
+            selected = self.client.get(path, {'fields': 'id,title'})['ETag']
+            self.assertNotEqual(full, selected, path)
+            self.assertNotEqual(full, self.client.get(path, {'omit': 'overview'})['ETag'], path)
+            self.assertNotEqual(full, self.client.get(path, {'compact': 'true'})['ETag'], path)
+            # The same selection in another order is the same representation
+            self.assertEqual(selected, self.client.get(path, {'fields': 'title, id'})['ETag'], path)
+            self.assertEqual(
+                self.client.get(path, {'fields': 'id,title'}, HTTP_IF_NONE_MATCH=full).status_code, 200, path
+            )
+
+    def test_anonymous_responses_revalidate_from_the_cache(self):
+        self.client.force_authenticate(None)
+        path = f"/api/movies/{self.movies[0].id}/"
+        self.assertEqual(self.revalidate(path), 304)
+        self.assertEqual(self.revalidate(path, {'fields': 'id'}), 304)
+        self.assertNotEqual(self.client.get(path)['ETag'], self.client.get(path, {'fields': 'id'})['ETag'])
+
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        caches['catalog'].clear()
+        self.user = User.objects.create_user('viewer')
+        self.movies = create_movies(3)
+        self.anonymous = APIClient()
+        self.writer = APIClient()
+        self.writer.force_authenticate(self.user)
+
+    def queries(self, path, params=None, client=None):
+        """Number of queries serving a GET"""
+        with CaptureQueriesContext(connection) as queries:
+            response = (client or self.anonymous).get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_anonymous_reads_are_served_from_the_cache(self):
+        for path in ('/api/movies/', f"/api/movies/{self.movies[0].id}/", '/api/genres/'):
+            self.assertGreater(self.queries(path), 0)
+            self.assertEqual(self.queries(path), 0, path)
+        # Filters are normalized and unknown parameters ignored
+        self.assertGreater(self.queries('/api/movies/', {'genre': 'Drama'}), 0)
+        self.assertEqual(self.queries('/api/movies/', {'genre': ' drama ', 'utm_source': 'mail'}), 0)
+        # Authenticated reads embed user state and always build
+        self.assertGreater(self.queries('/api/movies/', client=self.writer), 0)
+        self.assertGreater(self.queries('/api/movies/', client=self.writer), 0)
+
+    def test_movie_writes_invalidate_the_list_and_their_detail(self):
+        detail, other = f"/api/movies/{self.movies[0].id}/", f"/api/movies/{self.movies[1].id}/"
+        for path in ('/api/movies/', detail, other):
+            self.queries(path)
+
+        response = self.writer.patch(detail, {'title': 'Renamed'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.anonymous.get(detail).data['title'], 'Renamed')
+        self.assertIn('Renamed', [movie['title'] for movie in self.anonymous.get('/api/movies/').data['results']])
+        self.assertEqual(self.queries(other), 0)
+
+        self.writer.delete(other)
+        self.assertEqual(self.anonymous.get(other).status_code, 404)
+
+    def test_ratings_invalidate_only_their_movies_detail(self):
+        detail, other = f"/api/movies/{self.movies[0].id}/", f"/api/movies/{self.movies[1].id}/"
+        for path in ('/api/movies/', detail, other):
+            self.queries(path)
+
+        self.writer.post('/api/ratings/', {'movie_id': self.movies[0].id, 'rating': 8}, format='json')
+
+        self.assertEqual(self.anonymous.get(detail).data['average_rating'], 8.0)
+        self.assertEqual(self.queries(other), 0)
+        # List pages catch up on the cache timeout
+        self.assertEqual(self.queries('/api/movies/'), 0)
+
+        self.writer.post('/api/ratings/bulk/', {'ratings': [{'movie_id': self.movies[1].id, 'rating': 4}]},
+                         format='json')
+        self.assertEqual(self.anonymous.get(other).data['average_rating'], 4.0)
+
+    def test_invalidating_everything(self):
+        self.queries('/api/genres/')
+        invalidate_catalog()
+        self.assertGreater(self.queries('/api/genres/'), 0)
+
+
+
+class FieldSelectionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('viewer')
+        self.movie = create_themed_movies()[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fields(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.data['results'][0] if 'results' in response.data else response.data
+        return data
+
+    def test_fields_and_omit_shape_movie_responses(self):
+        detail = f"/api/movies/{self.movie.id}/"
+        for path in ('/api/movies/', detail):
+            self.assertEqual(list(self.fields(path, fields='title,id')), ['id', 'title'])
+            omitted = self.fields(path, omit='overview,genres')
+            self.assertNotIn('overview', omitted)
+            self.assertNotIn('genres', omitted)
+            self.assertIn('title', omitted)
+            # Unknown names are ignored, write-only fields never rendered
+            self.assertEqual(list(self.fields(path, fields='id,nonsense,genre_ids')), ['id'])
+
+    def test_compact_movies_render_genre_ids(self):
+        data = self.fields('/api/movies/', compact='true')
+
+        self.assertEqual(set(data), set(COMPACT_MOVIE_FIELDS))
+        self.assertEqual(self.fields('/api/movies/', compact='1', fields='id,genres')['genres'],
+                         list(self.movie.genres.values_list('id', flat=True)))
+        self.assertEqual(self.fields('/api/movies/')['genres'][0]['name'], 'Science Fiction')
+
+    def test_unrendered_fields_are_not_computed(self):
+        with CaptureQueriesContext(connection) as full:
+            self.client.get('/api/movies/')
+        with CaptureQueriesContext(connection) as selected:
+            self.client.get('/api/movies/', {'fields': 'id,title'})
+
+        # No genre prefetch and no user state
+        self.assertEqual(len(full) - len(selected), 4)
+        self.assertFalse(any('movies_genre' in query['sql'] for query in selected))
+
+    def test_selection_applies_to_recommendations_and_writes_render_in_full(self):
+        response = self.client.get('/api/recommendations/', {'movie_id': self.movie.id, 'fields': 'id'})
+        self.assertTrue(all(list(movie) == ['id'] for movie in response.data))
+
+        response = self.client.post(
+            '/api/movies/?fields=id', {'title': 'New', 'overview': 'Plot', 'release_date': '2020-01-01'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('title', response.data)
+
+
+class CompositeDetailTests(ArtifactDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        caches['catalog'].clear()
+        self.movies = create_themed_movies()
+        get_content_model()
+        self.users = [User.objects.create_user(f"viewer{number}") for number in range(3)]
+        now = timezone.now()
+        for number, (user, score) in enumerate(zip(self.users, (8, 6, 8))):
+            rating = Rating.objects.create(user=user, movie=self.movies[0], rating=score, comment=f"Note {number}")
+            Rating.objects.filter(pk=rating.pk).update(created_at=now - datetime.timedelta(minutes=10 - number))
+        self.user = self.users[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.path = f"/api/movies/{self.movies[0].id}/full/"
+
+    def test_bundles_the_movie_its_ratings_and_similar_movies(self):
+        Favorite.objects.create(user=self.user, movie=self.movies[1])
+
+        data = self.client.get(self.path).data
+
+        self.assertEqual(data['movie']['id'], self.movies[0].id)
+        self.assertEqual(data['movie']['user_rating'], 8)
+        ratings = data['ratings']
+        self.assertEqual((ratings['count'], ratings['average']), (3, 22 / 3))
+        self.assertEqual(ratings['histogram'], rating_histogram(self.movies[0].id))
+        self.assertEqual((ratings['histogram'][8], ratings['histogram'][6]), (2, 1))
+        # Newest first, without the movie repeated on each rating
+        self.assertEqual([rating['username'] for rating in ratings['results']], ['viewer2', 'viewer1', 'viewer0'])
+        self.assertNotIn('movie', ratings['results'][0])
+        # The themed twin comes first; similar movies are compact and carry the user's state
+        similar = data['similar']
+        self.assertEqual(similar[0]['id'], self.movies[1].id)
+        self.assertNotIn(self.movies[0].id, [movie['id'] for movie in similar])
+        self.assertEqual(set(similar[0]), {*COMPACT_MOVIE_FIELDS, 'is_favorite', 'is_in_watchlist'})
+        self.assertEqual([movie['is_favorite'] for movie in similar[:2]], [True, False])
+
+    def test_user_state_is_loaded_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.path)
+
+        self.assertEqual(response.status_code, 200)
+        for table in ('movies_favorite', 'movies_watchlist', 'movies_genre'):
+            self.assertEqual(sum(table in query['sql'] for query in queries), 1, table)
+
+    def test_ratings_are_capped_and_the_field_selection_applies_to_the_movie(self):
+        with mock.patch.object(MovieViewSet, 'full_ratings_count', 2):
+            data = self.client.get(self.path, {'fields': 'id,title'}).data
+
+        self.assertEqual(list(data['movie']), ['id', 'title'])
+        self.assertEqual(len(data['ratings']['results']), 2)
+        self.assertEqual(data['ratings']['count'], 3)
+
+    def test_new_ratings_make_the_etag_stale(self):
+        etag = self.client.get(self.path)['ETag']
+        self.assertEqual(self.client.get(self.path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Rating.objects.create(user=User.objects.create_user('late'), movie=self.movies[0], rating=2)
+
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ratings']['results'][0]['username'], 'late')
+        self.assertEqual(self.client.get('/api/movies/0/full/').status_code, 404)
+
+
+class MovieRatingsFeedTests(TestCase):
+    def setUp(self):
+        caches['catalog'].clear()
+        self.movies = create_movies(2)
+        self.users = [User.objects.create_user(f"viewer{number}") for number in range(7)]
+        now = timezone.now()
+        self.ratings = []
+        for number, user in enumerate(self.users):
+            rating = Rating.objects.create(user=user, movie=self.movies[0], rating=number % 3 + 4)
+            self.ratings.append(rating)
+        # The two oldest ratings share a time; ties go by id
+        for number, rating in enumerate(self.ratings):
+            Rating.objects.filter(pk=rating.pk).update(created_at=now - datetime.timedelta(minutes=min(number, 5)))
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        self.path = f"/api/movies/{self.movies[0].id}/ratings/"
+
+    def get(self, path, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response, queries
+
+    def test_pages_are_newest_first_with_the_summary(self):
+        pages = []
+        response, _ = self.get(self.path, {'page_size': 3})
+        while True:
+            pages.append([rating['id'] for rating in response.data['results']])
+            self.assertEqual(response.data['count'], 7)
+            self.assertEqual(response.data['histogram'], {**dict.fromkeys(range(1, 11), 0), 4: 3, 5: 2, 6: 2})
+            if not response.data['next']:
+                break
+            response, _ = self.get(response.data['next'])
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(
+            sum(pages, []),
+            list(Rating.objects.filter(movie=self.movies[0]).order_by('-created_at', 'id').values_list('id', flat=True)),
+        )
+        self.assertEqual(response.data['average'], 34 / 7)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'user', 'username', 'rating', 'comment', 'created_at'})
+
+    def test_queries_do_not_grow_with_the_ratings(self):
+        _, small = self.get(self.path, {'page_size': 1})
+        _, large = self.get(self.path, {'page_size': 7})
+
+        self.assertEqual(len(small), len(large))
+        # The summary comes from the stored aggregates, not from scanning ratings
+        self.assertFalse(any('AVG(' in query['sql'] or 'COUNT(' in query['sql'] for query in large))
+
+    def test_other_movies_ratings_keep_the_etag(self):
+        etag = self.client.get(self.path)['ETag']
+        self.assertEqual(self.client.get(self.path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Rating.objects.create(user=self.users[1], movie=self.movies[1], rating=9)
+        self.assertEqual(self.client.get(self.path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Rating.objects.filter(pk=self.ratings[0].pk).update(comment='Edited', updated_at=timezone.now())
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['comment'], 'Edited')
+
+    def test_anonymous_pages_are_cached_until_the_movie_is_rated(self):
+        anonymous = APIClient()
+        anonymous.get(self.path)
+        with CaptureQueriesContext(connection) as queries:
+            anonymous.get(self.path)
+        self.assertEqual(len(queries), 0)
+
+        Rating.objects.create(user=User.objects.create_user('late'), movie=self.movies[0], rating=10)
+
+        response = anonymous.get(self.path)
+        self.assertEqual(response.data['count'], 8)
+        self.assertEqual(response.data['results'][0]['username'], 'late')
+        self.assertEqual(anonymous.get('/api/movies/0/ratings/').status_code, 404)
+
+
+class BulkWriteTests(TestCase):
+    def setUp(self):
+        caches['catalog'].clear()
+        self.user = User.objects.create_user('viewer')
+        self.movies = create_movies(5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def precompute(self):
+        """A stored list the next change to the user's inputs must drop"""
+        UserRecommendation.objects.create(
+            user=self.user, recommendation_type='collaborative', movie_ids=[self.movies[4].id],
+            model_version='v1', computed_at=timezone.now(),
+        )
+
+    def post(self, path, data):
+        response = self.client.post(path, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [result['status'] for result in response.data['results']], response.data['counts']
+
+    def test_ratings_are_upserted_item_by_item(self):
+        Rating.objects.create(user=self.user, movie=self.movies[0], rating=5, comment='Keep')
+        Rating.objects.create(user=self.user, movie=self.movies[3], rating=6)
+
+        statuses, counts = self.post('/api/ratings/bulk/', {'ratings': [
+            {'movie_id': self.movies[0].id, 'rating': 7},
+            {'movie_id': self.movies[1].id, 'rating': 8, 'comment': 'New'},
+            {'movie_id': self.movies[0].id, 'rating': 2},
+            {'movie_id': self.movies[2].id, 'rating': 11},
+            {'movie_id': 0, 'rating': 5},
+            {'movie_id': self.movies[3].id, 'rating': 6},
+        ]})
+
+        self.assertEqual(statuses, ['updated', 'created', 'duplicate', 'invalid', 'not_found', 'unchanged'])
+        self.assertEqual(counts['updated'], 1)
+        stored = {rating.movie_id: (rating.rating, rating.comment) for rating in Rating.objects.filter(user=self.user)}
+        # An omitted comment keeps the stored one
+        self.assertEqual(stored, {
+            self.movies[0].id: (7, 'Keep'), self.movies[1].id: (8, 'New'), self.movies[3].id: (6, None),
+        })
+
+    def test_ratings_apply_what_the_signals_would(self):
+        other = User.objects.create_user('other')
+        Rating.objects.create(user=other, movie=self.movies[0], rating=4)
+        Rating.objects.create(user=self.user, movie=self.movies[0], rating=4)
+        rank_key = TrendingScore.objects.get(movie=self.movies[0]).rank_key
+        self.precompute()
+        version = user_state_version(self.user.id)
+        detail = f"/api/movies/{self.movies[0].id}/"
+        APIClient().get(detail)
+
+        self.post('/api/ratings/bulk/', {'ratings': [
+            {'movie_id': self.movies[0].id, 'rating': 10}, {'movie_id': self.movies[1].id, 'rating': 3},
+        ]})
+
+        movie = Movie.objects.get(pk=self.movies[0].pk)
+        self.assertEqual((movie.rating_count, movie.rating_average), (2, 7.0))
+        self.assertEqual((rating_histogram(movie.id)[4], rating_histogram(movie.id)[10]), (1, 1))
+        self.assertEqual(APIClient().get(detail).data['average_rating'], 7.0)
+        # Only new ratings are trending events
+        self.assertEqual(TrendingScore.objects.get(movie=self.movies[0]).rank_key, rank_key)
+        self.assertTrue(TrendingScore.objects.filter(movie=self.movies[1]).exists())
+        self.assertEqual(
+            set(PendingNeighborUpdate.objects.values_list('movie_id', flat=True)), {self.movies[0].id, self.movies[1].id}
+        )
+        self.assertNotEqual(user_state_version(self.user.id), version)
+        self.assertFalse(UserRecommendation.objects.exists())
+
+    def test_unchanged_ratings_write_nothing(self):
+        Rating.objects.create(user=self.user, movie=self.movies[0], rating=5)
+        PendingNeighborUpdate.objects.all().delete()
+        self.precompute()
+        version = user_state_version(self.user.id)
+
+        statuses, _ = self.post('/api/ratings/bulk/', {'ratings': [{'movie_id': self.movies[0].id, 'rating': 5}]})
+
+        self.assertEqual(statuses, ['unchanged'])
+        self.assertEqual(user_state_version(self.user.id), version)
+        self.assertTrue(UserRecommendation.objects.exists())
+        self.assertFalse(PendingNeighborUpdate.objects.exists())
+
+    def test_favorites_and_watchlist_add_and_remove(self):
+        for model, path in ((Favorite, '/api/favorites/bulk/'), (Watchlist, '/api/watchlist/bulk/')):
+            model.objects.create(user=self.user, movie=self.movies[0])
+            model.objects.create(user=self.user, movie=self.movies[2])
+            self.precompute()
+            version = user_state_version(self.user.id)
+            before = TrendingScore.objects.get(movie=self.movies[2]).rank_key
+
+            statuses, counts = self.post(path, {
+                'add': [self.movies[0].id, self.movies[1].id, self.movies[1].id, 'x', 0],
+                'remove': [self.movies[2].id, self.movies[3].id],
+            })
+
+            self.assertEqual(
+                statuses, ['exists', 'created', 'duplicate', 'invalid', 'not_found', 'removed', 'absent'], path
+            )
+            self.assertEqual(counts['created'], 1)
+            self.assertEqual(
+                set(model.objects.filter(user=self.user).values_list('movie_id', flat=True)),
+                {self.movies[0].id, self.movies[1].id},
+            )
+            self.assertTrue(TrendingScore.objects.filter(movie=self.movies[1]).exists())
+            # Removals withdraw their event again
+            self.assertLess(TrendingScore.objects.get(movie=self.movies[2]).rank_key, before)
+            self.assertNotEqual(user_state_version(self.user.id), version)
+            self.assertFalse(UserRecommendation.objects.exists())
+
+            # Additions alone send no signals
+            self.precompute()
+            version = user_state_version(self.user.id)
+            self.post(path, {'add': [self.movies[3].id]})
+            self.assertNotEqual(user_state_version(self.user.id), version)
+            self.assertFalse(UserRecommendation.objects.exists())
+            model.objects.all().delete()
+            TrendingScore.objects.all().delete()
+
+    def test_requests_are_checked_before_anything_is_written(self):
+        response = self.client.post('/api/favorites/bulk/', {'add': self.movies[0].id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        with override_settings(BULK_WRITES={'MAX_ITEMS': 2}):
+            response = self.client.post(
+                '/api/watchlist/bulk/', {'add': [self.movies[0].id, self.movies[1].id], 'remove': [self.movies[2].id]},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 400)
+        response = APIClient().post(
+            '/api/ratings/bulk/', {'ratings': [{'movie_id': self.movies[0].id, 'rating': 5}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Watchlist.objects.exists() or Rating.objects.exists())
+
+
+class PrecomputedRecommendationTests(ArtifactDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [User.objects.create_user(f"viewer{number}") for number in range(6)]
+        self.movies = create_movies(14)
+        scores = [[9, 8] + [None] * 12]
+        for number in range(1, 6):
+            scores.append([
+                (number * 3 + column * 5) % 10 + 1 if (number + column) % 4 else None for column in range(14)
+            ])
+        scores[1][:2] = [9, 8]
+        create_ratings(self.users, self.movies, scores)
+
+    def recommended(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/recommendations/', {'type': 'collaborative', 'fields': 'id'})
+        self.assertEqual(response.status_code, 200)
+        return [movie['id'] for movie in response.data]
+
+    def test_precomputed_and_live_lists_agree(self):
+        live = {user.id: self.recommended(user) for user in self.users}
+        caches['recommendations'].clear()
+
+        precompute_recommendations(types=['collaborative'], top_n=10)
+
+        stored = dict(UserRecommendation.objects.values_list('user_id', 'movie_ids'))
+        # Both a full list, served as stored, and short ones, which the live path fills
+        self.assertEqual(len(stored[self.users[0].id]), 10)
+        self.assertTrue(any(len(movie_ids) < 10 for movie_ids in stored.values()))
+        for user in self.users:
+            self.assertEqual(self.recommended(user), live[user.id], user.username)
+
+    def test_no_collaborative_lists_without_enough_data(self):
+        UserRecommendation.objects.create(
+            user=self.users[0], recommendation_type='collaborative', movie_ids=[self.movies[5].id],
+            model_version='old', computed_at=timezone.now(),
+        )
+        User.objects.filter(pk__in=[user.pk for user in self.users[2:]]).delete()
+
+        precompute_recommendations(types=['collaborative'], top_n=10)
+
+        self.assertFalse(UserRecommendation.objects.exists())
+
+
+class ItemNeighborTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f"rater{number}") for number in range(4)]
+        self.movies = create_movies(4)
+        create_ratings(self.users, self.movies, [
+            [9, 8, 2, None],
+            [8, 9, None, 3],
+            [2, 3, 9, 8],
+            [None, 2, 8, 9],
+        ])
+
+    def neighbors(self):
+        return {
+            (movie_id, neighbor_id): round(score, 6)
+            for movie_id, neighbor_id, score in ItemNeighbor.objects.values_list('movie_id', 'neighbor_id', 'score')
+        }
+
+    def test_rating_writes_queue_the_movie(self):
+        client = APIClient()
+        client.force_authenticate(self.users[3])
+
+        response = client.post('/api/ratings/', {'movie_id': self.movies[0].id, 'rating': 4}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(PendingNeighborUpdate.objects.values_list('movie_id', flat=True)), [self.movies[0].id])
+        self.assertFalse(ItemNeighbor.objects.exists())
+
+    def test_pending_updates_match_a_full_build(self):
+        build_item_neighbors()
+        built = self.neighbors()
+        Rating.objects.filter(user=self.users[0], movie=self.movies[2]).update(rating=7)
+        PendingNeighborUpdate.objects.create(movie=self.movies[2])
+
+        self.assertEqual(process_neighbor_updates(), 1)
+        updated = self.neighbors()
+        self.assertFalse(PendingNeighborUpdate.objects.exists())
+
+        build_item_neighbors()
+        self.assertEqual(updated, self.neighbors())
+        self.assertNotEqual(updated, built)
+
+    def test_full_build_clears_the_queue(self):
+        PendingNeighborUpdate.objects.create(movie=self.movies[1])
+        build_item_neighbors()
+        self.assertFalse(PendingNeighborUpdate.objects.exists())
+
+    def test_scores_are_cosines_of_the_rating_columns(self):
+        build_item_neighbors()
+        columns = np.array([[9, 8, 2, 0], [8, 9, 0, 3], [2, 3, 9, 8], [0, 2, 8, 9]], dtype=np.float64)
+        columns /= np.linalg.norm(columns, axis=0)
+        expected = {
+            (self.movies[a].id, self.movies[b].id): round(columns[:, a] @ columns[:, b], 6)
+            for a in range(4) for b in range(4) if a != b and columns[:, a] @ columns[:, b] > 0
+        }
+
+        self.assertEqual(self.neighbors().keys(), expected.keys())
+        for pair, score in self.neighbors().items():
+            self.assertAlmostEqual(score, expected[pair], places=5)
+        # Most similar first
+        self.assertEqual(
+            [movie.id for movie in get_item_based_recommendations(movie_id=self.movies[0].id, top_n=3)],
+            [self.movies[1].id, self.movies[3].id, self.movies[2].id],
+        )
+
+    def test_user_scores_weight_deviations_from_their_mean(self):
+        user = User.objects.create_user('viewer')
+        liked, disliked, *candidates = create_movies(5)
+        create_ratings([user], [liked, disliked], [[9, 3]])
+        ItemNeighbor.objects.bulk_create([
+            ItemNeighbor(movie=liked, neighbor=candidates[0], score=0.9),
+            ItemNeighbor(movie=liked, neighbor=candidates[1], score=0.2),
+            ItemNeighbor(movie=liked, neighbor=disliked, score=0.5),
+            ItemNeighbor(movie=disliked, neighbor=candidates[1], score=0.8),
+            ItemNeighbor(movie=disliked, neighbor=candidates[2], score=0.5),
+        ])
+
+        # Mean 6: candidate 0 scores 0.9 * 3, 1 scores 0.2 * 3 - 0.8 * 3 and 2 scores -0.5 * 3
+        self.assertEqual(
+            [movie.id for movie in get_item_based_recommendations(user_id=user.id, top_n=1)], [candidates[0].id]
+        )
+
+    @override_settings(RECOMMENDER_ITEM_UPDATE_RATERS=1)
+    def test_updates_use_the_most_recent_raters(self):
+        update_item_neighbors(self.movies[3].id)
+
+        # rater3 rated movie 3 last and has not rated movie 0
+        self.assertEqual(
+            set(ItemNeighbor.objects.filter(movie=self.movies[3]).values_list('neighbor_id', flat=True)),
+            {self.movies[1].id, self.movies[2].id},
+        )
+
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('viewer')
+        self.movies = create_movies(4)
+        for movie, popularity in zip(self.movies, (40, 30, 20, 10)):
+            Movie.objects.filter(pk=movie.pk).update(popularity=popularity)
+
+    def score(self, movie, moment=None):
+        return math.exp(TrendingScore.objects.get(movie=movie).rank_key - time_key(moment))
+
+    def test_events_maintain_the_rank_key(self):
+        favorite = Favorite.objects.create(user=self.user, movie=self.movies[2])
+        self.assertAlmostEqual(self.score(self.movies[2]), 3.0, places=4)
+
+        Watchlist.objects.create(user=self.user, movie=self.movies[2])
+        Rating.objects.create(user=self.user, movie=self.movies[2], rating=8)
+        self.assertAlmostEqual(self.score(self.movies[2]), 6.0, places=4)
+
+        favorite.delete()
+        self.assertAlmostEqual(self.score(self.movies[2]), 3.0, places=4)
+
+    def test_decay_halves_scores_and_prunes_faded_ones(self):
+        Favorite.objects.create(user=self.user, movie=self.movies[0])
+        Rating.objects.create(user=self.user, movie=self.movies[1], rating=5)
+        later = timezone.now() + datetime.timedelta(hours=72 * 7)
+
+        with mock.patch('movies.trending.django_timezone.now', return_value=later):
+            updated, pruned = decay_scores()
+
+        # 3 and 1 after seven half-lives; the rating's 1/128 is below MIN_SCORE
+        self.assertEqual((updated, pruned), (1, 1))
+        score = TrendingScore.objects.get(movie=self.movies[0])
+        self.assertAlmostEqual(score.score, 3 / 128, places=5)
+        self.assertAlmostEqual(self.score(self.movies[0], later), 3 / 128, places=5)
+
+    def test_rebuild_matches_the_incremental_scores(self):
+        Favorite.objects.create(user=self.user, movie=self.movies[0])
+        Watchlist.objects.create(user=self.user, movie=self.movies[1])
+        Rating.objects.create(user=self.user, movie=self.movies[1], rating=6)
+        Rating.objects.filter(movie=self.movies[1]).update(created_at=timezone.now() - datetime.timedelta(hours=72))
+        incremental = {self.movies[0].id: 3.0, self.movies[1].id: 2.5}
+
+        call_command('update_trending', '--rebuild', stdout=StringIO())
+
+        rebuilt = {score.movie_id: self.score(score.movie) for score in TrendingScore.objects.all()}
+        self.assertEqual(rebuilt.keys(), incremental.keys())
+        for movie_id, score in incremental.items():
+            self.assertAlmostEqual(rebuilt[movie_id], score, places=4)
+
+    def test_update_trending_refreshes_stored_scores(self):
+        Favorite.objects.create(user=self.user, movie=self.movies[0])
+        TrendingScore.objects.update(score=0)
+        output = StringIO()
+
+        call_command('update_trending', stdout=output)
+
+        self.assertIn('Decayed 1 trending scores, pruned 0', output.getvalue())
+        self.assertAlmostEqual(TrendingScore.objects.get().score, 3.0, places=4)
+
+    def test_trending_list_keeps_movies_without_activity(self):
+        Rating.objects.create(user=self.user, movie=self.movies[3], rating=7)
+        Favorite.objects.create(user=self.user, movie=self.movies[2])
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        ids = []
+        response = client.get('/api/movies/', {'trending': 'true', 'page_size': 3, 'fields': 'id'})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [movie['id'] for movie in response.data['results']]
+            if not response.data['next']:
+                break
+            response = client.get(response.data['next'])
+
+        # Scored movies by score, then the rest by popularity
+        self.assertEqual(ids, [self.movies[number].id for number in (2, 3, 0, 1)])
+
+        # and back again, across the boundary between the two
+        previous = []
+        while response.data['previous']:
+            response = client.get(response.data['previous'])
+            previous = [movie['id'] for movie in response.data['results']] + previous
+        self.assertEqual(previous, ids[:3])
+        self.assertEqual(client.get('/api/movies/', {'trending': 'true', 'cursor': 'bad'}).status_code, 404)
+
+    def test_trending_ties_and_filters(self):
+        for movie in self.movies[:3]:
+            Favorite.objects.create(user=self.user, movie=movie)
+        TrendingScore.objects.update(rank_key=1.0)
+        self.movies[1].genres.add(Genre.objects.create(name='Drama'))
+        self.movies[3].genres.add(Genre.objects.get(name='Drama'))
+        client = APIClient()
+
+        response = client.get('/api/movies/', {'trending': 'true', 'page_size': 2, 'fields': 'id'})
+        following = client.get(response.data['next']).data['results']
+        # Equal scores go by id
+        self.assertEqual(
+            [movie['id'] for movie in response.data['results'] + following],
+            [self.movies[number].id for number in (0, 1, 2, 3)],
+        )
+        response = client.get('/api/movies/', {'trending': 'true', 'genre': 'drama', 'fields': 'id'})
+        self.assertEqual([movie['id'] for movie in response.data['results']], [self.movies[1].id, self.movies[3].id])
+
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        for title, popularity in (('The Dark Knight', 50), ('Dark Water', 20), ('Knight and Day', 30), ('Amélie', 10)):
+            Movie.objects.create(title=title, overview='', release_date='2020-01-01', popularity=popularity)
+        self.addCleanup(autocomplete._state.update, index=None)
+        autocomplete._state['index'] = None
+
+    def titles(self, index, query, limit=10):
+        return [title for _, title, _ in index.lookup(query, limit)]
+
+    def test_prefixes_match_any_word_by_popularity(self):
+        index = TitleIndex.build()
+
+        self.assertEqual(self.titles(index, 'dark'), ['The Dark Knight', 'Dark Water'])
+        self.assertEqual(self.titles(index, 'KNIG'), ['The Dark Knight', 'Knight and Day'])
+        self.assertEqual(self.titles(index, 'dark kn'), ['The Dark Knight'])
+        self.assertEqual(self.titles(index, 'amelie'), ['Amélie'])
+        self.assertEqual(self.titles(index, 'knight', limit=1), ['The Dark Knight'])
+        self.assertEqual(self.titles(index, '  '), [])
+
+    def test_refresh_applies_inserts_updates_and_deletes(self):
+        index = TitleIndex.build()
+        Movie.objects.create(title='Darkest Hour', overview='', release_date='2020-01-01', popularity=40)
+        water = Movie.objects.get(title='Dark Water')
+        water.title = 'Deep Water'
+        water.save()
+        Movie.objects.filter(title='Knight and Day').delete()
+
+        self.assertEqual(index.refresh(), 3)
+
+        self.assertEqual(self.titles(index, 'dark'), ['The Dark Knight', 'Darkest Hour'])
+        self.assertEqual(self.titles(index, 'water'), ['Deep Water'])
+        self.assertEqual(self.titles(index, 'knight'), ['The Dark Knight'])
+        self.assertEqual(index.refresh(), 0)
+
+    def test_cached_tops_follow_refreshes(self):
+        index = TitleIndex.build(cache_min_keys=2, top_size=2)
+        self.assertEqual(self.titles(index, 'd', limit=2), ['The Dark Knight', 'Knight and Day'])
+        self.assertIn('d', index.tops)
+
+        Movie.objects.create(title='Dune', overview='', release_date='2020-01-01', popularity=45)
+        index.refresh()
+        self.assertEqual(self.titles(index, 'd', limit=2), ['The Dark Knight', 'Dune'])
+
+        Movie.objects.filter(title='Dune').delete()
+        index.refresh()
+        # The shortened top is dropped and ranked again
+        self.assertNotIn('d', index.tops)
+        self.assertEqual(self.titles(index, 'd', limit=2), ['The Dark Knight', 'Knight and Day'])
+
+    def test_lookups_wait_for_a_refresh_in_progress(self):
+        index = TitleIndex.build()
+        results = []
+        lookup = threading.Thread(target=lambda: results.append(self.titles(index, 'dark')))
+
+        with index._lock:
+            lookup.start()
+            lookup.join(0.1)
+            self.assertTrue(lookup.is_alive())
+        lookup.join()
+
+        self.assertEqual(results, [['The Dark Knight', 'Dark Water']])
+
+    @override_settings(AUTOCOMPLETE={'REFRESH_SECONDS': 0})
+    def test_lookups_do_not_wait_for_another_threads_refresh(self):
+        index = autocomplete.get_title_index()
+        refreshing, release = threading.Event(), threading.Event()
+
+        def slow_refresh():
+            refreshing.set()
+            release.wait(5)
+            return 0
+
+        with mock.patch.object(index, 'refresh', side_effect=slow_refresh) as refresh:
+            refresher = threading.Thread(target=autocomplete.get_title_index)
+            refresher.start()
+            self.assertTrue(refreshing.wait(5))
+
+            self.assertEqual([movie['title'] for movie in autocomplete.autocomplete('dark')],
+                             ['The Dark Knight', 'Dark Water'])
+            self.assertEqual(refresh.call_count, 1)
+            release.set()
+            refresher.join()
+
+    @override_settings(AUTOCOMPLETE={'REFRESH_SECONDS': 0})
+    def test_endpoint_serves_the_refreshed_index(self):
+        client = APIClient()
+        self.assertEqual(
+            [movie['title'] for movie in client.get('/api/movies/autocomplete/', {'q': 'dark'}).data],
+            ['The Dark Knight', 'Dark Water'],
+        )
+        Movie.objects.filter(title='Dark Water').delete()
+
+        response = client.get('/api/movies/autocomplete/', {'q': 'dark', 'limit': 'x'})
+
+        self.assertEqual([movie['title'] for movie in response.data], ['The Dark Knight'])
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        Genre.objects.create(name='Action')
+
+    def dump(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as dump:
+            dump.write('\n'.join(lines) + '\n')
+        return path
+
+    def jsonl(self, records, name='movies.jsonl'):
+        return self.dump(name, [record if isinstance(record, str) else json.dumps(record) for record in records])
+
+    def import_movies(self, path, *args):
+        output = StringIO()
+        call_command('import_movies', path, *args, stdout=output)
+        return output.getvalue()
+
+    def test_imports_jsonl_and_upserts(self):
+        Movie.objects.create(title='Old title', overview='', release_date='2000-01-01', tmdb_id=1)
+        path = self.jsonl([
+            tmdb_record(1, title='New title', genre_ids=(28, 18)),
+            tmdb_record(2, genre_ids=()),
+            {**tmdb_record(3), 'genres': [{'id': 1, 'name': 'Cult'}], 'genre_ids': None},
+            {'title': 'No id'},
+        ])
+
+        output = self.import_movies(path, '--batch-size', '2')
+
+        self.assertIn('2 created, 1 updated, 1 skipped', output)
+        movie = Movie.objects.get(tmdb_id=1)
+        self.assertEqual((movie.title, movie.popularity), ('New title', 1.0))
+        self.assertEqual(movie.poster_path, 'https://image.tmdb.org/t/p/w500/1.jpg')
+        self.assertEqual(sorted(movie.genres.values_list('name', flat=True)), ['Action', 'Drama'])
+        self.assertEqual(list(Movie.objects.get(tmdb_id=3).genres.values_list('name', flat=True)), ['Cult'])
+        self.assertFalse(os.path.exists(f"{path}.checkpoint"))
+
+    def test_imports_csv(self):
+        path = self.dump('movies.csv', [
+            'tmdb_id,title,release_date,popularity,vote_count,genres',
+            '5,Five,2010-02-03,1.5,,Action|Comedy',
+        ])
+
+        self.assertIn('1 created, 0 updated, 0 skipped', self.import_movies(path))
+
+        movie = Movie.objects.get(tmdb_id=5)
+        self.assertEqual((movie.release_date, movie.popularity, movie.vote_count), (datetime.date(2010, 2, 3), 1.5, 0))
+        self.assertEqual(sorted(movie.genres.values_list('name', flat=True)), ['Action', 'Comedy'])
+
+    def test_keeps_genres_of_records_without_genre_data(self):
+        movie = Movie.objects.create(title='Kept', overview='', release_date='2000-01-01', tmdb_id=7)
+        movie.genres.add(Genre.objects.get(name='Action'))
+        path = self.dump('movies.csv', ['tmdb_id,title', '7,Renamed'])
+
+        self.import_movies(path)
+
+        movie.refresh_from_db()
+        self.assertEqual(movie.title, 'Renamed')
+        self.assertEqual(list(movie.genres.values_list('name', flat=True)), ['Action'])
+
+    def test_skips_malformed_records(self):
+        path = self.jsonl([
+            tmdb_record(1),
+            '{not json',
+            {**tmdb_record(2), 'release_date': '2020'},
+            {**tmdb_record(3), 'genre_ids': ['drama']},
+            [4],
+            tmdb_record(5),
+        ])
+
+        output = self.import_movies(path)
+
+        self.assertIn('2 created, 0 updated, 4 skipped', output)
+        self.assertIn('Skipped record 2:', output)
+        self.assertIn('Skipped record 5:', output)
+        self.assertEqual(sorted(Movie.objects.values_list('tmdb_id', flat=True)), [1, 5])
+
+    def test_resumes_from_checkpoint(self):
+        path = self.jsonl([tmdb_record(tmdb_id) for tmdb_id in range(1, 6)])
+        upsert = ingest.upsert_movies
+        batches = []
+
+        def interrupted(*args):
+            # The second batch is interrupted before it commits
+            batches.append(args)
+            if len(batches) > 1:
+                raise KeyboardInterrupt
+            return upsert(*args)
+
+        with mock.patch.object(ingest, 'upsert_movies', side_effect=interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.import_movies(path, '--batch-size', '2')
+
+        self.assertEqual(Movie.objects.count(), 2)
+        with open(f"{path}.checkpoint") as checkpoint:
+            self.assertEqual(json.load(checkpoint)['rows'], 2)
+
+        output = self.import_movies(path, '--batch-size', '2', '--resume')
+
+        self.assertIn('Resuming after 2 records', output)
+        self.assertIn('Imported 3 records', output)
+        self.assertEqual(sorted(Movie.objects.values_list('tmdb_id', flat=True)), [1, 2, 3, 4, 5])
+        self.assertFalse(os.path.exists(f"{path}.checkpoint"))
+
+    def test_starts_over_when_the_file_changed(self):
+        path = self.jsonl([tmdb_record(tmdb_id) for tmdb_id in range(1, 4)])
+        ImportMoviesCommand.save_checkpoint(f"{path}.checkpoint", ImportMoviesCommand.source_state(path), 2)
+        self.jsonl([tmdb_record(tmdb_id) for tmdb_id in range(1, 5)])
+
+        output = self.import_movies(path, '--resume')
+
+        self.assertIn('starting over', output)
+        self.assertIn('4 created', output)
+
+
+class InteractionImportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.first = Movie.objects.create(title='First', overview='', release_date='2020-01-01', tmdb_id=101)
+        self.second = Movie.objects.create(title='Second', overview='', release_date='2020-01-01', tmdb_id=102)
+        self.links = {'1': 101, '2': 102}
+
+    def ratings_file(self, *rows, header='userId,movieId,rating,timestamp'):
+        path = os.path.join(self.directory, 'ratings.csv')
+        with open(path, 'w') as ratings:
+            ratings.write('\n'.join((header, *rows)) + '\n')
+        return path
+
+    def import_file(self, path, batch_size=100, **options):
+        importer = InteractionImporter(movie_links=self.links, **options)
+        return importer, import_interactions(read_interactions(path), importer, batch_size)
+
+    def test_remaps_ids_and_creates_users(self):
+        existing = User.objects.create_user('ml_7')
+        path = self.ratings_file('7,1,4.0,1600000000', '8,2,3.0,1600000000', '8,3,5.0,1600000000')
+
+        importer, (rows, written, skipped) = self.import_file(path)
+
+        self.assertEqual((rows, written, skipped), (3, 2, 1))
+        self.assertEqual(importer.users_created, 1)
+        created = User.objects.get(username='ml_8')
+        self.assertFalse(created.has_usable_password())
+        self.assertEqual(
+            sorted(Rating.objects.values_list('user_id', 'movie_id')),
+            sorted([(existing.id, self.first.id), (created.id, self.second.id)]),
+        )
+
+    def test_scales_ratings_and_keeps_timestamps(self):
+        path = self.ratings_file('1,1,0.5,1600000000', '1,2,5.0,1600000100', '2,1,0.0,1600000000')
+
+        self.import_file(path)
+
+        self.assertEqual(
+            dict(Rating.objects.filter(user__username='ml_1').values_list('movie_id', 'rating')),
+            {self.first.id: 1, self.second.id: 10},
+        )
+        self.assertFalse(Rating.objects.filter(user__username='ml_2').exists())
+        rating = Rating.objects.get(movie=self.second)
+        at = datetime.datetime(2020, 9, 13, 12, 28, 20, tzinfo=datetime.timezone.utc)
+        self.assertEqual((rating.created_at, rating.updated_at), (at, at))
+
+    def test_timestamps_leave_the_shared_fields_alone(self):
+        user = User.objects.create_user('ml_1')
+        kept = Rating.objects.create(user=user, movie=self.first, rating=2).created_at
+        favorite = Favorite.objects.create(user=user, movie=self.second)
+        bulk_create = QuerySet.bulk_create
+        flags = []
+
+        def recording_bulk_create(queryset, *args, **kwargs):
+            if queryset.model in (Rating, Favorite):
+                fields = queryset.model._meta.concrete_fields
+                flags.extend(field.auto_now or field.auto_now_add for field in fields if field.name.endswith('_at'))
+                # A request saving meanwhile still gets its timestamps
+                web = User.objects.create_user(f"web{len(flags)}")
+                self.assertIsNotNone(Rating.objects.create(user=web, movie=self.second, rating=5).created_at)
+            return bulk_create(queryset, *args, **kwargs)
+
+        path = self.ratings_file('1,1,4.0,1600000000', '1,2,5.0,1600000100')
+        with mock.patch.object(QuerySet, 'bulk_create', recording_bulk_create):
+            self.import_file(path)
+            self.import_file(path, kind='favorite')
+
+        self.assertTrue(flags and all(flags))
+        updated = Rating.objects.get(user=user, movie=self.first)
+        at = datetime.datetime(2020, 9, 13, 12, 26, 40, tzinfo=datetime.timezone.utc)
+        # An updated rating keeps its creation time and takes the file's as its update time
+        self.assertEqual((updated.created_at, updated.updated_at), (kept, at))
+        self.assertEqual(Favorite.objects.get(pk=favorite.pk).created_at, favorite.created_at)
+        self.assertEqual(Favorite.objects.get(user=user, movie=self.first).created_at, at)
+
+    def test_later_rows_replace_earlier_ones(self):
+        path = self.ratings_file('1,1,2.0,1600000000', '1,1,3.0,1600000000', '1,2,1.0,1600000000', '1,2,4.0,1600000000')
+        self.import_file(path, batch_size=3)
+        self.assertEqual(
+            dict(Rating.objects.values_list('movie_id', 'rating')), {self.first.id: 6, self.second.id: 8}
+        )
+
+        # A second import updates the stored ratings in place
+        self.import_file(self.ratings_file('1,1,5.0,1600000000'))
+        self.assertEqual(Rating.objects.count(), 2)
+        self.assertEqual(Rating.objects.get(movie=self.first).rating, 10)
+
+    def test_refreshes_aggregates_and_user_state(self):
+        user = User.objects.create_user('ml_1')
+        UserRecommendation.objects.create(
+            user=user, recommendation_type='collaborative', movie_ids=[1], model_version='v',
+            computed_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc),
+        )
+        version = user_state_version(user.id)
+        path = self.ratings_file('1,1,4.0,1600000000', '2,1,2.5,1600000000', '3,1,4.0,1600000000')
+
+        self.import_file(path, batch_size=2)
+
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.rating_count, self.first.rating_sum), (3, 21))
+        self.assertAlmostEqual(self.first.rating_average, 7.0)
+        self.assertEqual(rating_histogram(self.first.id)[8], 2)
+        self.assertEqual(rating_histogram(self.first.id)[5], 1)
+        self.assertFalse(UserRecommendation.objects.filter(user=user).exists())
+        self.assertNotEqual(user_state_version(user.id), version)
+
+    def test_skips_malformed_rows(self):
+        path = self.ratings_file(
+            '1,1,4.0,1600000000', '3,1', '4,1,good,1600000000', '5,1,4.0,soon', '6,x,4.0,1', '7,2,4.0,',
+        )
+
+        importer, (rows, written, skipped) = self.import_file(path)
+
+        self.assertEqual((rows, written, skipped), (6, 2, 4))
+        self.assertEqual(
+            sorted(Rating.objects.values_list('user__username', flat=True)), ['ml_1', 'ml_7']
+        )
+
+    def test_committed_batches_are_finished_after_an_error(self):
+        class FailingImporter(InteractionImporter):
+            def write(self, rows):
+                if self.touched_movies:
+                    raise RuntimeError('interrupted')
+                return super().write(rows)
+
+        path = self.ratings_file('1,1,4.0,1600000000', '2,1,3.0,1600000000', '3,1,5.0,1600000000')
+        importer = FailingImporter(movie_links=self.links)
+
+        with self.assertRaises(RuntimeError):
+            import_interactions(read_interactions(path), importer, batch_size=2)
+
+        self.first.refresh_from_db()
+        self.assertEqual(Rating.objects.count(), 2)
+        self.assertEqual((self.first.rating_count, self.first.rating_sum), (2, 14))
+        self.assertEqual(rating_histogram(self.first.id)[8], 1)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Reads SQLite query plans')
+class IndexPlanTests(TestCase):
+    """The hot queries are served by the indexes from migration 0008 rather than scans or sorts"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('plans')
+        cls.movie = Movie.objects.create(title='Planned', overview='', release_date='2020-05-01', popularity=5)
+        Rating.objects.create(user=cls.user, movie=cls.movie, rating=8)
+        Favorite.objects.create(user=cls.user, movie=cls.movie)
+
+    def movie_list(self, **params):
+        view = MovieViewSet(action='list', format_kwarg=None)
+        view.request = Request(APIRequestFactory().get('/api/movies/', params))
+        return view.get_queryset()
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f"INDEX {index}", plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_movie_list_order(self):
+        self.assertUsesIndex(self.movie_list()[:20], 'movie_popularity_id_idx')
+
+    def test_movie_list_next_page(self):
+        after = self.movie_list().filter(popularity__lt=5)[:20]
+        self.assertUsesIndex(after, 'movie_popularity_id_idx')
+
+    def test_trending_pages(self):
+        caches['catalog'].clear()
+        Movie.objects.create(title='Unscored', overview='', release_date='2020-05-01', popularity=9)
+        client = APIClient()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/movies/', {'trending': 'true', 'page_size': 1, 'fields': 'id'})
+            client.get(response.data['next'])
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if query['sql'].startswith('SELECT "movies_movie"."id"'):
+                    cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                    plans.append(' '.join(row[-1] for row in cursor.fetchall()))
+        # Each page reads the scored movies off the rank index, then tops
+        # up with the rest off the popularity one
+        self.assertEqual(len(plans), 4)
+        for plan, index in zip(plans, ['trending_rank_movie_idx', 'movie_popularity_id_idx'] * 2):
+            self.assertIn(f"INDEX {index}", plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_year_filter(self):
+        movies = self.movie_list(year='2020').order_by()
+        self.assertUsesIndex(movies, 'movie_release_date_idx')
+        self.assertEqual(list(self.movie_list(year='2020')), [self.movie])
+        self.assertEqual(list(self.movie_list(year='2021')), [])
+        self.assertEqual(list(self.movie_list(year='not a year')), [self.movie])
+
+    def test_highly_rated_by_user(self):
+        ratings = Rating.objects.filter(user=self.user, rating__gte=7).order_by().values_list('movie_id', flat=True)
+        self.assertUsesIndex(ratings, 'rating_user_rating_idx')
+
+    def test_movie_ratings_feed(self):
+        ratings = Rating.objects.filter(movie=self.movie).order_by('-created_at', 'id')[:20]
+        self.assertUsesIndex(ratings, 'rating_movie_created_idx')
+
+    def test_recent_favorites_of_movie(self):
+        since = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        favorites = Favorite.objects.filter(movie=self.movie, created_at__gte=since).order_by()
+        self.assertUsesIndex(favorites, 'favorite_movie_created_idx')
+
+
+@unittest.skipUnless(
+    connection.vendor == 'sqlite' and settings.SQLITE_PRAGMAS.get('journal_mode', '').upper() == 'WAL',
+    'Exercises the SQLite production profile',
+)
+class SQLiteConcurrencyTests(SimpleTestCase):
+    """
+    Readers and writers on a file database, each thread with its own
+    connection configured like DATABASES['default'] (the test database
+    itself lives in memory).
+    """
+
+    writers = 4
+    readers = 4
+    writes_per_writer = 50
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'stress.sqlite3')
+        writer = self.connect()
+        self.addCleanup(writer.close)
+        cursor = writer.cursor()
+        cursor.execute('CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)')
+        cursor.execute('INSERT INTO counter (id, value) VALUES (1, 0)')
+        cursor.execute('CREATE TABLE events (id INTEGER PRIMARY KEY, n INTEGER NOT NULL UNIQUE)')
+
+    def connect(self):
+        """A new connection to the stress database, opened the way Django opens the default one"""
+        connection = type(connections['default'])(
+            {**connections['default'].settings_dict, 'NAME': self.path}, alias='stress',
+        )
+        connection.ensure_connection()
+        return connection
+
+    def value(self, cursor):
+        cursor.execute('SELECT value FROM counter WHERE id = 1')
+        return cursor.fetchone()[0]
+
+    def test_profile_is_applied(self):
+        connection = self.connect()
+        self.addCleanup(connection.close)
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA journal_mode')
+        self.assertEqual(cursor.fetchone()[0], 'wal')
+        cursor.execute('PRAGMA busy_timeout')
+        self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_reader_does_not_wait_for_open_write(self):
+        writer, reader = self.connect(), self.connect()
+        self.addCleanup(writer.close)
+        self.addCleanup(reader.close)
+        writing, reading = writer.cursor(), reader.cursor()
+
+        writing.execute(f"BEGIN {writer.transaction_mode or ''}")
+        writing.execute('UPDATE counter SET value = 1 WHERE id = 1')
+        started = time.monotonic()
+        self.assertEqual(self.value(reading), 0)
+        self.assertLess(time.monotonic() - started, 0.5)
+        writing.execute('COMMIT')
+        self.assertEqual(self.value(reading), 1)
+
+    def test_writer_commits_during_open_read(self):
+        # In rollback-journal mode the commit would wait for the reader to
+        # finish and fail with "database is locked" after busy_timeout
+        writer, reader = self.connect(), self.connect()
+        self.addCleanup(writer.close)
+        self.addCleanup(reader.close)
+        writing, reading = writer.cursor(), reader.cursor()
+
+        reading.execute('BEGIN')
+        self.assertEqual(self.value(reading), 0)
+        writing.execute(f"BEGIN {writer.transaction_mode or ''}")
+        writing.execute('UPDATE counter SET value = 1 WHERE id = 1')
+        started = time.monotonic()
+        writing.execute('COMMIT')
+        self.assertLess(time.monotonic() - started, 0.5)
+        # The reader keeps its snapshot until its transaction ends
+        self.assertEqual(self.value(reading), 0)
+        reading.execute('COMMIT')
+        self.assertEqual(self.value(reading), 1)
+
+    def test_concurrent_readers_and_writers(self):
+        errors = []
+        read_latencies = []
+        writers_done = threading.Event()
+        lock = threading.Lock()
+
+        def write():
+            connection = self.connect()
+            try:
+                cursor = connection.cursor()
+                for _ in range(self.writes_per_writer):
+                    # Read then write in one transaction, the pattern that
+                    # deadlocks under deferred transactions
+                    cursor.execute(f"BEGIN {connection.transaction_mode or ''}")
+                    cursor.execute('SELECT COALESCE(MAX(n), 0) FROM events')
+                    cursor.execute('INSERT INTO events (n) VALUES (%s)', [cursor.fetchone()[0] + 1])
+                    cursor.execute('UPDATE counter SET value = value + 1 WHERE id = 1')
+                    cursor.execute('COMMIT')
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        def read():
+            connection = self.connect()
+            latencies = []
+            try:
+                cursor = connection.cursor()
+                while not writers_done.is_set():
+                    started = time.monotonic()
+                    cursor.execute('SELECT COUNT(*), MAX(n) FROM events')
+                    count, highest = cursor.fetchone()
+                    latencies.append(time.monotonic() - started)
+                    # Each read sees one consistent state
+                    self.assertEqual(count, highest or 0)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+                with lock:
+                    read_latencies.append(latencies)
+
+        writer_threads = [threading.Thread(target=write) for _ in range(self.writers)]
+        reader_threads = [threading.Thread(target=read) for _ in range(self.readers)]
+        for thread in reader_threads + writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        writers_done.set()
+        for thread in reader_threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        total = self.writers * self.writes_per_writer
+        connection = self.connect()
+        self.addCleanup(connection.close)
+        cursor = connection.cursor()
+        cursor.execute('SELECT COUNT(*), MAX(n) FROM events')
+        self.assertEqual(cursor.fetchone(), (total, total))
+        self.assertEqual(self.value(cursor), total)
+        # Every reader kept reading while the writes went on, none waited on them
+        self.assertTrue(all(read_latencies), read_latencies)
+        self.assertLess(max(max(latencies) for latencies in read_latencies), 0.5)
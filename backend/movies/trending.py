@@ -0,0 +1,123 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Exp, Greatest, Ln, Now
+from django.utils import timezone as django_timezone
+
+from .models import Favorite, Rating, TrendingScore, Watchlist
+
+# Origin of the time axis; keeps rank keys small
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+# Event kind -> (model, timestamp field)
+EVENT_SOURCES = {
+    'favorite': (Favorite, 'created_at'),
+    'watchlist': (Watchlist, 'added_at'),
+    'rating': (Rating, 'created_at'),
+}
+EVENT_KINDS = {model: kind for kind, (model, _) in EVENT_SOURCES.items()}
+
+# Lower bound inside Ln() when an event is withdrawn, guards against rounding below zero
+_TINY = 1e-12
+
+
+def trending_options():
+    options = {
+        'HALF_LIFE_HOURS': 72,
+        'WEIGHTS': {'favorite': 3.0, 'watchlist': 2.0, 'rating': 1.0},
+        'MIN_SCORE': 0.01,
+    }
+    options.update(getattr(settings, 'TRENDING', {}))
+    return options
+
+
+def time_key(moment=None):
+    """
+    Time in units of the decay constant: a score decays by a factor e for
+    every unit, so score(t) = exp(rank_key - time_key(t)).
+    """
+    moment = moment or django_timezone.now()
+    tau = trending_options()['HALF_LIFE_HOURS'] * 3600 / math.log(2)
+    return (moment - EPOCH).total_seconds() / tau
+
+
+def event_weight(kind):
+    return trending_options()['WEIGHTS'].get(kind, 0.0)
+
+
+def record_event(movie_id, weight, at=None):
+    """
+    Add an event of `weight` that happened at `at` (default now) to the
+    movie's score, or withdraw one with a negative weight.
+
+    One UPDATE folds the event in as
+        rank_key = now + ln(exp(rank_key - now) + weight * exp(at - now))
+    which is exact and race-free; the row is created on the first event.
+    """
+    now = time_key()
+    contribution = weight * math.exp(time_key(at) - now) if at is not None else weight
+    if contribution == 0:
+        return
+    current = Exp(F('rank_key') - now)
+    if contribution > 0:
+        rank_key = Ln(current + contribution) + now
+    else:
+        rank_key = Ln(Greatest(current + contribution, Value(_TINY))) + now
+    updated = TrendingScore.objects.filter(movie_id=movie_id).update(rank_key=rank_key, updated_at=Now())
+    if updated or contribution < 0:
+        return
+    try:
+        with transaction.atomic():
+            TrendingScore.objects.create(
+                movie_id=movie_id, rank_key=math.log(contribution) + now, score=contribution,
+            )
+    except IntegrityError:
+        # Another request created the row first
+        TrendingScore.objects.filter(movie_id=movie_id).update(rank_key=rank_key, updated_at=Now())
+
+
+def decay_scores():
+    """
+    Refresh the stored `score` of every row to its current decayed value
+    and drop movies whose score fell below MIN_SCORE. Returns
+    (updated, pruned).
+    """
+    now = time_key()
+    pruned, _ = TrendingScore.objects.filter(
+        rank_key__lt=now + math.log(trending_options()['MIN_SCORE'])
+    ).delete()
+    updated = TrendingScore.objects.update(score=Exp(F('rank_key') - now))
+    return updated, pruned
+
+
+def rebuild_scores(half_lives=10):
+    """
+    Recompute all scores from the Favorite, Watchlist and Rating history of
+    the last `half_lives` half-lives. Returns the number of movies scored.
+    """
+    options = trending_options()
+    moment = django_timezone.now()
+    now = time_key(moment)
+    since = moment - timedelta(hours=options['HALF_LIFE_HOURS'] * half_lives)
+
+    scores = {}
+    for kind, (model, field) in EVENT_SOURCES.items():
+        weight = event_weight(kind)
+        if not weight:
+            continue
+        events = model.objects.filter(**{f"{field}__gte": since}).order_by().values_list('movie_id', field)
+        for movie_id, at in events.iterator(chunk_size=10000):
+            scores[movie_id] = scores.get(movie_id, 0.0) + weight * math.exp(time_key(at) - now)
+
+    rows = [
+        TrendingScore(movie_id=movie_id, rank_key=math.log(score) + now, score=score)
+        for movie_id, score in scores.items()
+        if score >= options['MIN_SCORE']
+    ]
+    with transaction.atomic():
+        TrendingScore.objects.all().delete()
+        TrendingScore.objects.bulk_create(rows, batch_size=5000)
+    return len(rows)
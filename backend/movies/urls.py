@@ -13,4 +13,5 @@ urlpatterns = [
     path('', include(router.urls)),
     path('register/', views.RegisterView.as_view(), name='register'),
     path('recommendations/', views.get_recommendations, name='recommendations'),
+    path('cache-stats/', views.get_cache_stats, name='cache-stats'),
 ]
@@ -1,17 +1,56 @@
+import datetime
+
 from rest_framework import viewsets, generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes, action
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
-from django.db.models import Count, Q
+from django.db.models import F, prefetch_related_objects
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Movie, Genre, Favorite, Rating, Watchlist
+from .models import Movie, Genre, Favorite, Rating, TrendingScore, Watchlist
 from .serializers import (
     UserSerializer, MovieSerializer, GenreSerializer,
-    FavoriteSerializer, RatingSerializer, WatchlistSerializer
+    FavoriteSerializer, RatingSerializer, WatchlistSerializer, MovieRatingSerializer,
+    COMPACT_MOVIE_FIELDS, field_selection_key, movie_field_selection
+)
+from .recommendation import (
+    get_content_based_recommendations, get_collaborative_filtering_recommendations,
+    get_matrix_factorization_recommendations, get_item_based_recommendations,
+    model_version, movies_in_order
+)
+from .caching import cache_stats, cached_recommendations
+from .precompute import precomputed_movie_ids
+from .item_similarity import queue_neighbor_updates
+from .user_state import STATE_FIELDS, UserMovieStateMixin, user_state_context
+from .search import search_movies
+from .rating_aggregates import rating_histogram
+from .bulk import bulk_collect, bulk_options, bulk_rate, summarize
+from .autocomplete import autocomplete
+from .conditional import not_modified, response_validators, with_validators
+from .catalog_cache import (
+    GENRES_SCOPE, MOVIES_SCOPE, cached_catalog_response, invalidate_catalog, movie_scope
 )
-from .recommendation import get_content_based_recommendations, get_collaborative_filtering_recommendations
+
+
+def bulk_lists(request, *keys):
+    """
+    The lists under `keys` in the request body (missing ones are empty), or
+    an error response when one is not a list or they hold too many items.
+    """
+    data = request.data if hasattr(request.data, 'get') else {}
+    lists = [data.get(key, []) for key in keys]
+    for key, items in zip(keys, lists):
+        if not isinstance(items, list):
+            return None, Response({'error': f"{key} must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+    limit = bulk_options()['MAX_ITEMS']
+    if sum(len(items) for items in lists) > limit:
+        return None, Response({'error': f"At most {limit} items per request"}, status=status.HTTP_400_BAD_REQUEST)
+    return lists, None
+
+
+def bulk_response(results):
+    return Response({'results': results, 'counts': summarize(results)})
 
 
 class RegisterView(generics.CreateAPIView):
@@ -37,11 +76,29 @@ class GenreViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    # A short fixed list the frontend loads whole
+    pagination_class = None
+    
+    def list(self, request, *args, **kwargs):
+        return cached_catalog_response(request, (GENRES_SCOPE,), lambda: self._list(request))
+    
+    def _list(self, request):
+        genres = list(self.filter_queryset(self.get_queryset()))
+        # Genres carry no timestamps, but the whole table is a handful of rows
+        etag, _ = response_validators(request, (), [(genre.id, genre.name) for genre in genres])
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        serializer = self.get_serializer(genres, many=True)
+        return with_validators(Response(serializer.data), etag)
 
 
-class MovieViewSet(viewsets.ModelViewSet):
+class MovieViewSet(UserMovieStateMixin, viewsets.ModelViewSet):
     serializer_class = MovieSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    # Sizes of the sections of the `full` detail response
+    full_ratings_count = 20
+    full_similar_count = 10
     
     def get_queryset(self):
         queryset = Movie.objects.all().prefetch_related('genres')
@@ -55,42 +112,231 @@ class MovieViewSet(viewsets.ModelViewSet):
             except Genre.DoesNotExist:
                 pass
         
-        # Filter by year
+        # Filter by year, as a date range the release_date index can serve
         year = self.request.query_params.get('year')
         if year:
-            queryset = queryset.filter(release_date__year=year)
+            try:
+                year = int(year)
+                queryset = queryset.filter(
+                    release_date__gte=datetime.date(year, 1, 1), release_date__lt=datetime.date(year + 1, 1, 1)
+                )
+            except (ValueError, OverflowError):
+                pass
         
-        # Filter by search term
+        # Filter by search term, keeping the best SEARCH_MAX_RESULTS matches
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | Q(overview__icontains=search)
-            )
-        
-        # Sort by trending (most favorited recently)
-        trending = self.request.query_params.get('trending')
-        if trending and trending.lower() == 'true':
-            queryset = queryset.annotate(fav_count=Count('favorited_by')).order_by('-fav_count', '-popularity')
-        else:
-            queryset = queryset.order_by('-popularity')
+            queryset = search_movies(queryset, search)
         
-        return queryset
+        return queryset.order_by(*self.get_pagination_ordering())
+    
+    def _is_trending(self):
+        if not hasattr(self, '_trending'):
+            trending = self.request.query_params.get('trending')
+            # Plain popularity until there has been any activity to rank
+            self._trending = (
+                bool(trending) and trending.lower() == 'true' and TrendingScore.objects.exists()
+            )
+        return self._trending
+    
+    def get_pagination_ordering(self):
+        # Every ordering ends in id so KeysetPagination has a unique cursor
+        if self.action == 'get_movie_ratings':
+            # Pages of the movie's ratings rather than of movies
+            return ('-created_at', 'id')
+        if self.request.query_params.get('search'):
+            # Relevance, as ranked by the full-text index
+            return ('search_rank', 'id')
+        if self.request.query_params.get('ordering') == 'average_rating':
+            # Stored, indexed column kept current by movies.signals
+            return ('-rating_average', '-popularity', 'id')
+        return ('-popularity', 'id')
+    
+    def get_pagination_sections(self, queryset):
+        # Sort by trending (most favorited/rated/watchlisted recently), on
+        # the decayed scores maintained by movies.trending: the scored
+        # movies walking TrendingScore's (-rank_key, movie) index, then the
+        # ones without recent activity by popularity on the movie index, so
+        # no page joins or sorts the whole catalog
+        if self.action != 'list' or self.request.query_params.get('search') or not self._is_trending():
+            return None
+        scored = queryset.filter(trending__isnull=False).annotate(
+            trending_rank=F('trending__rank_key'), trending_movie=F('trending__movie_id'),
+        )
+        return [
+            (scored, ('-trending_rank', 'trending_movie')),
+            (queryset.filter(trending__isnull=True), ('-popularity', 'id')),
+        ]
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
         return context
+    
+    def get_serializer(self, *args, **kwargs):
+        # ?fields=, ?omit= and ?compact= shape what reads render
+        if 'data' not in kwargs:
+            kwargs.update(movie_field_selection(self.request.query_params))
+        return super().get_serializer(*args, **kwargs)
+    
+    # Writes through the API invalidate the anonymous responses they affect
+    def perform_create(self, serializer):
+        serializer.save()
+        invalidate_catalog(MOVIES_SCOPE)
+    
+    def perform_update(self, serializer):
+        movie = serializer.save()
+        invalidate_catalog(MOVIES_SCOPE, movie_scope(movie.id))
+    
+    def perform_destroy(self, instance):
+        movie_id = instance.id
+        instance.delete()
+        invalidate_catalog(MOVIES_SCOPE, movie_scope(movie_id))
+    
+    # Anonymous reads are identical for every client and served from the
+    # catalog cache; see movies.catalog_cache
+    def list(self, request, *args, **kwargs):
+        return cached_catalog_response(request, (MOVIES_SCOPE,), lambda: self._list(request))
+    
+    def retrieve(self, request, *args, **kwargs):
+        return cached_catalog_response(
+            request, (movie_scope(kwargs.get('pk')),), lambda: self._retrieve(request)
+        )
+    
+    # Conditional GET: validators come from the page's ids and updated_at
+    # values, the selected fields and the user's state version, so a 304
+    # costs only the page query and skips genre prefetching, user-state
+    # loading and serialization
+    def _list(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        page = self.paginate_queryset(queryset)
+        movies = page if page is not None else list(queryset)
+        links = (self.paginator.get_next_link(), self.paginator.get_previous_link()) if page is not None else ()
+        etag, _ = response_validators(
+            request, [movie.updated_at for movie in movies], [movie.id for movie in movies], links,
+            field_selection_key(request.query_params),
+        )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        
+        serializer = self.get_serializer(movies, many=True)
+        if 'genres' in serializer.child.fields:
+            prefetch_related_objects(movies, 'genres')
+        if page is not None:
+            response = self.get_paginated_response(serializer.data)
+        else:
+            response = Response(serializer.data)
+        return with_validators(response, etag)
+    
+    def _retrieve(self, request):
+        movie = self.get_object()
+        etag, last_modified = response_validators(
+            request, [movie.updated_at], movie.id, field_selection_key(request.query_params),
+        )
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        serializer = self.get_serializer(movie)
+        return with_validators(Response(serializer.data), etag, last_modified)
+        
+    @action(detail=True, methods=['get'], url_path='full')
+    def get_full(self, request, pk=None):
+        """The movie with its latest ratings and similar movies, for the detail page"""
+        return cached_catalog_response(request, (movie_scope(pk),), lambda: self._full(request, pk))
+    
+    # One response instead of separate detail, ratings and similar-movie
+    # requests. The movie and the similar movies share a single genre
+    # prefetch and a single user-state load, and like the other reads a
+    # matching ETag answers 304 before any of that happens.
+    def _full(self, request, pk):
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        movie = get_object_or_404(queryset, pk=pk)
+        self.check_object_permissions(request, movie)
         
+        count = self.full_similar_count
+        similar_ids = cached_recommendations(
+            None, 'content-based', movie.id, count, model_version(),
+            lambda: [similar.id for similar in compute_recommendations(None, 'content-based', movie.id, count)],
+        )
+        similar = movies_in_order(similar_ids)
+        ratings = list(
+            Rating.objects.filter(movie=movie).select_related('user')
+            .order_by('-created_at', 'id')[:self.full_ratings_count]
+        )
+        etag, _ = response_validators(
+            request,
+            [movie.updated_at, *(other.updated_at for other in similar), *(rating.updated_at for rating in ratings)],
+            movie.id, movie.rating_count, similar_ids, [rating.id for rating in ratings],
+            field_selection_key(request.query_params),
+        )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        
+        movies = [movie, *similar]
+        prefetch_related_objects(movies, 'genres')
+        context = {**self.get_serializer_context(), **user_state_context(request, movies)}
+        data = {
+            'movie': MovieSerializer(movie, context=context, **movie_field_selection(request.query_params)).data,
+            'ratings': {
+                'count': movie.rating_count,
+                'average': movie.rating_average,
+                'histogram': rating_histogram(movie.id),
+                'results': MovieRatingSerializer(ratings, many=True).data,
+            },
+            'similar': MovieSerializer(
+                similar, many=True, context=context, compact=True,
+                fields=(*COMPACT_MOVIE_FIELDS, 'is_favorite', 'is_in_watchlist'),
+            ).data,
+        }
+        return with_validators(Response(data), etag)
+    
+    @action(detail=False, methods=['get'], url_path='autocomplete',
+            authentication_classes=[], permission_classes=[permissions.AllowAny])
+    def get_autocomplete(self, request):
+        """Title suggestions served from the in-memory title index, without database queries"""
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 10
+        return Response(autocomplete(request.query_params.get('q', ''), limit))
+    
     @action(detail=True, methods=['get'], url_path='ratings')
     def get_movie_ratings(self, request, pk=None):
-        """Get all ratings for a specific movie"""
-        movie = self.get_object()
-        ratings = Rating.objects.filter(movie=movie).select_related('user')
-        serializer = RatingSerializer(ratings, many=True)
-        return Response(serializer.data)
+        """A page of a movie's ratings, newest first, with its rating count, average and histogram"""
+        return cached_catalog_response(request, (movie_scope(pk),), lambda: self._movie_ratings(request, pk))
+    
+    # Rows carry just the rating, not the movie again, and the summary comes
+    # from the movie's stored aggregates and histogram bins, so a page costs
+    # the same few queries however many ratings the movie has. The validators
+    # need only the page and the movie: every rating change bumps the
+    # movie's updated_at through its aggregates.
+    def _movie_ratings(self, request, pk):
+        movie = get_object_or_404(Movie.objects.all(), pk=pk)
+        self.check_object_permissions(request, movie)
+        page = self.paginate_queryset(Rating.objects.filter(movie=movie).select_related('user'))
+        links = (self.paginator.get_next_link(), self.paginator.get_previous_link())
+        etag, _ = response_validators(
+            request, [movie.updated_at, *(rating.updated_at for rating in page)],
+            movie.id, [rating.id for rating in page], links,
+        )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        
+        response = self.get_paginated_response(MovieRatingSerializer(page, many=True).data)
+        response.data.update(
+            count=movie.rating_count,
+            average=movie.rating_average,
+            histogram=rating_histogram(movie.id),
+        )
+        return with_validators(response, etag)
 
 
-class FavoriteViewSet(viewsets.ModelViewSet):
+class FavoriteViewSet(UserMovieStateMixin, viewsets.ModelViewSet):
     serializer_class = FavoriteSerializer
+    movie_field = 'movie'
+    pagination_ordering = ('-created_at', 'id')
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
@@ -117,14 +363,24 @@ class FavoriteViewSet(viewsets.ModelViewSet):
             FavoriteSerializer(favorite, context={'request': request}).data,
             status=status.HTTP_201_CREATED
         )
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_write(self, request):
+        """Add and remove many favorites at once: {"add": [movie ids], "remove": [movie ids]}"""
+        lists, error = bulk_lists(request, 'add', 'remove')
+        if error is not None:
+            return error
+        return bulk_response(bulk_collect(request.user, Favorite, *lists))
 
 
-class RatingViewSet(viewsets.ModelViewSet):
+class RatingViewSet(UserMovieStateMixin, viewsets.ModelViewSet):
     serializer_class = RatingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    movie_field = 'movie'
+    pagination_ordering = ('-created_at', 'id')
     
     def get_queryset(self):
-        return Rating.objects.filter(user=self.request.user).select_related('movie')
+        return Rating.objects.filter(user=self.request.user).select_related('movie', 'user').prefetch_related('movie__genres')
     
     def create(self, request, *args, **kwargs):
         # Override to handle updating an existing rating
@@ -137,15 +393,40 @@ class RatingViewSet(viewsets.ModelViewSet):
             rating = Rating.objects.get(user=request.user, movie_id=movie_id)
             serializer = self.get_serializer(rating, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            self.perform_update(serializer)
             return Response(serializer.data)
         except Rating.DoesNotExist:
             # Create new rating
             return super().create(request, *args, **kwargs)
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_write(self, request):
+        """Create or update many ratings at once: {"ratings": [{"movie_id", "rating", "comment"}, ...]}"""
+        lists, error = bulk_lists(request, 'ratings')
+        if error is not None:
+            return error
+        return bulk_response(bulk_rate(request.user, *lists))
+
+    # Queue the rated movie's item-item neighbourhood for an update, which
+    # `build_item_neighbors --pending` applies outside the request
+    def perform_create(self, serializer):
+        rating = serializer.save()
+        queue_neighbor_updates([rating.movie_id])
+
+    def perform_update(self, serializer):
+        rating = serializer.save()
+        queue_neighbor_updates([rating.movie_id])
+
+    def perform_destroy(self, instance):
+        movie_id = instance.movie_id
+        instance.delete()
+        queue_neighbor_updates([movie_id])
 
 
-class WatchlistViewSet(viewsets.ModelViewSet):
+class WatchlistViewSet(UserMovieStateMixin, viewsets.ModelViewSet):
     serializer_class = WatchlistSerializer
+    movie_field = 'movie'
+    pagination_ordering = ('-added_at', 'id')
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
@@ -172,6 +453,34 @@ class WatchlistViewSet(viewsets.ModelViewSet):
             WatchlistSerializer(watchlist_item, context={'request': request}).data,
             status=status.HTTP_201_CREATED
         )
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_write(self, request):
+        """Add and remove many watchlist entries at once: {"add": [movie ids], "remove": [movie ids]}"""
+        lists, error = bulk_lists(request, 'add', 'remove')
+        if error is not None:
+            return error
+        return bulk_response(bulk_collect(request.user, Watchlist, *lists))
+
+
+def compute_recommendations(user_id, recommendation_type, movie_id=None, top_n=10):
+    if movie_id and recommendation_type == 'item':
+        # Get movies rated alike by the same users
+        return get_item_based_recommendations(movie_id=movie_id, top_n=top_n)
+    elif movie_id:
+        # Get similar movies
+        return get_content_based_recommendations(movie_id=movie_id, top_n=top_n)
+    elif recommendation_type == 'item':
+        # Get item-based collaborative filtering recommendations
+        return get_item_based_recommendations(user_id=user_id, top_n=top_n)
+    elif recommendation_type == 'collaborative':
+        # Get collaborative filtering recommendations
+        return get_collaborative_filtering_recommendations(user_id=user_id, top_n=top_n)
+    elif recommendation_type == 'mf':
+        # Get matrix factorization recommendations
+        return get_matrix_factorization_recommendations(user_id=user_id, top_n=top_n)
+    # Get content-based recommendations
+    return get_content_based_recommendations(user_id=user_id, top_n=top_n)
 
 
 @api_view(['GET'])
@@ -179,22 +488,39 @@ class WatchlistViewSet(viewsets.ModelViewSet):
 def get_recommendations(request):
     user_id = request.user.id
     movie_id = request.query_params.get('movie_id')
+    movie_id = int(movie_id) if movie_id else None
     recommendation_type = request.query_params.get('type', 'collaborative')
-    
-    if movie_id:
-        # Get similar movies
-        movies = get_content_based_recommendations(movie_id=int(movie_id))
-    elif recommendation_type == 'collaborative':
-        # Get collaborative filtering recommendations
-        movies = get_collaborative_filtering_recommendations(user_id=user_id)
-    else:
-        # Get content-based recommendations
-        movies = get_content_based_recommendations(user_id=user_id)
-    
+    top_n = 10
+
+    def load_movie_ids():
+        # Prefer the nightly precomputed list when a fresh one is long enough;
+        # shorter ones need the live path's content-based fill
+        movie_ids = None if movie_id else precomputed_movie_ids(user_id, recommendation_type)
+        if movie_ids and len(movie_ids) >= top_n:
+            return movie_ids[:top_n]
+        return [movie.id for movie in compute_recommendations(user_id, recommendation_type, movie_id, top_n)]
+
+    # Repeat requests are served from the per-user cache until the user's
+    # ratings, favorites or watchlist change or the models are rebuilt
+    movie_ids = cached_recommendations(
+        user_id, recommendation_type, movie_id, top_n, model_version(), load_movie_ids,
+    )
+    movies = movies_in_order(movie_ids)
     serializer = MovieSerializer(
         movies, 
         many=True, 
-        context={'request': request}
+        context={'request': request},
+        **movie_field_selection(request.query_params)
     )
+    if 'genres' in serializer.child.fields:
+        prefetch_related_objects(movies, 'genres')
+    if any(name in serializer.child.fields for name in STATE_FIELDS):
+        serializer.context.update(user_state_context(request, movies))
     
     return Response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def get_cache_stats(request):
+    return Response(cache_stats())
@@ -0,0 +1,19 @@
+const LoadMoreButton = ({ hasMore, loading, onClick }) => {
+  if (!hasMore) {
+    return null;
+  }
+
+  return (
+    <div className="flex justify-center mt-8">
+      <button 
+        onClick={onClick}
+        disabled={loading}
+        className="btn-secondary disabled:opacity-50"
+      >
+        {loading ? 'Loading...' : 'Load more'}
+      </button>
+    </div>
+  );
+};
+
+export default LoadMoreButton;
@@ -1,6 +1,7 @@
 import MovieCard from './MovieCard';
+import LoadMoreButton from './LoadMoreButton';
 
-const MovieList = ({ movies, title, loading }) => {
+const MovieList = ({ movies, title, loading, hasMore = false, loadingMore = false, onLoadMore }) => {
   if (loading) {
     return (
       <div className="w-full">
@@ -37,6 +38,7 @@ const MovieList = ({ movies, title, loading }) => {
           <MovieCard key={movie.id} movie={movie} />
         ))}
       </div>
+      <LoadMoreButton hasMore={hasMore} loading={loadingMore} onClick={onLoadMore} />
     </div>
   );
 };
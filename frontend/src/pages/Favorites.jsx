@@ -1,13 +1,14 @@
 import { useEffect } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
 import { useNavigate } from 'react-router-dom';
-import { fetchFavorites } from '../store/slices/favoriteSlice';
+import { fetchFavorites, fetchMoreFavorites } from '../store/slices/favoriteSlice';
 import MovieCard from '../components/MovieCard';
+import LoadMoreButton from '../components/LoadMoreButton';
 
 const Favorites = () => {
   const dispatch = useDispatch();
   const navigate = useNavigate();
-  const { favorites, loading } = useSelector(state => state.favorites);
+  const { favorites, next, loading, loadingMore } = useSelector(state => state.favorites);
   const { isAuthenticated } = useSelector(state => state.auth);
 
   useEffect(() => {
@@ -40,11 +41,18 @@ const Favorites = () => {
           ))}
         </div>
       ) : favorites.length > 0 ? (
-        <div className="grid grid-cols-2 md:grid-cols-3 lg:grid-cols-4 xl:grid-cols-5 gap-6">
-          {favorites.map(favorite => (
-            <MovieCard key={favorite.id} movie={favorite.movie} />
-          ))}
-        </div>
+        <>
+          <div className="grid grid-cols-2 md:grid-cols-3 lg:grid-cols-4 xl:grid-cols-5 gap-6">
+            {favorites.map(favorite => (
+              <MovieCard key={favorite.id} movie={favorite.movie} />
+            ))}
+          </div>
+          <LoadMoreButton 
+            hasMore={Boolean(next)} 
+            loading={loadingMore} 
+            onClick={() => dispatch(fetchMoreFavorites())} 
+          />
+        </>
       ) : (
         <div className="text-center py-12">
           <p className="text-gray-400 mb-6">You haven't added any movies to your favorites yet.</p>
@@ -1,12 +1,12 @@
 import { useEffect } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
-import { fetchTrending, fetchMovies } from '../store/slices/movieSlice';
+import { fetchTrending, fetchMovies, fetchMoreMovies } from '../store/slices/movieSlice';
 import { fetchFavorites } from '../store/slices/favoriteSlice';
 import MovieList from '../components/MovieList';
 
 const Home = () => {
   const dispatch = useDispatch();
-  const { trending, movies, loading } = useSelector(state => state.movies);
+  const { trending, movies, next, loading, loadingMore } = useSelector(state => state.movies);
   const { isAuthenticated } = useSelector(state => state.auth);
 
   useEffect(() => {
@@ -26,7 +26,14 @@ const Home = () => {
       </section>
       
       <section className="mb-12">
-        <MovieList movies={movies} title="Popular Movies" loading={loading} />
+        <MovieList 
+          movies={movies} 
+          title="Popular Movies" 
+          loading={loading} 
+          hasMore={Boolean(next)} 
+          loadingMore={loadingMore} 
+          onLoadMore={() => dispatch(fetchMoreMovies())} 
+        />
       </section>
     </div>
   );
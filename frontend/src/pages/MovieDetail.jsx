@@ -1,7 +1,7 @@
 import { useEffect, useState } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { useDispatch, useSelector } from 'react-redux'; 
-import { fetchMovie, fetchSimilarMovies, clearCurrentMovie } from '../store/slices/movieSlice';
+import { fetchMovieFull, clearCurrentMovie } from '../store/slices/movieSlice';
 import { toggleFavorite, fetchFavorites } from '../store/slices/favoriteSlice';
 import { toggleWatchlist, fetchWatchlist } from '../store/slices/watchlistSlice';
 import { ratingService } from '../services/api';
@@ -42,31 +42,22 @@ const MovieDetail = () => {
     setComment('');
     setComments([]);
 
-    // Fetch movie and similar movies
-    dispatch(fetchMovie(id));
-    dispatch(fetchSimilarMovies(id));
-
     // Fetch favorites and watchlist if authenticated
     if (isAuthenticated) {
       dispatch(fetchFavorites());
       dispatch(fetchWatchlist());
     }
 
-    // Fetch comments for this movie
-    const fetchComments = async () => {
-      try {
-        setCommentsLoading(true);
-        const response = await ratingService.getMovieRatings(id);
-        setComments(response.data);
-      } catch (error) {
-        console.error('Error fetching comments:', error);
+    // Fetch the movie, similar movies and latest comments in one request
+    setCommentsLoading(true);
+    dispatch(fetchMovieFull(id))
+      .unwrap()
+      .then(data => setComments(data.ratings.results))
+      .catch(error => {
+        console.error('Error fetching movie:', error);
         toast.error('Failed to load comments');
-      } finally {
-        setCommentsLoading(false);
-      }
-    };
-
-    fetchComments();
+      })
+      .finally(() => setCommentsLoading(false));
 
     return () => {
       dispatch(clearCurrentMovie());
@@ -122,7 +113,7 @@ const MovieDetail = () => {
 
       // Refresh comments list
       const response = await ratingService.getMovieRatings(id);
-      setComments(response.data);
+      setComments(response.data.results);
       setComment(''); // Clear comment field after submission
     } catch (error) {
       console.error('Error submitting rating:', error);
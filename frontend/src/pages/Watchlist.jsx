@@ -1,13 +1,14 @@
 import { useEffect } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
 import { useNavigate } from 'react-router-dom';
-import { fetchWatchlist } from '../store/slices/watchlistSlice';
+import { fetchWatchlist, fetchMoreWatchlist } from '../store/slices/watchlistSlice';
 import MovieCard from '../components/MovieCard';
+import LoadMoreButton from '../components/LoadMoreButton';
 
 const Watchlist = () => {
   const dispatch = useDispatch();
   const navigate = useNavigate();
-  const { watchlist, loading } = useSelector(state => state.watchlist);
+  const { watchlist, next, loading, loadingMore } = useSelector(state => state.watchlist);
   const { isAuthenticated } = useSelector(state => state.auth);
 
   useEffect(() => {
@@ -40,11 +41,18 @@ const Watchlist = () => {
           ))}
         </div>
       ) : watchlist.length > 0 ? (
-        <div className="grid grid-cols-2 md:grid-cols-3 lg:grid-cols-4 xl:grid-cols-5 gap-6">
-          {watchlist.map(watchlistItem => (
-            <MovieCard key={watchlistItem.id} movie={watchlistItem.movie} />
-          ))}
-        </div>
+        <>
+          <div className="grid grid-cols-2 md:grid-cols-3 lg:grid-cols-4 xl:grid-cols-5 gap-6">
+            {watchlist.map(watchlistItem => (
+              <MovieCard key={watchlistItem.id} movie={watchlistItem.movie} />
+            ))}
+          </div>
+          <LoadMoreButton 
+            hasMore={Boolean(next)} 
+            loading={loadingMore} 
+            onClick={() => dispatch(fetchMoreWatchlist())} 
+          />
+        </>
       ) : (
         <div className="text-center py-12">
           <p className="text-gray-400 mb-6">You haven't added any movies to your watchlist yet.</p>
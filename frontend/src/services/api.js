@@ -92,22 +92,36 @@ const authService = {
   }
 };
 
+// Movie grids only render what MovieCard shows, so lists ask for just that
+const CARD_PARAMS = {
+  compact: true,
+  fields: 'id,title,poster_path,release_date,vote_average,is_favorite,is_in_watchlist',
+};
+
 // Movie services
 const movieService = {
   getMovies: (params = {}) => 
-    api.get('/movies/', { params }),
+    api.get('/movies/', { params: { ...CARD_PARAMS, ...params } }),
   
   getMovie: (id) => 
     api.get(`/movies/${id}/`),
   
+  // Lists are cursor paginated: follow the `next` URL of the previous page
+  getNextPage: (url) => 
+    api.get(url),
+  
+  // Movie, latest ratings and similar movies in one request
+  getMovieFull: (id) => 
+    api.get(`/movies/${id}/full/`),
+  
   getTrending: () => 
-    api.get('/movies/', { params: { trending: true } }),
+    api.get('/movies/', { params: { ...CARD_PARAMS, trending: true } }),
   
   searchMovies: (query) => 
-    api.get('/movies/', { params: { search: query } }),
+    api.get('/movies/', { params: { ...CARD_PARAMS, search: query } }),
     
   filterByGenre: (genre) => 
-    api.get('/movies/', { params: { genre } })
+    api.get('/movies/', { params: { ...CARD_PARAMS, genre } })
 };
 
 // Favorites services
@@ -115,6 +129,9 @@ const favoriteService = {
   getFavorites: () => 
     api.get('/favorites/'),
   
+  getNextPage: (url) => 
+    api.get(url),
+  
   toggleFavorite: (movieId) => 
     api.post('/favorites/toggle/', { movie_id: movieId }),
     
@@ -130,6 +147,9 @@ const watchlistService = {
   getWatchlist: () => 
     api.get('/watchlist/'),
   
+  getNextPage: (url) => 
+    api.get(url),
+  
   toggleWatchlist: (movieId) => 
     api.post('/watchlist/toggle/', { movie_id: movieId }),
     
@@ -159,10 +179,10 @@ const ratingService = {
 // Recommendation services
 const recommendationService = {
   getRecommendations: (type = 'collaborative') => 
-    api.get('/recommendations/', { params: { type } }),
+    api.get('/recommendations/', { params: { ...CARD_PARAMS, type } }),
     
   getSimilarMovies: (movieId) => 
-    api.get('/recommendations/', { params: { movie_id: movieId } })
+    api.get('/recommendations/', { params: { ...CARD_PARAMS, movie_id: movieId } })
 };
 
 export {
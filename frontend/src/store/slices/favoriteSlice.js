@@ -14,6 +14,24 @@ export const fetchFavorites = createAsyncThunk(
   }
 );
 
+export const fetchMoreFavorites = createAsyncThunk(
+  'favorites/fetchMoreFavorites',
+  async (_, { getState, rejectWithValue }) => {
+    try {
+      const response = await favoriteService.getNextPage(getState().favorites.next);
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to fetch favorites');
+    }
+  },
+  {
+    condition: (_, { getState }) => {
+      const { next, loadingMore } = getState().favorites;
+      return Boolean(next) && !loadingMore;
+    }
+  }
+);
+
 export const toggleFavorite = createAsyncThunk(
   'favorites/toggleFavorite',
   async (movieId, { rejectWithValue }) => {
@@ -41,7 +59,10 @@ export const removeFavorite = createAsyncThunk(
 // Initial state
 const initialState = {
   favorites: [],
+  // URL of the next page of favorites, null once all are loaded
+  next: null,
   loading: false,
+  loadingMore: false,
   error: null
 };
 
@@ -63,12 +84,29 @@ const favoriteSlice = createSlice({
       })
       .addCase(fetchFavorites.fulfilled, (state, action) => {
         state.loading = false;
-        state.favorites = action.payload;
+        state.favorites = action.payload.results || action.payload;
+        state.next = action.payload.next || null;
       })
       .addCase(fetchFavorites.rejected, (state, action) => {
         state.loading = false;
         state.error = action.payload;
       })
+      // Fetch the next page of favorites
+      .addCase(fetchMoreFavorites.pending, (state) => {
+        state.loadingMore = true;
+        state.error = null;
+      })
+      .addCase(fetchMoreFavorites.fulfilled, (state, action) => {
+        state.loadingMore = false;
+        // Skip entries already added by a toggle since the first page loaded
+        const loaded = new Set(state.favorites.map(fav => fav.id));
+        state.favorites.push(...action.payload.results.filter(fav => !loaded.has(fav.id)));
+        state.next = action.payload.next;
+      })
+      .addCase(fetchMoreFavorites.rejected, (state, action) => {
+        state.loadingMore = false;
+        state.error = action.payload;
+      })
       // Toggle favorite
       .addCase(toggleFavorite.pending, (state) => {
         state.loading = true;
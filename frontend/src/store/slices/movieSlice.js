@@ -14,6 +14,25 @@ export const fetchMovies = createAsyncThunk(
   }
 );
 
+export const fetchMoreMovies = createAsyncThunk(
+  'movies/fetchMoreMovies',
+  async (_, { getState, rejectWithValue }) => {
+    const url = getState().movies.next;
+    try {
+      const response = await movieService.getNextPage(url);
+      return { ...response.data, url };
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to fetch movies');
+    }
+  },
+  {
+    condition: (_, { getState }) => {
+      const { next, loadingMore } = getState().movies;
+      return Boolean(next) && !loadingMore;
+    }
+  }
+);
+
 export const fetchMovie = createAsyncThunk(
   'movies/fetchMovie',
   async (id, { rejectWithValue }) => {
@@ -26,6 +45,18 @@ export const fetchMovie = createAsyncThunk(
   }
 );
 
+export const fetchMovieFull = createAsyncThunk(
+  'movies/fetchMovieFull',
+  async (id, { rejectWithValue }) => {
+    try {
+      const response = await movieService.getMovieFull(id);
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to fetch movie details');
+    }
+  }
+);
+
 export const fetchTrending = createAsyncThunk(
   'movies/fetchTrending',
   async (_, { rejectWithValue }) => {
@@ -94,9 +125,10 @@ const initialState = {
   recommendations: [],
   similarMovies: [],
   loading: false,
+  loadingMore: false,
   error: null,
-  totalPages: 1,
-  currentPage: 1
+  // URL of the next page of `movies`, null once the list is complete
+  next: null
 };
 
 // Movie slice
@@ -107,9 +139,6 @@ const movieSlice = createSlice({
     clearCurrentMovie: (state) => {
       state.currentMovie = null;
     },
-    setCurrentPage: (state, action) => {
-      state.currentPage = action.payload;
-    },
     clearError: (state) => {
       state.error = null;
     }
@@ -124,14 +153,30 @@ const movieSlice = createSlice({
       .addCase(fetchMovies.fulfilled, (state, action) => {
         state.loading = false;
         state.movies = action.payload.results || action.payload;
-        if (action.payload.count) {
-          state.totalPages = Math.ceil(action.payload.count / 20); // Assuming 20 items per page
-        }
+        state.next = action.payload.next || null;
       })
       .addCase(fetchMovies.rejected, (state, action) => {
         state.loading = false;
         state.error = action.payload;
       })
+      // Fetch the next page of whichever list `movies` holds
+      .addCase(fetchMoreMovies.pending, (state) => {
+        state.loadingMore = true;
+        state.error = null;
+      })
+      .addCase(fetchMoreMovies.fulfilled, (state, action) => {
+        state.loadingMore = false;
+        if (action.payload.url !== state.next) {
+          // A new search or filter replaced the list in the meantime
+          return;
+        }
+        state.movies.push(...action.payload.results);
+        state.next = action.payload.next;
+      })
+      .addCase(fetchMoreMovies.rejected, (state, action) => {
+        state.loadingMore = false;
+        state.error = action.payload;
+      })
       // Fetch movie
       .addCase(fetchMovie.pending, (state) => {
         state.loading = true;
@@ -145,6 +190,20 @@ const movieSlice = createSlice({
         state.loading = false;
         state.error = action.payload;
       })
+      // Fetch movie with its similar movies
+      .addCase(fetchMovieFull.pending, (state) => {
+        state.loading = true;
+        state.error = null;
+      })
+      .addCase(fetchMovieFull.fulfilled, (state, action) => {
+        state.loading = false;
+        state.currentMovie = action.payload.movie;
+        state.similarMovies = action.payload.similar;
+      })
+      .addCase(fetchMovieFull.rejected, (state, action) => {
+        state.loading = false;
+        state.error = action.payload;
+      })
       // Fetch trending
       .addCase(fetchTrending.pending, (state) => {
         state.loading = true;
@@ -166,6 +225,7 @@ const movieSlice = createSlice({
       .addCase(searchMovies.fulfilled, (state, action) => {
         state.loading = false;
         state.movies = action.payload.results || action.payload;
+        state.next = action.payload.next || null;
       })
       .addCase(searchMovies.rejected, (state, action) => {
         state.loading = false;
@@ -179,6 +239,7 @@ const movieSlice = createSlice({
       .addCase(filterMoviesByGenre.fulfilled, (state, action) => {
         state.loading = false;
         state.movies = action.payload.results || action.payload;
+        state.next = action.payload.next || null;
       })
       .addCase(filterMoviesByGenre.rejected, (state, action) => {
         state.loading = false;
@@ -213,5 +274,5 @@ const movieSlice = createSlice({
   }
 });
 
-export const { clearCurrentMovie, setCurrentPage, clearError } = movieSlice.actions;
+export const { clearCurrentMovie, clearError } = movieSlice.actions;
 export default movieSlice.reducer;
@@ -14,6 +14,24 @@ export const fetchWatchlist = createAsyncThunk(
   }
 );
 
+export const fetchMoreWatchlist = createAsyncThunk(
+  'watchlist/fetchMoreWatchlist',
+  async (_, { getState, rejectWithValue }) => {
+    try {
+      const response = await watchlistService.getNextPage(getState().watchlist.next);
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to fetch watchlist');
+    }
+  },
+  {
+    condition: (_, { getState }) => {
+      const { next, loadingMore } = getState().watchlist;
+      return Boolean(next) && !loadingMore;
+    }
+  }
+);
+
 export const toggleWatchlist = createAsyncThunk(
   'watchlist/toggleWatchlist',
   async (movieId, { rejectWithValue }) => {
@@ -41,7 +59,10 @@ export const removeFromWatchlist = createAsyncThunk(
 // Initial state
 const initialState = {
   watchlist: [],
+  // URL of the next page of the watchlist, null once all of it is loaded
+  next: null,
   loading: false,
+  loadingMore: false,
   error: null
 };
 
@@ -63,12 +84,29 @@ const watchlistSlice = createSlice({
       })
       .addCase(fetchWatchlist.fulfilled, (state, action) => {
         state.loading = false;
-        state.watchlist = action.payload;
+        state.watchlist = action.payload.results || action.payload;
+        state.next = action.payload.next || null;
       })
       .addCase(fetchWatchlist.rejected, (state, action) => {
         state.loading = false;
         state.error = action.payload;
       })
+      // Fetch the next page of the watchlist
+      .addCase(fetchMoreWatchlist.pending, (state) => {
+        state.loadingMore = true;
+        state.error = null;
+      })
+      .addCase(fetchMoreWatchlist.fulfilled, (state, action) => {
+        state.loadingMore = false;
+        // Skip entries already added by a toggle since the first page loaded
+        const loaded = new Set(state.watchlist.map(item => item.id));
+        state.watchlist.push(...action.payload.results.filter(item => !loaded.has(item.id)));
+        state.next = action.payload.next;
+      })
+      .addCase(fetchMoreWatchlist.rejected, (state, action) => {
+        state.loadingMore = false;
+        state.error = action.payload;
+      })
       // Toggle watchlist
       .addCase(toggleWatchlist.pending, (state) => {
         state.loading = true;